@@ -0,0 +1,235 @@
+"""
+ ----------------------------------------------------------------------------------------------------------------------
+ memoryMonitor - hot path benchmarks
+ ----------------------------------------------------------------------------------------------------------------------
+
+ ----------------------------------------------------------------------------------------------------------------------
+ USAGE:
+ Measures the per-tick cost of the monitor hot path outside of Nuke: a stand-in nuke module from the stubs folder
+ provides the memory counters, and Qt runs on its offscreen platform. Every benchmark is run at several sample counts
+ and reports its latency per tick, the memory it allocates and the peak RSS of the process.
+ ----------------------------------------------------------------------------------------------------------------------
+
+ ----------------------------------------------------------------------------------------------------------------------
+ INSTRUCTIONS:
+
+ -Run this script with a python interpreter having PySide2, from any folder:
+
+ python memoryMonitor/benchmarks/bench_monitor.py --output results.json
+
+ -Compare against the results of a previous version:
+
+ python memoryMonitor/benchmarks/bench_monitor.py --output new.json --compare results.json
+
+ -Benchmark the lightweight QPainter renderer instead of QtCharts, and compare it with QtCharts:
+
+ python memoryMonitor/benchmarks/bench_monitor.py --renderer painter --compare results.json
+
+ Allocations are measured in a second pass under tracemalloc, so that tracing doesn't weigh on the latencies.
+ ----------------------------------------------------------------------------------------------------------------------
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARK_DIR, "stubs"))
+sys.path.insert(0, os.path.dirname(BENCHMARK_DIR))
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+os.environ.setdefault("MEMORY_MONITOR_TRACE_DIR", tempfile.mkdtemp(prefix="memoryMonitor-benchmarks-"))
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, where the peak RSS isn't reported.
+    resource = None
+
+from PySide2 import QtCore, QtWidgets
+
+from package.api.funcstore import ListsModifier, timestamp
+from package.api.widgets import QTCHARTS, RENDERERS
+from package.main_window import MainPanel
+
+
+# Number of samples in the monitor window for each run.
+SAMPLE_COUNTS = (50, 1000, 10000, 100000)
+# Number of timed calls per benchmark and sample count.
+TICKS = 50
+# Size of the panel during the benchmarks, in pixels, which bounds the number of points drawn.
+PANEL_SIZE = (1200, 600)
+
+
+def peak_rss():
+    """Returns the peak resident set size of the process, in KB, or None where it can't be measured.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, Linux reports KB.
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def measure(function, ticks):
+    """Times a function over a number of calls, then measures its allocations over as many calls.
+    @param (func) function:
+    The function to benchmark, called without arguments.
+    @param (int) ticks:
+    The number of calls of each pass.
+    @return (dict) result:
+    The latencies in milliseconds, the peak and retained allocations in bytes, and the peak RSS in KB.
+    """
+    latencies = []
+    for tick in range(ticks):
+        start = time.perf_counter()
+        function()
+        latencies.append((time.perf_counter() - start) * 1000.0)
+    tracemalloc.start()
+    for tick in range(ticks):
+        function()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    latencies.sort()
+    return {'ticks': ticks, 'mean_ms': sum(latencies) / ticks, 'p50_ms': latencies[ticks // 2],
+            'p95_ms': latencies[min(int(ticks * 0.95), ticks - 1)], 'max_ms': latencies[-1],
+            'alloc_peak_bytes': peak, 'alloc_retained_bytes': retained, 'rss_peak_kb': peak_rss()}
+
+
+def build_panel(samples, renderer=QTCHARTS):
+    """Builds a main panel whose monitor displays a window of samples, filled with one sample per second.
+    @param (int) samples:
+    The number of samples of the window.
+    @param (str) renderer:
+    The renderer of the monitor chart.
+    @return (MainPanel) panel:
+    The panel, shown offscreen.
+    """
+    panel = MainPanel()
+    panel.monitor.set_renderer(renderer)
+    panel.build_properties()
+    panel.traceCB.setChecked(False)
+    panel.resize(*PANEL_SIZE)
+    panel.show()
+    store = panel.monitor.samples
+    now = timestamp()
+    value = 4000.0
+    for index in range(samples):
+        value = min(max(value + random.uniform(-20.0, 21.0), 500.0), 15000.0)
+        store.append(now - samples + index, usage=value, max_usage=16000.0)
+    panel.samplesNumSpinBox.setValue(samples)
+    QtWidgets.QApplication.processEvents()
+    return panel
+
+
+def hover_positions(monitor, count=64):
+    """Picks positions right on drawn points, so that the tooltip path goes all the way to displaying a callout.
+    Nothing is picked when no point was drawn, such as when the chart failed to build.
+    """
+    positions = []
+    if not len(monitor._drawn_x):
+        return positions
+    for index in range(count):
+        drawn = random.randrange(len(monitor._drawn_x))
+        positions.append(monitor.chart.mapToPosition(QtCore.QPointF(monitor._drawn_x[drawn],
+                                                                    monitor._drawn_y[drawn])))
+    return positions
+
+
+def benchmarks(panel):
+    """Lists the benchmarked functions for a panel.
+    @return (list) benchmarks:
+    (name, function) tuples.
+    """
+    monitor = panel.monitor
+    lmod = ListsModifier(monitor.samples, monitor.max_sample)
+    positions = hover_positions(monitor)
+    hovered = [0]
+
+    def hover():
+        hit = monitor.hit_test(positions[hovered[0] % len(positions)])
+        hovered[0] += 1
+        if hit is not None:
+            monitor.show_tooltip(*hit)
+
+    def redraw():
+        # Paints the region invalidated by the new points, as the event loop does after a tick.
+        monitor.append_series()
+        QtWidgets.QApplication.processEvents()
+
+    functions = [("ListsModifier.update", lmod.update),
+                 ("ListsModifier.resize", lmod.resize),
+                 ("Monitor.append_series", monitor.append_series),
+                 ("Monitor.redraw", redraw),
+                 ("Monitor.hit_test", hover),
+                 ("MainPanel.update_chart", panel.update_chart)]
+    if not positions:
+        sys.stderr.write("No point drawn on the chart (built: {0:s}), skipping Monitor.hit_test.\n".format(
+            str(monitor.built)))
+        functions.remove(("Monitor.hit_test", hover))
+    return functions
+
+
+def compare(results, previous):
+    """Prints the mean latency and allocation ratios against previous results.
+    """
+    reference = dict(((result['benchmark'], result['samples']), result) for result in previous['results'])
+    print("\n{0:<26s} {1:>8s} {2:>12s} {3:>12s}".format("Benchmark", "Samples", "Latency", "Allocations"))
+    for result in results:
+        old = reference.get((result['benchmark'], result['samples']))
+        if old is None:
+            continue
+        print("{0:<26s} {1:>8d} {2:>11.2f}x {3:>11.2f}x".format(
+            result['benchmark'], result['samples'], result['mean_ms'] / max(old['mean_ms'], 1e-9),
+            result['alloc_peak_bytes'] / float(max(old['alloc_peak_bytes'], 1))))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the memory monitor hot path with a stand-in nuke module.")
+    parser.add_argument("--samples", type=int, nargs="+", default=list(SAMPLE_COUNTS),
+                        help="The sample counts to run the benchmarks at.")
+    parser.add_argument("--ticks", type=int, default=TICKS, help="The number of timed calls per benchmark.")
+    parser.add_argument("--output", help="Writes the results to this JSON file.")
+    parser.add_argument("--compare", help="Compares the results with a previous JSON file.")
+    parser.add_argument("--label", default="", help="A label stored with the results, such as a version.")
+    parser.add_argument("--renderer", choices=RENDERERS, default=QTCHARTS, help="The renderer of the monitor chart.")
+    args = parser.parse_args(argv)
+
+    random.seed(0)
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication(sys.argv[:1])
+    results = []
+    print("{0:<26s} {1:>8s} {2:>10s} {3:>10s} {4:>10s} {5:>14s} {6:>12s}".format(
+        "Benchmark", "Samples", "Mean ms", "p95 ms", "Max ms", "Alloc peak B", "RSS peak KB"))
+    for samples in args.samples:
+        panel = build_panel(samples, args.renderer)
+        for name, function in benchmarks(panel):
+            result = measure(function, args.ticks)
+            result.update({'benchmark': name, 'samples': samples})
+            results.append(result)
+            print("{0:<26s} {1:>8d} {2:>10.3f} {3:>10.3f} {4:>10.3f} {5:>14d} {6:>12s}".format(
+                name, samples, result['mean_ms'], result['p95_ms'], result['max_ms'], result['alloc_peak_bytes'],
+                str(result['rss_peak_kb'])))
+        panel.sampler.stop()
+        panel.close()
+        panel.deleteLater()
+        app.processEvents()
+
+    report = {'label': args.label, 'date': datetime.datetime.now().isoformat(), 'python': platform.python_version(),
+              'platform': platform.platform(), 'renderer': args.renderer, 'ticks': args.ticks, 'results': results}
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+    if args.compare:
+        with open(args.compare) as previous:
+            compare(results, json.load(previous))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,129 @@
+"""
+ ----------------------------------------------------------------------------------------------------------------------
+ memoryMonitor - startup benchmark
+ ----------------------------------------------------------------------------------------------------------------------
+
+ ----------------------------------------------------------------------------------------------------------------------
+ USAGE:
+ Measures what opening the memory monitor costs to Nuke: the import of the panel module, the construction of the
+ panel and its first display. Every run is a fresh interpreter which imports PySide2 and the stand-in nuke module
+ beforehand, as Nuke does, so only the monitor's own cost is timed. The medians are compared with a budget, and the
+ modules which should only be imported on demand are checked for.
+ ----------------------------------------------------------------------------------------------------------------------
+
+ ----------------------------------------------------------------------------------------------------------------------
+ INSTRUCTIONS:
+
+ -Run this script with a python interpreter having PySide2, from any folder:
+
+ python memoryMonitor/benchmarks/bench_startup.py --runs 10 --output startup.json
+
+ The exit code is 1 when a median is over its budget or when a deferred module was imported at startup, so the
+ script can gate a CI job.
+ ----------------------------------------------------------------------------------------------------------------------
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+# Budgets of the startup stages, in milliseconds, compared with the medians of the runs.
+IMPORT_BUDGET_MS = 25.0
+PANEL_BUDGET_MS = 40.0
+SHOW_BUDGET_MS = 60.0
+# Number of fresh interpreters timed by default.
+RUNS = 7
+# Modules the monitor only imports when the feature needing them is used.
+DEFERRED_MODULES = ("PySide2.QtCharts", "http.server", "tracemalloc")
+
+# Script run in every fresh interpreter. It prints the stage timings and the deferred modules found, as JSON.
+_RUN_SCRIPT = """
+import json, os, sys, tempfile, time
+sys.path.insert(0, {stubs!r})
+sys.path.insert(0, {package!r})
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+os.environ.setdefault("MEMORY_MONITOR_TRACE_DIR", tempfile.mkdtemp(prefix="memoryMonitor-startup-"))
+from PySide2 import QtCore, QtGui, QtWidgets
+import nuke
+import nukescripts.panels
+app = QtWidgets.QApplication(sys.argv[:1])
+deferred = {deferred!r}
+preloaded = [name for name in deferred if name in sys.modules]
+
+start = time.perf_counter()
+from package.main_window import MainPanel
+imported = time.perf_counter()
+panel = MainPanel()
+constructed = time.perf_counter()
+loaded = [name for name in deferred if name in sys.modules and name not in preloaded]
+panel.show()
+app.processEvents()
+shown = time.perf_counter()
+panel.sampler.stop()
+print(json.dumps({{'import_ms': (imported - start) * 1000.0, 'panel_ms': (constructed - imported) * 1000.0,
+                  'show_ms': (shown - constructed) * 1000.0, 'deferred_loaded': loaded}}))
+"""
+
+
+def run_once(python):
+    """Times the startup stages in a fresh interpreter.
+    @param (str) python:
+    The interpreter to run.
+    @return (dict) result:
+    The import, panel and show durations in milliseconds, and the deferred modules imported at startup.
+    """
+    script = _RUN_SCRIPT.format(stubs=os.path.join(BENCHMARK_DIR, "stubs"), package=os.path.dirname(BENCHMARK_DIR),
+                                deferred=DEFERRED_MODULES)
+    output = subprocess.check_output([python, "-c", script], stderr=subprocess.DEVNULL)
+    return json.loads(output.decode("utf-8").strip().splitlines()[-1])
+
+
+def median(values):
+    ordered = sorted(values)
+    middle = len(ordered) // 2
+    if len(ordered) % 2:
+        return ordered[middle]
+    return (ordered[middle - 1] + ordered[middle]) / 2.0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time the memory monitor startup against its budget.")
+    parser.add_argument("--runs", type=int, default=RUNS, help="The number of fresh interpreters timed.")
+    parser.add_argument("--python", default=sys.executable, help="The interpreter to time the startup with.")
+    parser.add_argument("--output", help="Writes the results to this JSON file.")
+    parser.add_argument("--label", default="", help="A label stored with the results, such as a version.")
+    args = parser.parse_args(argv)
+
+    runs = [run_once(args.python) for run in range(args.runs)]
+    budgets = {'import_ms': IMPORT_BUDGET_MS, 'panel_ms': PANEL_BUDGET_MS, 'show_ms': SHOW_BUDGET_MS}
+    medians = dict((stage, median([run[stage] for run in runs])) for stage in budgets)
+    loaded = sorted(set(name for run in runs for name in run['deferred_loaded']))
+
+    over_budget = False
+    print("{0:<10s} {1:>10s} {2:>10s} {3:>10s}".format("Stage", "Median ms", "Budget ms", ""))
+    for stage in ('import_ms', 'panel_ms', 'show_ms'):
+        over = medians[stage] > budgets[stage]
+        over_budget = over_budget or over
+        print("{0:<10s} {1:>10.1f} {2:>10.1f} {3:>10s}".format(stage[:-3], medians[stage], budgets[stage],
+                                                              "OVER" if over else "ok"))
+    for name in loaded:
+        print("Deferred module imported at startup: {0:s}".format(name))
+
+    if args.output:
+        report = {'label': args.label, 'date': datetime.datetime.now().isoformat(),
+                  'python': platform.python_version(), 'platform': platform.platform(), 'runs': runs,
+                  'medians': medians, 'budgets': budgets, 'deferred_loaded': loaded}
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+    return 1 if over_budget or loaded else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
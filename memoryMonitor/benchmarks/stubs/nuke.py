@@ -0,0 +1,69 @@
+"""
+A stand-in for the nuke module, for benchmarking the monitor outside of Nuke. Memory counters come from a provider
+function which can be swapped with set_memory_provider(); every callback registration is accepted and ignored.
+"""
+
+import math
+import time
+
+env = {'gui': False}
+
+_start = time.monotonic()
+
+
+def _default_provider(element):
+    """A slow sawtooth with some noise, around 4 GB used out of 16 GB allowed, in bytes.
+    """
+    if element == 'max_usage':
+        return 16000000000
+    if element == 'total_ram':
+        return 64000000000
+    elapsed = time.monotonic() - _start
+    return int(4000000000 + 500000000 * (elapsed % 30.0) / 30.0 + 20000000 * math.sin(elapsed * 7.0))
+
+
+_provider = _default_provider
+
+
+def set_memory_provider(provider):
+    """Replaces the function answering nuke.memory(element) for the usage, max_usage and total_ram counters.
+    """
+    global _provider
+    _provider = provider
+
+
+class _Root:
+    def name(self):
+        return "benchmark.nk"
+
+
+def memory(element, *args):
+    if element in ('info', 'free'):
+        return ""
+    return _provider(element)
+
+
+def message(text):
+    print(text)
+
+
+def root():
+    return _Root()
+
+
+def allNodes(*args, **kwargs):
+    return []
+
+
+def frame():
+    return 1
+
+
+def _ignore(*args, **kwargs):
+    return None
+
+
+clearRAMCache = clearDiskCache = _ignore
+addOnScriptLoad = removeOnScriptLoad = addOnCreate = removeOnCreate = _ignore
+addKnobChanged = removeKnobChanged = addBeforeRender = removeBeforeRender = _ignore
+addBeforeFrameRender = removeBeforeFrameRender = addAfterFrameRender = removeAfterFrameRender = _ignore
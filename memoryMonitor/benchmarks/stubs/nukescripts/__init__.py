@@ -0,0 +1,3 @@
+"""
+A stand-in for the nukescripts package, for benchmarking the monitor outside of Nuke.
+"""
@@ -0,0 +1,7 @@
+"""
+A stand-in for nukescripts.panels, for benchmarking the monitor outside of Nuke.
+"""
+
+
+def registerWidgetAsPanel(*args, **kwargs):
+    return None
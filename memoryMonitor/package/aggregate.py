@@ -0,0 +1,264 @@
+"""
+ ----------------------------------------------------------------------------------------------------------------------
+ memoryMonitor - trace aggregator
+ ----------------------------------------------------------------------------------------------------------------------
+
+ ----------------------------------------------------------------------------------------------------------------------
+ USAGE:
+ Analyzes many memory traces at once, such as the traces of a night of farm renders, outside of Nuke. Every trace is
+ memory-mapped and reduced to a few figures in a worker process, so hundreds of traces are processed in parallel
+ without ever being loaded together. numpy is used when it is available and the pure python path is used otherwise.
+ ----------------------------------------------------------------------------------------------------------------------
+
+ ----------------------------------------------------------------------------------------------------------------------
+ INSTRUCTIONS:
+
+ -With the memoryMonitor folder in PYTHONPATH, pass trace files or folders holding traces:
+
+ python -m package.aggregate ~/.nuke/memoryMonitor/traces --top 20 --json report.json --curves curves.csv
+
+ The ranked report is printed. --json writes every job figure, --curves writes the merged percentile curves: memory
+ over the normalized duration of the jobs, at the 50th, 90th and 99th percentiles across jobs, and their maximum.
+ ----------------------------------------------------------------------------------------------------------------------
+"""
+
+import argparse
+import bisect
+import json
+import multiprocessing
+import os
+import sys
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from package.api.stats import LinearTrend
+from package.api.trace import TraceReader, EXTENSION
+
+
+# Number of points of the per-job curves merged into the percentile curves.
+CURVE_POINTS = 200
+# Percentiles of the merged curves, across jobs.
+CURVE_PERCENTILES = (50, 90, 99)
+# Figures the report can be ranked by.
+SORT_KEYS = ('peak', 'p95', 'growth', 'frame_p95')
+
+
+def percentile(ordered, p):
+    """Returns a percentile of sorted values, interpolating linearly between the two closest ranks.
+    @param (list) ordered:
+    The values, in ascending order.
+    @param (float) p:
+    The percentile, between 0 and 100.
+    @return (float) value:
+    The percentile, or 0 without values.
+    """
+    if not len(ordered):
+        return 0.0
+    rank = (len(ordered) - 1) * p / 100.0
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def _figures_numpy(timestamps, values, points):
+    """Computes the peak, p95, growth rate and resampled curve of a trace column with numpy.
+    """
+    timestamps = numpy.array(timestamps, dtype=numpy.float64)
+    values = numpy.array(values, dtype=numpy.float64)
+    elapsed = timestamps - timestamps[0]
+    growth = numpy.polyfit(elapsed, values, 1)[0] if len(values) > 1 and elapsed[-1] > 0 else 0.0
+    curve = numpy.interp(numpy.linspace(elapsed[0], elapsed[-1], points), elapsed, values)
+    return float(values.max()), float(numpy.percentile(values, 95)), float(growth), curve.tolist()
+
+
+def _figures_python(timestamps, values, points):
+    """Computes the peak, p95, growth rate and resampled curve of a trace column in pure python.
+    """
+    trend = LinearTrend()
+    origin = timestamps[0]
+    for t, value in zip(timestamps, values):
+        trend.add(t - origin, value)
+    ordered = sorted(values)
+    duration = timestamps[-1] - origin
+    curve = []
+    for index in range(points):
+        t = origin + duration * index / max(points - 1, 1)
+        position = min(bisect.bisect_left(timestamps, t), len(values) - 1)
+        if position and timestamps[position] != t:
+            t0, t1 = timestamps[position - 1], timestamps[position]
+            v0, v1 = values[position - 1], values[position]
+            curve.append(v0 + (v1 - v0) * (t - t0) / (t1 - t0) if t1 > t0 else v1)
+        else:
+            curve.append(values[position])
+    return ordered[-1], percentile(ordered, 95), trend.slope, curve
+
+
+def analyze_trace(path, points=CURVE_POINTS):
+    """Reduces a trace to the figures of its job. Runs in the worker processes.
+    @param (str) path:
+    The trace path.
+    @param (int) points:
+    The number of points of the resampled memory curve.
+    @return (dict) job:
+    The job figures, with an 'error' key instead if the trace can't be read or holds no sample.
+    """
+    job = {'job': os.path.splitext(os.path.basename(path))[0], 'path': path}
+    try:
+        reader = TraceReader(path)
+    except (OSError, ValueError) as error:
+        job['error'] = str(error)
+        return job
+    try:
+        if not len(reader):
+            job['error'] = "No sample recorded."
+            return job
+        # Per-frame traces written by the headless profiler record the peak of each frame after the base fields.
+        per_frame = 'peak_usage' in reader.fields
+        column = 'peak_usage' if per_frame else 'usage'
+        timestamps = reader.view('timestamp')
+        values = reader.view(column)
+        figures = _figures_numpy if numpy is not None else _figures_python
+        peak, p95, growth, curve = figures(timestamps, values, points)
+        job.update({'samples': len(reader), 'duration': timestamps[-1] - timestamps[0], 'peak': peak, 'p95': p95,
+                    'growth': growth * 60, 'max_usage': max(reader.view('max_usage')), 'curve': curve})
+        if per_frame:
+            frames = reader.view('frame').tolist()
+            ordered = sorted(values)
+            worst = max(range(len(frames)), key=values.__getitem__)
+            job.update({'frames': len(frames), 'frame_median': percentile(ordered, 50),
+                        'frame_p95': percentile(ordered, 95), 'worst_frame': int(frames[worst])})
+        del timestamps, values
+    finally:
+        reader.close()
+    return job
+
+
+def _analyze(arguments):
+    return analyze_trace(*arguments)
+
+
+def find_traces(paths):
+    """Expands folders into the traces they hold.
+    @param (list) paths:
+    Trace files and folders.
+    @return (list) traces:
+    The trace paths, folders being searched recursively.
+    """
+    traces = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, directories, files in os.walk(path):
+                traces.extend(os.path.join(root, name) for name in sorted(files) if name.endswith(EXTENSION))
+        else:
+            traces.append(path)
+    return traces
+
+
+def merge_curves(curves):
+    """Merges the per-job curves into percentile curves across jobs, point by point.
+    @param (list) curves:
+    The job curves, all of the same length.
+    @return (dict) merged:
+    The percentile curves keyed by 'p50', 'p90', 'p99' and 'max'.
+    """
+    if not curves:
+        return {}
+    if numpy is not None:
+        stack = numpy.array(curves, dtype=numpy.float64)
+        merged = dict(("p{0:d}".format(p), curve.tolist())
+                      for p, curve in zip(CURVE_PERCENTILES, numpy.percentile(stack, CURVE_PERCENTILES, axis=0)))
+        merged['max'] = stack.max(axis=0).tolist()
+        return merged
+    merged = dict(("p{0:d}".format(p), []) for p in CURVE_PERCENTILES)
+    merged['max'] = []
+    for column in zip(*curves):
+        ordered = sorted(column)
+        for p in CURVE_PERCENTILES:
+            merged["p{0:d}".format(p)].append(percentile(ordered, p))
+        merged['max'].append(ordered[-1])
+    return merged
+
+
+def aggregate(paths, processes=None, points=CURVE_POINTS):
+    """Analyzes traces in a process pool.
+    @param (list) paths:
+    The trace paths.
+    @param (int) processes:
+    The number of worker processes. Defaults to the number of CPUs.
+    @param (int) points:
+    The number of points of the job curves.
+    @return (tuple) result:
+    The figures of the jobs which could be analyzed, the jobs which could not, and the merged percentile curves.
+    """
+    arguments = [(path, points) for path in paths]
+    if len(arguments) < 2 or processes == 1:
+        results = [_analyze(argument) for argument in arguments]
+    else:
+        processes = processes or multiprocessing.cpu_count()
+        pool = multiprocessing.Pool(processes)
+        try:
+            results = pool.map(_analyze, arguments, chunksize=max(len(arguments) // (processes * 4), 1))
+        finally:
+            pool.close()
+            pool.join()
+    jobs = [job for job in results if 'error' not in job]
+    failed = [job for job in results if 'error' in job]
+    return jobs, failed, merge_curves([job['curve'] for job in jobs])
+
+
+def format_report(jobs, sort_key='peak', top=None):
+    """Formats the ranked report.
+    @param (list) jobs:
+    The job figures.
+    @param (str) sort_key:
+    The figure the jobs are ranked by, from the highest.
+    @param (int) top:
+    The number of jobs listed, or None to list every job.
+    @return (str) report:
+    The report, one line per job.
+    """
+    ranked = sorted(jobs, key=lambda job: job.get(sort_key, 0.0), reverse=True)[:top]
+    lines = ["{0:<48s} {1:>9s} {2:>10s} {3:>10s} {4:>10s} {5:>12s} {6:>7s} {7:>10s} {8:>6s}".format(
+        "Job", "Samples", "Duration", "Peak MB", "p95 MB", "Growth/min", "Frames", "Frame p95", "Worst")]
+    for job in ranked:
+        lines.append("{0:<48s} {1:>9d} {2:>9.0f}s {3:>10.1f} {4:>10.1f} {5:>12.2f} {6:>7s} {7:>10s} {8:>6s}".format(
+            job['job'][:48], job['samples'], job['duration'], job['peak'], job['p95'], job['growth'],
+            str(job.get('frames', "-")), "{0:.1f}".format(job['frame_p95']) if 'frame_p95' in job else "-",
+            str(job.get('worst_frame', "-"))))
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rank memory traces and merge their percentile curves.")
+    parser.add_argument("paths", nargs="+", help="Trace files, or folders searched for traces.")
+    parser.add_argument("--sort", choices=SORT_KEYS, default='peak', help="The figure jobs are ranked by.")
+    parser.add_argument("--top", type=int, help="The number of jobs listed in the report.")
+    parser.add_argument("--processes", type=int, help="The number of worker processes. Defaults to the CPU count.")
+    parser.add_argument("--points", type=int, default=CURVE_POINTS, help="The number of points of the curves.")
+    parser.add_argument("--json", help="Writes every job figure and the merged curves to this JSON file.")
+    parser.add_argument("--curves", help="Writes the merged percentile curves to this CSV file.")
+    args = parser.parse_args(argv)
+
+    jobs, failed, merged = aggregate(find_traces(args.paths), args.processes, args.points)
+    print(format_report(jobs, args.sort, args.top))
+    for job in failed:
+        sys.stderr.write("Skipped {0:s}: {1:s}\n".format(job['path'], job['error']))
+    if args.json:
+        with open(args.json, "w") as report:
+            json.dump({'jobs': [dict((key, value) for key, value in job.items() if key != 'curve') for job in jobs],
+                       'failed': failed, 'curves': merged}, report, indent=2)
+    if args.curves and merged:
+        names = ["p{0:d}".format(p) for p in CURVE_PERCENTILES] + ['max']
+        with open(args.curves, "w") as curves:
+            curves.write("position,{0:s}\n".format(",".join(names)))
+            for index in range(args.points):
+                values = ",".join("{0:.2f}".format(merged[name][index]) for name in names)
+                curves.write("{0:.4f},{1:s}\n".format(index / max(args.points - 1, 1.0), values))
+    return 0 if jobs or not failed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
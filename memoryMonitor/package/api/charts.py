@@ -0,0 +1,17 @@
+from PySide2 import QtCharts, QtGui
+
+
+class CustomAxis(QtCharts.QValueAxis):
+    def __init__(self, text):
+        """ A subclass of the QValueAxis to be featured in the Monitor chart.
+        @param (str) text:
+        The name of the axis title.
+        @return (None):
+        No return value.
+        """
+        super(CustomAxis, self).__init__()
+        self.setTitleText(text)
+        self.setTitleBrush(QtGui.QBrush(QtGui.QColor("lightGrey")))
+        self.setTitleFont(QtGui.QFont("Calibri", 14, QtGui.QFont.Bold))
+        self.setLabelsFont(QtGui.QFont("Calibri", 10, QtGui.QFont.Bold))
+        self.setLabelsColor(QtGui.QColor("grey"))
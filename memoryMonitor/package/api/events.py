@@ -0,0 +1,217 @@
+import collections
+import os
+import threading
+import nuke
+from package.api.funcstore import timestamp
+from package.api.samplestore import RingBuffer
+
+
+# Number of events kept in memory for the chart markers.
+EVENT_LOG_LENGTH = 8192
+# Time between two batched writes of the event file, in seconds.
+FLUSH_INTERVAL = 1.0
+# Extension of the event files written next to the traces.
+EVENTS_EXTENSION = ".mmevents"
+# Kinds of events recorded, stored as their index in the log.
+EVENT_KINDS = ('script_load', 'node_created', 'knob_changed', 'render', 'viewer_frame')
+# Names of the event kinds, as displayed in the chart tooltips.
+EVENT_LABELS = ("Script loaded", "Node created", "Knob changed", "Render started", "Viewer frame changed")
+# Classes of the nodes whose knob changes are recorded, as they can make Nuke load or compute large buffers.
+HEAVY_NODE_CLASSES = ('Read', 'DeepRead', 'ReadGeo2', 'Write', 'ScanlineRender', 'RayRender', 'ZDefocus2',
+                      'Convolve2', 'Denoise2', 'Kronos', 'OFlow2', 'VectorGenerator', 'TimeBlur', 'FrameHold')
+# Knobs changing on every selection, move or panel toggle, which never say anything about memory.
+IGNORED_KNOBS = frozenset(('xpos', 'ypos', 'selected', 'showPanel', 'hidePanel', 'inputChange', 'label', 'note_font',
+                           'tile_color', 'gl_color', 'name'))
+# Index of the viewer frame kind, whose events carry the frame number as their value.
+_VIEWER_FRAME = EVENT_KINDS.index('viewer_frame')
+
+
+def describe(kind, name, value):
+    """Returns the text of an event, as written to the event files and displayed in the chart tooltips.
+    @param (int) kind:
+    The index of the event kind in EVENT_KINDS.
+    @param (str) name:
+    The node, knob or script the event is about.
+    @param (int) value:
+    The number carried by the event, such as the frame of a viewer frame change.
+    @return (str) text:
+    The name, followed by the value if the kind has one.
+    """
+    if kind == _VIEWER_FRAME:
+        return "{0:s} frame {1:d}".format(name, value)
+    return name
+
+
+class EventWriter:
+    def __init__(self, path):
+        """Appends events to a tab-separated text file from a background thread. Events are queued by the callbacks and
+        written in batches, one unbuffered write every FLUSH_INTERVAL, so Nuke callbacks never wait on the disk.
+        @param (str) path:
+        The event file path. Missing directories are created.
+        @return (None):
+        No return value.
+        """
+        self.path = path
+        self.queue = collections.deque()
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        self._fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="memoryMonitor-events")
+        self._thread.daemon = True
+        self._thread.start()
+
+    @property
+    def closed(self):
+        return self._fd is None
+
+    def close(self):
+        """Stops the thread, writes the events still queued and closes the file.
+        """
+        if self._fd is None:
+            return
+        self._stop_event.set()
+        self._thread.join()
+        self.flush()
+        os.close(self._fd)
+        self._fd = None
+
+    def flush(self):
+        """Writes every queued event in a single write.
+        """
+        queue = self.queue
+        lines = []
+        while queue:
+            event_time, kind, name, value = queue.popleft()
+            lines.append("{0:.6f}\t{1:s}\t{2:s}\n".format(event_time, EVENT_KINDS[kind], describe(kind, name, value)))
+        if not lines:
+            return
+        try:
+            os.write(self._fd, "".join(lines).encode("utf-8"))
+        except OSError:
+            # Like traces, a full disk must never break the session.
+            pass
+
+    def _run(self):
+        while not self._stop_event.wait(FLUSH_INTERVAL):
+            self.flush()
+
+
+class EventLog:
+    def __init__(self, capacity=EVENT_LOG_LENGTH):
+        """Records Nuke operations liable to change memory usage, on the same timeline as the samples. The callbacks
+        only append a tuple to a deque; events are moved into compact ring buffers by drain(), on the GUI tick, and
+        node names are interned so that each event takes 25 bytes. Numbers such as viewer frames are kept out of the
+        interned names, as a value of their own, so the name table only grows with the nodes of the script.
+        @param (int) capacity:
+        The number of events kept in memory.
+        @return (None):
+        No return value.
+        """
+        self.timestamps = RingBuffer(capacity)
+        self.kinds = RingBuffer(capacity, 'B')
+        self.names = RingBuffer(capacity, 'Q')
+        self.values = RingBuffer(capacity, 'q')
+        self.writer = None
+        self.installed = False
+        self._pending = collections.deque()
+        self._name_table = []
+        self._name_ids = {}
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def record(self, kind, name, value=0):
+        """Records an event. Safe to call from any thread.
+        @param (int) kind:
+        The index of the event kind in EVENT_KINDS.
+        @param (str) name:
+        The node, knob or script the event is about.
+        @param (int) value:
+        The number carried by the event, such as the frame of a viewer frame change.
+        @return (None):
+        No return value.
+        """
+        event = (timestamp(), kind, name, value)
+        self._pending.append(event)
+        writer = self.writer
+        if writer is not None:
+            writer.queue.append(event)
+
+    def drain(self):
+        """Moves the events recorded since the previous call into the ring buffers. Must run on the GUI thread.
+        @return (int) count:
+        The number of events moved.
+        """
+        pending = self._pending
+        count = 0
+        while pending:
+            event_time, kind, name, value = pending.popleft()
+            name_id = self._name_ids.get(name)
+            if name_id is None:
+                name_id = len(self._name_table)
+                self._name_table.append(name)
+                self._name_ids[name] = name_id
+            self.timestamps.append(event_time)
+            self.kinds.append(kind)
+            self.names.append(name_id)
+            self.values.append(value)
+            count += 1
+        return count
+
+    def event(self, index):
+        """Returns an event of the ring buffers.
+        @param (int) index:
+        The index of the event, oldest first.
+        @return (tuple) event:
+        The timestamp, kind label and name of the event.
+        """
+        count = len(self)
+        kind = self.kinds.view(count)[index]
+        return (self.timestamps.view(count)[index], EVENT_LABELS[kind],
+                describe(kind, self._name_table[self.names.view(count)[index]], self.values.view(count)[index]))
+
+    def install(self):
+        """Registers the Nuke callbacks.
+        """
+        if self.installed:
+            return
+        nuke.addOnScriptLoad(self.on_script_load)
+        nuke.addOnCreate(self.on_node_created)
+        for node_class in HEAVY_NODE_CLASSES:
+            nuke.addKnobChanged(self.on_knob_changed, nodeClass=node_class)
+        nuke.addKnobChanged(self.on_viewer_frame, nodeClass='Viewer')
+        nuke.addBeforeRender(self.on_render)
+        self.installed = True
+
+    def uninstall(self):
+        """Unregisters the Nuke callbacks.
+        """
+        if not self.installed:
+            return
+        nuke.removeOnScriptLoad(self.on_script_load)
+        nuke.removeOnCreate(self.on_node_created)
+        for node_class in HEAVY_NODE_CLASSES:
+            nuke.removeKnobChanged(self.on_knob_changed, nodeClass=node_class)
+        nuke.removeKnobChanged(self.on_viewer_frame, nodeClass='Viewer')
+        nuke.removeBeforeRender(self.on_render)
+        self.installed = False
+
+    def on_script_load(self):
+        self.record(0, nuke.root().name())
+
+    def on_node_created(self):
+        self.record(1, nuke.thisNode().fullName())
+
+    def on_knob_changed(self):
+        knob = nuke.thisKnob().name()
+        if knob not in IGNORED_KNOBS:
+            self.record(2, "{0:s}.{1:s}".format(nuke.thisNode().fullName(), knob))
+
+    def on_render(self):
+        self.record(3, nuke.thisNode().fullName())
+
+    def on_viewer_frame(self):
+        if nuke.thisKnob().name() == 'frame':
+            self.record(_VIEWER_FRAME, nuke.thisNode().name(), int(nuke.thisKnob().value()))
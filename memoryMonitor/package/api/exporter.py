@@ -0,0 +1,170 @@
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from package.api.procmem import PROC_FIELDS
+
+
+# Port the exporter listens on by default.
+DEFAULT_PORT = 9466
+# Content type of the OpenMetrics text format.
+CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+# Path the metrics are served on.
+METRICS_PATH = "/metrics"
+# Number of bytes in the MB used by the samples, which come from Nuke byte counts scaled by 0.000001.
+BYTES_PER_MB = 1000000.0
+
+# Rolling statistics exported, as summary keys and their label value.
+_STATS = ('min', 'max', 'mean', 'std', 'ewma', 'p95', 'p99')
+
+
+def _metric(lines, name, metric_type, unit, description, samples):
+    """Appends the metadata and samples of a metric family.
+    @param (list) lines:
+    The lines of the exposition.
+    @param (str) name:
+    The metric family name.
+    @param (str) metric_type:
+    The OpenMetrics type, such as gauge or counter.
+    @param (str) unit:
+    The unit of the metric, or an empty string.
+    @param (str) description:
+    The help text.
+    @param (list) samples:
+    (suffix, labels, value) tuples. Labels are preformatted, such as '{stat="min"}', or empty strings.
+    @return (None):
+    No return value.
+    """
+    lines.append("# TYPE {0:s} {1:s}".format(name, metric_type))
+    if unit:
+        lines.append("# UNIT {0:s} {1:s}".format(name, unit))
+    lines.append("# HELP {0:s} {1:s}".format(name, description))
+    for suffix, labels, value in samples:
+        lines.append("{0:s}{1:s}{2:s} {3:s}".format(name, suffix, labels, repr(float(value))))
+
+
+def format_metrics(snapshot, summary, count):
+    """Renders the latest sample and the rolling statistics in the OpenMetrics text format.
+    @param (MemorySnapshot) snapshot:
+    The latest sample.
+    @param (dict) summary:
+    The rolling statistics of the memory usage, in MB, as returned by RollingStats.summary().
+    @param (int) count:
+    The number of samples captured since the monitor started.
+    @return (bytes) payload:
+    The exposition, ending with the mandatory EOF marker.
+    """
+    lines = []
+    _metric(lines, "nuke_memory_usage_bytes", "gauge", "bytes", "Memory used by Nuke.",
+            [("", "", snapshot.usage * BYTES_PER_MB)])
+    _metric(lines, "nuke_memory_max_bytes", "gauge", "bytes", "Maximum memory Nuke may allocate.",
+            [("", "", snapshot.max_usage * BYTES_PER_MB)])
+    _metric(lines, "nuke_memory_total_ram_bytes", "gauge", "bytes", "Total RAM of the system.",
+            [("", "", snapshot.total_ram * BYTES_PER_MB)])
+    _metric(lines, "nuke_memory_usage_window_bytes", "gauge", "bytes",
+            "Rolling statistics of the memory used by Nuke over the monitor window.",
+            [("", '{{stat="{0:s}"}}'.format(name), summary[name] * BYTES_PER_MB) for name in _STATS])
+    if snapshot.rss:
+        _metric(lines, "nuke_process_memory_bytes", "gauge", "bytes",
+                "Memory of the Nuke process as accounted by the Linux kernel, read from /proc.",
+                [("", '{{kind="{0:s}"}}'.format(name), value * BYTES_PER_MB)
+                 for name, value in zip(PROC_FIELDS, snapshot.proc_record())])
+    _metric(lines, "nuke_memory_sample_latency_seconds", "gauge", "seconds", "Time the latest sample took to capture.",
+            [("", "", snapshot.latency)])
+    _metric(lines, "nuke_memory_sample_timestamp_seconds", "gauge", "seconds", "Capture time of the latest sample.",
+            [("", "", snapshot.timestamp)])
+    _metric(lines, "nuke_memory_samples", "counter", "", "Samples captured since the monitor started.",
+            [("_total", "", count)])
+    lines.append("# EOF\n")
+    return "\n".join(lines).encode("utf-8")
+
+
+class _MetricsServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != METRICS_PATH:
+            self.send_error(404)
+            return
+        payload = self.server.exporter.payload
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        # Scrapes come every few seconds and would flood the Nuke script editor.
+        pass
+
+
+class MetricsExporter:
+    def __init__(self, host="127.0.0.1", port=DEFAULT_PORT):
+        """Serves the memory samples in the OpenMetrics text format from an HTTP endpoint running on background
+        threads. The GUI publishes a payload rendered once per tick, and requests only send the latest payload, so a
+        scrape never waits on the GUI, never touches Qt or Nuke and never slows sampling down.
+        @param (str) host:
+        The address to listen on. Defaults to the local machine only.
+        @param (int) port:
+        The port to listen on, or 0 to pick a free one.
+        @return (None):
+        No return value.
+        """
+        self.host = host
+        self.requested_port = port
+        self.payload = b"# EOF\n"
+        self._server = None
+        self._thread = None
+
+    @property
+    def port(self):
+        """The port actually listened on, or None if the exporter is stopped.
+        """
+        if self._server is None:
+            return None
+        return self._server.server_address[1]
+
+    @property
+    def running(self):
+        return self._server is not None
+
+    def publish(self, snapshot, summary, count):
+        """Renders a new payload for the next scrapes.
+        @param (MemorySnapshot) snapshot:
+        The latest sample.
+        @param (dict) summary:
+        The rolling statistics of the memory usage, in MB.
+        @param (int) count:
+        The number of samples captured since the monitor started.
+        @return (None):
+        No return value.
+        """
+        if self._server is not None:
+            self.payload = format_metrics(snapshot, summary, count)
+
+    def start(self):
+        """Binds the endpoint and starts serving. Raises OSError if the port is taken.
+        """
+        if self._server is not None:
+            return
+        server = _MetricsServer((self.host, self.requested_port), _MetricsHandler)
+        server.exporter = self
+        self._server = server
+        self._thread = threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.2},
+                                        name="memoryMonitor-metrics")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stops serving and releases the port.
+        """
+        server = self._server
+        if server is None:
+            return
+        self._server = None
+        server.shutdown()
+        server.server_close()
+        self._thread.join()
+        self._thread = None
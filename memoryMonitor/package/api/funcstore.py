@@ -1,20 +1,195 @@
 from functools import reduce
 import datetime
+import time
 import nuke
+from package.api.memoryinfo import MEMORY_INFO
+from package.api.procmem import PROC, PROC_FIELDS
+from package.api.profiler import PROFILER
+from package.api.pyheap import HEAP
+from package.api.samplestore import MAX_WINDOW
+
+
+# Offset between the epoch and the monotonic clock, measured once so timestamps keep epoch meaning but never go back.
+_EPOCH_OFFSET = time.time() - time.monotonic()
+
+# Metrics of a snapshot stored as columns of the Monitor samples, in MB. Storing another one only takes its name here.
+METRICS = ('usage', 'max_usage', 'python_heap') + PROC_FIELDS
+
+# Source replacing Nuke memory counters and the clock, such as a replayed trace or a synthetic curve. None for Nuke.
+_memory_source = None
+
+
+def set_memory_source(source):
+    """Makes the monitor read memory counters and time from a replay source instead of Nuke and the system clock.
+    @param (ReplaySource) source:
+    The source, or None to go back to Nuke.
+    @return (None):
+    No return value.
+    """
+    global _memory_source
+    _memory_source = source
+
+
+def memory_source():
+    """Returns the replay source in use, or None when memory is read from Nuke.
+    """
+    return _memory_source
 
 
 def nk_value(element):
-    """Retrieve a value from Nuke memory info and return it as a rounded MB one.
+    """Retrieve a value from Nuke memory info, or from the replay source if one is set, and return it as a rounded MB
+    one.
     @param (str) element:
     The name of the info this function needs to retrieve.
     @return (float) round_data:
     The memory value, expressed in MB.
     """
-    data = (nuke.memory(element)) * 0.000001
-    round_data = round(data, 2)
+    start = PROFILER.start()
+    source = _memory_source
+    if source is not None:
+        round_data = round(source.memory(element), 2)
+    else:
+        data = (nuke.memory(element)) * 0.000001
+        round_data = round(data, 2)
+    PROFILER.stop("nk_value", start)
     return round_data
 
 
+def timestamp():
+    """Returns the current time as epoch seconds, derived from the monotonic clock so that successive samples are
+    always ordered, even if the system clock is adjusted during the session.
+    @return (float) timestamp:
+    The current time, expressed in seconds since the epoch, or the accelerated time of the replay source if one is
+    set.
+    """
+    source = _memory_source
+    if source is not None:
+        return source.timestamp()
+    return _EPOCH_OFFSET + time.monotonic()
+
+
+class MemorySnapshot:
+    def __init__(self, timestamp, usage, max_usage, total_ram, latency=0.0, python_heap=0.0):
+        """Every Nuke memory statistic the monitor uses, captured together once per sample. Consumers read the latest
+        snapshot instead of querying Nuke, so hovering or toggling a setting never calls into Nuke.
+        @param (float) timestamp:
+        The capture time, in epoch seconds.
+        @param (float) usage:
+        The memory used by Nuke, in MB.
+        @param (float) max_usage:
+        The maximum memory Nuke may allocate, in MB.
+        @param (float) total_ram:
+        The total RAM of the system, in MB.
+        @param (float) latency:
+        The time the capture took, in seconds.
+        @param (float) python_heap:
+        The size of the Python heap traced by tracemalloc, in MB, or 0 while it isn't tracked.
+        @return (None):
+        No return value.
+        """
+        self.timestamp = timestamp
+        self.usage = usage
+        self.max_usage = max_usage
+        self.total_ram = total_ram
+        self.latency = latency
+        self.python_heap = python_heap
+        # Process metrics read from /proc, in MB, left at zero where it is unavailable or while replaying.
+        self.rss = 0.0
+        self.pss = 0.0
+        self.anon = 0.0
+        self.swap = 0.0
+        # Breakdown of the nuke.memory('info') report, or None while it isn't read.
+        self.breakdown = None
+
+    @classmethod
+    def capture(cls):
+        """Queries Nuke and publishes the result as the latest snapshot. Safe to call from the sampling thread, as it
+        only reads Nuke memory counters.
+        @return (MemorySnapshot) snapshot:
+        The new snapshot.
+        """
+        global _latest_snapshot
+        start = time.perf_counter()
+        snapshot = cls(timestamp(), nk_value('usage'), nk_value('max_usage'), nk_value('total_ram'))
+        snapshot.latency = time.perf_counter() - start
+        if PROC.available and _memory_source is None:
+            start = PROFILER.start()
+            snapshot.rss, snapshot.pss, snapshot.anon, snapshot.swap = PROC.read()
+            PROFILER.stop("proc", start)
+        if MEMORY_INFO.enabled and _memory_source is None:
+            start = PROFILER.start()
+            snapshot.breakdown = MEMORY_INFO.read()
+            PROFILER.stop("memory_info", start)
+        if PROFILER.enabled:
+            PROFILER.record("capture", snapshot.latency)
+        if HEAP.tracing:
+            start = PROFILER.start()
+            snapshot.python_heap = HEAP.sample(snapshot.timestamp)
+            PROFILER.stop("python_heap", start)
+        _latest_snapshot = snapshot
+        return snapshot
+
+    @property
+    def usage_ratio(self):
+        """The share of the memory Nuke may allocate that is in use, between 0 and 1.
+        """
+        if not self.max_usage:
+            return 0.0
+        return self.usage / self.max_usage
+
+    def record(self):
+        """Returns the snapshot as the base fields of a trace record: timestamp, usage and max_usage.
+        """
+        return self.timestamp, self.usage, self.max_usage
+
+    def metrics(self):
+        """Returns the values of METRICS, keyed by name, as appended to the sample store.
+        """
+        return dict((name, getattr(self, name)) for name in METRICS)
+
+    def proc_record(self):
+        """Returns the process metrics, in the order of PROC_FIELDS, as recorded after the base fields of a trace.
+        """
+        return self.rss, self.pss, self.anon, self.swap
+
+
+_latest_snapshot = None
+
+
+def latest_snapshot():
+    """Returns the most recent snapshot. Nuke is only queried if nothing has been captured yet.
+    @return (MemorySnapshot) snapshot:
+    The latest snapshot.
+    """
+    return _latest_snapshot or MemorySnapshot.capture()
+
+
+def format_timestamp(ts):
+    """Formats a sample timestamp the way it is displayed in the monitor tooltips.
+    @param (float) ts:
+    A timestamp, expressed in seconds since the epoch.
+    @return (str) formatted_dt:
+    The local date and time of the timestamp.
+    """
+    return datetime.datetime.fromtimestamp(ts).strftime("%x - %X")
+
+
+def format_duration(seconds):
+    """Formats a duration for display, down to the minute, or to the second under a minute.
+    @param (float) seconds:
+    The duration, in seconds.
+    @return (str) formatted_duration:
+    The duration, such as "2h 05m" or "42s".
+    """
+    seconds = int(seconds)
+    if seconds < 60:
+        return "{0:d}s".format(seconds)
+    hours, minutes = divmod(seconds // 60, 60)
+    if not hours:
+        return "{0:d}m".format(minutes)
+    return "{0:d}h {1:02d}m".format(hours, minutes)
+
+
 def ram_percentage(n):
     """Returns a percentage of a number against the total RAM allocated by Nuke.
     @param (float) n:
@@ -22,21 +197,25 @@ def ram_percentage(n):
     @return (float) round_percentage:
     The percentage of total RAM allocated used by user.
     """
-    total_ram = nk_value('max_usage')
+    total_ram = latest_snapshot().max_usage
     percentage = (n / total_ram) * 100
     round_percentage = round(percentage, 2)
     return round_percentage
 
 
-def find_multiplier(n):
+def find_multiplier(n, limit=None):
     """Takes a number and returns a factor to be used for monitor chart ticks.
     @param (int) n:
     Number.
+    @param (int) limit:
+    If given, the factor returned is the largest one not exceeding it.
     @return (int) factors_list[x]:
     The factor deemed appropriate for use.
     """
     factors_list = sorted(reduce(list.__add__,
                                  ([i, n // i] for i in range(1, int(n ** 0.5) + 1) if n % i == 0)))
+    if limit is not None:
+        return [factor for factor in factors_list if factor <= limit][-1]
     if len(factors_list) <= 3:
         return factors_list[-1]
     else:
@@ -44,51 +223,62 @@ def find_multiplier(n):
 
 
 class ListsModifier:
-    def __init__(self, mem_list, dt_list, max_int):
-        """A class to modify Monitor memory and date time lists.
-        @param (list) mem_list:
-        Monitor's memory list.
-        @param (list) dt_list:
-        Monitor's date-time list.
+    def __init__(self, store, max_int):
+        """A class to update and window the Monitor sample store.
+        @param (SampleStore) store:
+        Monitor's sample store.
         @param (int) max_int:
-        Monitor's maximum allowance for the length of both lists.
+        Monitor's maximum sample number. The displayed window holds max_int + 1 samples.
         @return (None):
         No return value.
         """
-        self.mem_list = mem_list
-        self.dt_list = dt_list
+        self.store = store
         self.max_int = max_int
 
     def update(self):
-        """Update method that will append both lists with 'usage' memory value and current date time.
-        If the lists lengths are higher than max_int, the function will delete the first elements in the lists
-        before appending new ones.
+        """Update method that will append the store with 'usage' memory value and current time. Once the store is
+        full, the oldest sample is overwritten in constant time.
         """
-        length = len(self.mem_list) - 1
-        current_dt = datetime.datetime.now().strftime("%x - %X")
-        if length <= self.max_int:
-            self.mem_list.append(nk_value('usage'))
-            self.dt_list.append(current_dt)
-        else:
-            self.mem_list.pop(0)
-            self.dt_list.pop(0)
-            self.update()
+        self.extend([MemorySnapshot.capture()])
+
+    def extend(self, samples):
+        """Appends samples captured beforehand, such as the ones drained from a background Sampler. The categories of
+        the memory breakdown are stored as columns too, added as they show up in the reports.
+        @param (list) samples:
+        A list of MemorySnapshot, oldest first.
+        @return (None):
+        No return value.
+        """
+        start = PROFILER.start()
+        columns = self.store.columns
+        for snapshot in samples:
+            values = snapshot.metrics()
+            breakdown = snapshot.breakdown
+            if breakdown is not None:
+                for name in breakdown.columns:
+                    if name not in columns:
+                        self.store.add_column(name)
+                        columns = self.store.columns
+                values.update(breakdown.columns)
+            self.store.append(snapshot.timestamp, **values)
+        PROFILER.stop("store", start)
 
     def resize(self):
-        """To be invoked if the user change the maximum allowance number aka the max sample number. If the lists
-        lengths are higher than the new max number, the function will delete members of the lists starting by the
-        first ones. If the lists lengths are lower, then both lists will be appended with blank values until their
-        lengths match the new max number
+        """To be invoked if the user change the maximum allowance number aka the max sample number. Nothing is moved
+        or deleted: the store keeps its whole history, and the part of a window older than it is drawn from the
+        history tiers, so the window is only clamped to MAX_WINDOW.
+        @return (tuple) window:
+        Zero-copy views over the timestamps and memory values of the full rate part of the window, oldest first.
+        """
+        self.max_int = min(self.max_int, MAX_WINDOW - 1)
+        return self.window()
+
+    def window(self, name='usage'):
+        """Returns the samples currently displayed by the Monitor.
+        @param (str) name:
+        The metric column to return with the timestamps.
+        @return (tuple) window:
+        Zero-copy views over the timestamps and metric values of the window, oldest first.
         """
-        if len(self.mem_list) > (self.max_int + 1):
-            while len(self.mem_list) > (self.max_int + 1):
-                self.mem_list.pop(0)
-                self.dt_list.pop(0)
-                if len(self.mem_list) == (self.max_int + 1):
-                    break
-        elif len(self.mem_list) < (self.max_int + 1):
-            while len(self.mem_list) < (self.max_int + 1):
-                self.mem_list.append(0)
-                self.dt_list.append("---")
-                if len(self.mem_list) == (self.max_int + 1):
-                    break
+        count = self.max_int + 1
+        return self.store.timestamps.view(count), self.store.view(name, count)
@@ -0,0 +1,160 @@
+import threading
+import nuke
+from package.api.nodememory import split_size
+
+
+# Prefix of the sample store columns holding the memory of a category of the report, such as "info:Caches".
+COLUMN_PREFIX = "info:"
+# Number of sample store columns the categories are stored in. Each column holds a full history, so the categories
+# showing up once this many have one share the last column, under OTHER.
+MAX_COLUMNS = 8
+OTHER = "Other"
+# Start of the labels of the lines summing others up, which are left out of the categories.
+TOTAL = "total"
+
+
+class MemoryBreakdown:
+    def __init__(self, entries, categories, changes, columns):
+        """The structured content of a nuke.memory('info') report.
+        A line is a category when the lines after it are indented further, and the first level of categories makes
+        the breakdown. A category is worth the size written on its own line if any, or the sum of the sizes nested in
+        it otherwise. Sizes written on lines outside of any category, and totals wherever they are, are kept as entries
+        but belong to no category, so that the categories can be stacked without counting anything twice.
+        @param (dict) entries:
+        The sizes of the report, in MB, keyed by (category, label) where label is the path of the line below the
+        category. The category is an empty string for lines outside of any category.
+        @param (dict) categories:
+        The size of every category, in MB, in the order of the report.
+        @param (dict) changes:
+        The difference of every entry which changed since the previous report, in MB.
+        @param (dict) columns:
+        The category sizes keyed by sample store column, such as "info:Caches", as appended with every sample.
+        @return (None):
+        No return value.
+        """
+        self.entries = entries
+        self.categories = categories
+        self.changes = changes
+        self.columns = columns
+
+    def caches(self):
+        """Returns the entries standing for a cache, those whose category or label mentions one, keyed by label.
+        """
+        return dict(("{0:s} / {1:s}".format(category, label) if category else label, size)
+                    for (category, label), size in self.entries.items()
+                    if "cache" in category.lower() or "cache" in label.lower())
+
+
+class MemoryInfoParser:
+    def __init__(self):
+        """Parses the nuke.memory('info') reports into MemoryBreakdown objects, reusing the work done on the previous
+        report: an identical report gives the previous breakdown back, and only the lines which weren't in the
+        previous report go through the size pattern, so that consecutive reports, which mostly differ by a few sizes,
+        cost a dictionary lookup per line.
+        Samples are captured both on the sampling thread and on the GUI thread, so parsing, which reads and replaces
+        this state, is serialized by a lock.
+        @return (None):
+        No return value.
+        """
+        self.enabled = False
+        self.latest = None
+        self._text = None
+        self._lines = {}
+        # Sample store column of every category met so far.
+        self._columns = {}
+        self._lock = threading.Lock()
+
+    def read(self):
+        """Queries Nuke for a report and parses it. Safe to call from any thread.
+        @return (MemoryBreakdown) breakdown:
+        The breakdown of the report.
+        """
+        return self.parse(nuke.memory('info'))
+
+    def parse(self, text):
+        """Parses a report, and diffs it with the previous one.
+        @param (str) text:
+        The report.
+        @return (MemoryBreakdown) breakdown:
+        The breakdown of the report.
+        """
+        with self._lock:
+            return self._parse(text)
+
+    def _parse(self, text):
+        if text == self._text and self.latest is not None:
+            if self.latest.changes:
+                self.latest = MemoryBreakdown(self.latest.entries, self.latest.categories, {}, self.latest.columns)
+            return self.latest
+
+        cache = self._lines
+        lines = {}
+        parsed = []
+        for line in text.splitlines():
+            entry = cache.get(line)
+            if entry is None:
+                stripped = line.lstrip()
+                if not stripped:
+                    continue
+                entry = (len(line) - len(stripped),) + split_size(stripped)
+            lines[line] = entry
+            parsed.append(entry)
+
+        entries = {}
+        categories = {}
+        sums = {}
+        headers = []
+        count = len(parsed)
+        for index, (indent, label, size) in enumerate(parsed):
+            while headers and headers[-1][0] >= indent:
+                headers.pop()
+            if index + 1 < count and parsed[index + 1][0] > indent:
+                if not headers:
+                    categories[label] = size
+                    sums[label] = None
+                headers.append((indent, label))
+                continue
+            if size is None:
+                continue
+            if not headers or label.lower().startswith(TOTAL):
+                entries[("", label)] = size
+                continue
+            category = headers[0][1]
+            path = " / ".join([header[1] for header in headers[1:]] + [label])
+            entries[(category, path)] = size
+            sums[category] = (sums[category] or 0.0) + size
+        for category, size in list(categories.items()):
+            if size is not None:
+                continue
+            if sums[category] is None:
+                # Nothing but totals in it.
+                del categories[category]
+            else:
+                categories[category] = sums[category]
+
+        previous = self.latest.entries if self.latest is not None else {}
+        changes = {}
+        for key, size in entries.items():
+            difference = size - previous.get(key, 0.0)
+            if difference:
+                changes[key] = difference
+        for key, size in previous.items():
+            if key not in entries:
+                changes[key] = -size
+
+        columns = {}
+        for category, size in categories.items():
+            column = self._columns.get(category)
+            if column is None:
+                column = COLUMN_PREFIX + (category if len(self._columns) < MAX_COLUMNS - 1 else OTHER)
+                self._columns[category] = column
+            columns[column] = columns.get(column, 0.0) + size
+
+        self._text = text
+        self._lines = lines
+        self.latest = MemoryBreakdown(entries, categories, changes, columns)
+        return self.latest
+
+
+# Parser shared by the monitor modules. Nuke is only asked for reports once the breakdown is enabled.
+MEMORY_INFO = MemoryInfoParser()
@@ -0,0 +1,127 @@
+import heapq
+import re
+import time
+import nuke
+from package.api.samplestore import RingBuffer
+
+
+# Number of values kept in the sparkline of a node.
+SPARKLINE_LENGTH = 32
+# Time a collection step may spend querying nodes, in seconds, so that large scripts are spread over several ticks.
+STEP_BUDGET = 0.004
+
+# Multipliers turning the units of Nuke memory reports into MB.
+_UNITS = {'b': 0.000001, 'byte': 0.000001, 'bytes': 0.000001, 'k': 0.001, 'kb': 0.001, 'kib': 0.001024,
+          'm': 1.0, 'mb': 1.0, 'mib': 1.048576, 'g': 1000.0, 'gb': 1000.0, 'gib': 1073.741824}
+_SIZE_PATTERN = re.compile(r"([0-9][0-9.,]*)\s*(bytes|byte|kib|mib|gib|kb|mb|gb|[bkmg])\b", re.IGNORECASE)
+
+
+def parse_size(text):
+    """Reads the first memory size of a Nuke memory report, such as "12.5 MB" or "1048576 bytes".
+    @param (str) text:
+    The report.
+    @return (float) size:
+    The size, expressed in MB, or 0 if the report holds none.
+    """
+    match = _SIZE_PATTERN.search(text)
+    if match is None:
+        return 0.0
+    return float(match.group(1).replace(",", "")) * _UNITS[match.group(2).lower()]
+
+
+def split_size(line):
+    """Splits a line of a Nuke memory report into its label and the first memory size it holds, such as
+    "Buffers: 12.5 MB".
+    @param (str) line:
+    The line, without its indentation.
+    @return (tuple) entry:
+    The label, stripped of separators, and the size, expressed in MB, or None if the line holds no size.
+    """
+    match = _SIZE_PATTERN.search(line)
+    if match is None:
+        return line.strip(" \t:-="), None
+    label = line[:match.start()].strip(" \t:-=") or line[match.end():].strip(" \t:-=()")
+    return label, float(match.group(1).replace(",", "")) * _UNITS[match.group(2).lower()]
+
+
+def node_memory(node):
+    """Returns the memory a node holds, as reported by nuke.memory('info', node).
+    @param (Node) node:
+    The node to query.
+    @return (float) size:
+    The memory held by the node, in MB.
+    """
+    return parse_size(nuke.memory('info', node.fullName()))
+
+
+class NodeMemoryCollector:
+    def __init__(self, top_n=20, budget=STEP_BUDGET):
+        """Collects per-node memory usage across the script over several ticks and keeps the top consumers. Nodes are
+        pushed one by one into a bounded min-heap during a sweep, so finding the top N costs O(log N) per node instead
+        of sorting every node. Sparklines are only kept for the nodes currently in the top N.
+        @param (int) top_n:
+        The number of top consumers to keep.
+        @param (float) budget:
+        The time a step may spend querying nodes, in seconds.
+        @return (None):
+        No return value.
+        """
+        self.top_n = top_n
+        self.budget = budget
+        self.top = []
+        self.sparklines = {}
+        self._nodes = []
+        self._position = 0
+        self._heap = []
+
+    @property
+    def sweeping(self):
+        return self._position < len(self._nodes)
+
+    def step(self):
+        """Queries as many nodes as the time budget allows, starting a new sweep if the previous one is over.
+        @return (bool) swept:
+        True if this step completed a sweep, in which case the top consumers have been updated.
+        """
+        if not self.sweeping:
+            self._nodes = nuke.allNodes(recurseGroups=True)
+            self._position = 0
+            self._heap = []
+        deadline = time.perf_counter() + self.budget
+        nodes = self._nodes
+        heap = self._heap
+        while self._position < len(nodes) and time.perf_counter() < deadline:
+            node = nodes[self._position]
+            self._position += 1
+            try:
+                name = node.fullName()
+                value = node_memory(node)
+            except ValueError:
+                # The node has been deleted since the sweep started.
+                continue
+            sparkline = self.sparklines.get(name)
+            if sparkline is not None:
+                sparkline.append(value)
+            if len(heap) < self.top_n:
+                heapq.heappush(heap, (value, name))
+            elif value > heap[0][0]:
+                heapq.heapreplace(heap, (value, name))
+        if self.sweeping:
+            return False
+        self._finish_sweep()
+        return True
+
+    def _finish_sweep(self):
+        """Publishes the top consumers of the sweep and only keeps the sparklines of those nodes.
+        """
+        self.top = sorted(self._heap, reverse=True)
+        sparklines = {}
+        for value, name in self.top:
+            sparkline = self.sparklines.get(name)
+            if sparkline is None:
+                sparkline = RingBuffer(SPARKLINE_LENGTH)
+                sparkline.append(value)
+            sparklines[name] = sparkline
+        self.sparklines = sparklines
+        self._nodes = []
+        self._position = 0
@@ -0,0 +1,492 @@
+from PySide2 import QtCore, QtGui, QtWidgets
+
+
+# Space between the parts of the plot (title, axis titles, labels and plot area), in pixels.
+PADDING = 8
+# Text drawn to size the room left for the Y axis labels.
+LABEL_SIZING_TEXT = "000000"
+# Smallest spacing between two markers, as a fraction of their size, for them to be drawn. Closer markers overlap into
+# a solid band telling nothing more than the line, and cost far more to rasterize.
+MARKER_SPACING = 0.5
+
+
+class PlotAxis:
+    def __init__(self, plot, title, vertical):
+        """An axis of a PlotItem. It answers the QValueAxis calls the monitor makes, so that the monitor drives both of
+        its renderers the same way.
+        @param (PlotItem) plot:
+        The item drawing the axis.
+        @param (str) title:
+        The axis title.
+        @param (bool) vertical:
+        True for the Y axis, False for the X axis.
+        @return (None):
+        No return value.
+        """
+        self._plot = plot
+        self.title = title
+        self.vertical = vertical
+        self.minimum = 0.0
+        self.maximum = 1.0
+        self.tick_count = 5
+        self.minor_tick_count = 0
+        self.grid_pen = QtGui.QPen(QtGui.QColor(90, 90, 90))
+        self.minor_grid_pen = QtGui.QPen(QtGui.QColor(50, 50, 50))
+        self.labels_pen = QtGui.QPen(QtGui.QColor("grey"))
+        self.title_pen = QtGui.QPen(QtGui.QColor("lightGrey"))
+
+    def min(self):
+        return self.minimum
+
+    def max(self):
+        return self.maximum
+
+    def setRange(self, minimum, maximum):
+        if minimum != self.minimum or maximum != self.maximum:
+            self.minimum = minimum
+            self.maximum = maximum
+            self._plot.invalidate()
+
+    def setTickCount(self, count):
+        if count != self.tick_count:
+            self.tick_count = count
+            self._plot.invalidate()
+
+    def setMinorTickCount(self, count):
+        if count != self.minor_tick_count:
+            self.minor_tick_count = count
+            self._plot.invalidate()
+
+    def setTitleText(self, title):
+        self.title = title
+        self._plot.restyle()
+
+    def setGridLineColor(self, color):
+        self.grid_pen.setColor(color)
+        self._plot.restyle()
+
+    def setMinorGridLineColor(self, color):
+        self.minor_grid_pen.setColor(color)
+        self._plot.restyle()
+
+    def setLabelsColor(self, color):
+        self.labels_pen.setColor(color)
+        self._plot.restyle()
+
+    def setTitleBrush(self, brush):
+        self.title_pen.setColor(brush.color())
+        self._plot.restyle()
+
+    def ticks(self):
+        """Returns the major tick values, from the minimum to the maximum, and the minor tick values between them.
+        """
+        count = max(self.tick_count, 2)
+        step = (self.maximum - self.minimum) / float(count - 1)
+        major = [self.minimum + step * tick for tick in range(count)]
+        minor = []
+        for value in major[:-1]:
+            for tick in range(1, self.minor_tick_count + 1):
+                minor.append(value + step * tick / float(self.minor_tick_count + 1))
+        return major, minor
+
+
+class PlotSeries:
+    def __init__(self, plot, pen=None, marker=None, marker_size=0, upper=None, axis_y=None):
+        """A series of a PlotItem: a polyline, a marker on each point, or the area under another series. Like the axes,
+        it answers the QtCharts calls the monitor makes. Points are kept in chart values and mapped to pixels in one go
+        when painted.
+        @param (PlotItem) plot:
+        The item drawing the series.
+        @param (QPen) pen:
+        The pen of the polyline, or of the marker borders. None draws no line.
+        @param (str) marker:
+        None to draw a polyline, "circle" or "square" to draw a marker on each point.
+        @param (int) marker_size:
+        The size of the markers, in pixels.
+        @param (PlotSeries) upper:
+        For an area, the series drawn as its upper boundary.
+        @param (PlotAxis) axis_y:
+        The Y axis the series is plotted against, one added with add_axis(), or None for the Y axis of the plot.
+        @return (None):
+        No return value.
+        """
+        self._plot = plot
+        self.pen = QtGui.QPen(pen) if pen is not None else QtGui.QPen(QtCore.Qt.NoPen)
+        self.brush = QtGui.QBrush()
+        self.marker = marker
+        self.marker_size = marker_size
+        self.upper = upper
+        self.axis_y = axis_y
+        self.area = None
+        self.visible = True
+        self.points = QtGui.QPolygonF()
+        self._stamp = None
+        if upper is not None:
+            upper.area = self
+
+    def replace(self, points):
+        """Replaces the points of the series and repaints the region they cover, before and after.
+        @param (list) points:
+        The new points, as QPointF in chart values.
+        @return (None):
+        No return value.
+        """
+        points = QtGui.QPolygonF(points)
+        dirty = self._plot.series_rect(self, self.points)
+        self.points = points
+        self._plot.update(dirty.united(self._plot.series_rect(self, points)))
+
+    def clear(self):
+        if not self.points.isEmpty():
+            self.replace([])
+
+    def setColor(self, color):
+        if self.marker is None:
+            self.pen.setColor(color)
+        else:
+            self.brush = QtGui.QBrush(color)
+        self._stamp = None
+        self._plot.update()
+
+    def setBorderColor(self, color):
+        self.pen.setColor(color)
+        self._stamp = None
+        self._plot.update()
+
+    def isVisible(self):
+        return self.visible
+
+    def setVisible(self, visible):
+        if visible != self.visible:
+            self.visible = visible
+            self._plot.update()
+
+    def setBrush(self, brush):
+        self.brush = QtGui.QBrush(brush)
+        self._plot.update()
+
+    def setPen(self, pen):
+        self.pen = QtGui.QPen(pen)
+        self._stamp = None
+        self._plot.update()
+
+    def stamp(self, ratio):
+        """Returns the marker painted once in a pixmap, which is then copied on every point instead of rasterizing
+        each marker again.
+        @param (float) ratio:
+        The device pixel ratio of the paint device.
+        @return (QPixmap) stamp:
+        The marker, centered in a pixmap a pixel wider than it on each side.
+        """
+        if self._stamp is not None and self._stamp.devicePixelRatio() == ratio:
+            return self._stamp
+        size = self.marker_size + 2
+        stamp = QtGui.QPixmap(int(size * ratio), int(size * ratio))
+        stamp.setDevicePixelRatio(ratio)
+        stamp.fill(QtCore.Qt.transparent)
+        painter = QtGui.QPainter(stamp)
+        painter.setRenderHint(QtGui.QPainter.Antialiasing)
+        painter.setPen(self.pen)
+        painter.setBrush(self.brush)
+        if self.marker == "circle":
+            painter.drawEllipse(QtCore.QRectF(1, 1, self.marker_size, self.marker_size))
+        else:
+            painter.drawRect(QtCore.QRectF(1, 1, self.marker_size, self.marker_size))
+        painter.end()
+        self._stamp = stamp
+        return stamp
+
+
+class PlotItem(QtWidgets.QGraphicsItem):
+    def __init__(self, parent=None):
+        """A lightweight replacement of the QChart of the monitor, painting the area, line, markers, grid and axes with
+        a few QPainter calls. Each series is drawn in a single pass, from a polygon mapped to pixels in one call, and
+        replacing the points of a series only repaints the region they cover. The background, grid and axes are painted
+        once in a pixmap, which redraws only copy, until a range, size or color changes. The item answers the QChart
+        calls the monitor makes: mapToPosition, mapToValue, plotArea, resize, size, setTitle and setBackgroundBrush.
+        Series may be plotted against Y axes of their own, laid out on the right of the plot area.
+        @param (QGraphicsItem) parent:
+        The parent item.
+        @return (None):
+        No return value.
+        """
+        QtWidgets.QGraphicsItem.__init__(self, parent)
+        self.setFlag(QtWidgets.QGraphicsItem.ItemUsesExtendedStyleOption)
+        self._size = QtCore.QSizeF(640, 480)
+        self._title = ""
+        self._background = QtGui.QBrush(QtGui.QColor("black"))
+        self.title_font = QtGui.QFont("Calibri", 10)
+        self.title_pen = QtGui.QPen(QtGui.QColor("lightGrey"))
+        self.axis_title_font = QtGui.QFont("Calibri", 14, QtGui.QFont.Bold)
+        self.labels_font = QtGui.QFont("Calibri", 10, QtGui.QFont.Bold)
+
+        self.axis_x = PlotAxis(self, "", False)
+        self.axis_y = PlotAxis(self, "", True)
+        # Y axes added on the right of the plot area, for the series plotted against a scale of their own.
+        self.axes = []
+        self.series = []
+
+        title_height = QtGui.QFontMetrics(self.title_font).height()
+        axis_title_height = QtGui.QFontMetrics(self.axis_title_font).height()
+        labels = QtGui.QFontMetrics(self.labels_font)
+        self._label_size = QtCore.QSizeF(labels.boundingRect(LABEL_SIZING_TEXT).width(), labels.height())
+        self._margins = (PADDING * 3 + axis_title_height + self._label_size.width(), PADDING * 2 + title_height,
+                         PADDING * 3, PADDING * 3 + axis_title_height + self._label_size.height())
+        self._axis_width = PADDING * 2 + axis_title_height + self._label_size.width()
+        self._area = QtCore.QRectF()
+        self._transforms = {}
+        self._layer = None
+        self.layout_area()
+
+    def add_series(self, series, index=None):
+        """Adds a series, drawn over the ones added before it.
+        @param (PlotSeries) series:
+        The series.
+        @param (int) index:
+        The position of the series in the drawing order, to draw it under series added before. Last if None.
+        @return (PlotSeries) series:
+        The same series.
+        """
+        if index is None:
+            self.series.append(series)
+        else:
+            self.series.insert(index, series)
+            self.update()
+        return series
+
+    def remove_series(self, series):
+        self.series.remove(series)
+        self.update()
+
+    def add_axis(self, title):
+        """Adds a Y axis on the right of the plot area, which narrows to make room for it.
+        @param (str) title:
+        The axis title.
+        @return (PlotAxis) axis:
+        The new axis, to be given to the series plotted against it.
+        """
+        axis = PlotAxis(self, title, True)
+        self.axes.append(axis)
+        self.layout_area()
+        self.invalidate()
+        return axis
+
+    def remove_axis(self, axis):
+        self.axes.remove(axis)
+        self.layout_area()
+        self.invalidate()
+
+    def boundingRect(self):
+        return QtCore.QRectF(QtCore.QPointF(0, 0), self._size)
+
+    def size(self):
+        return QtCore.QSizeF(self._size)
+
+    def resize(self, size):
+        self.prepareGeometryChange()
+        self._size = QtCore.QSizeF(size)
+        self.layout_area()
+        self.invalidate()
+
+    def layout_area(self):
+        left, top, right, bottom = self._margins
+        right += len(self.axes) * self._axis_width
+        self._area = QtCore.QRectF(left, top, max(self._size.width() - left - right, 1.0),
+                                   max(self._size.height() - top - bottom, 1.0))
+
+    def plotArea(self):
+        return QtCore.QRectF(self._area)
+
+    def setTitle(self, title):
+        if title != self._title:
+            self._title = title
+            self.update(QtCore.QRectF(0, 0, self._size.width(), self._area.top()))
+
+    def setBackgroundBrush(self, brush):
+        self._background = QtGui.QBrush(brush)
+        self.restyle()
+
+    def restyle(self):
+        """Drops the background layer painted with the previous colors, and repaints the whole item.
+        """
+        self._layer = None
+        self.update()
+
+    def invalidate(self):
+        """Drops the mapping and the background layer computed for the previous ranges or size, and repaints the whole
+        item.
+        """
+        self._transforms = {}
+        self._layer = None
+        self.update()
+
+    def transform_to_position(self, axis_y=None):
+        """Returns the transform mapping chart values to item pixels, computed once per range or size change.
+        @param (PlotAxis) axis_y:
+        The Y axis of the values, or None for the Y axis of the plot.
+        @return (QTransform) transform:
+        The transform.
+        """
+        axis_y = axis_y or self.axis_y
+        transform = self._transforms.get(axis_y)
+        if transform is None:
+            x_span = (self.axis_x.maximum - self.axis_x.minimum) or 1.0
+            y_span = (axis_y.maximum - axis_y.minimum) or 1.0
+            scale_x = self._area.width() / x_span
+            scale_y = -self._area.height() / y_span
+            transform = QtGui.QTransform(scale_x, 0, 0, scale_y, self._area.left() - self.axis_x.minimum * scale_x,
+                                         self._area.bottom() - axis_y.minimum * scale_y)
+            self._transforms[axis_y] = transform
+        return transform
+
+    def mapToPosition(self, value):
+        return self.transform_to_position().map(QtCore.QPointF(value))
+
+    def mapToValue(self, position):
+        return self.transform_to_position().inverted()[0].map(QtCore.QPointF(position))
+
+    def series_rect(self, series, points):
+        """Returns the region covered by points of a series, in item pixels. The area under a series reaches down to
+        the bottom of the plot area.
+        """
+        if points.isEmpty():
+            return QtCore.QRectF()
+        margin = max(series.pen.widthF(), series.marker_size, 1.0) * 0.5 + 2.0
+        rect = self.transform_to_position(series.axis_y).map(points).boundingRect()
+        rect.adjust(-margin, -margin, margin, margin)
+        if series.area is not None:
+            rect.setBottom(self._area.bottom())
+        return rect
+
+    def layer(self, ratio):
+        """Returns the background, grid, axis labels and axis titles, painted once per range, size or color change.
+        @param (float) ratio:
+        The device pixel ratio of the paint device.
+        @return (QPixmap) layer:
+        The layer, the size of the item.
+        """
+        if self._layer is not None and self._layer.devicePixelRatio() == ratio:
+            return self._layer
+        area = self._area
+        transform = self.transform_to_position()
+        layer = QtGui.QPixmap(int(self._size.width() * ratio), int(self._size.height() * ratio))
+        layer.setDevicePixelRatio(ratio)
+        painter = QtGui.QPainter(layer)
+        painter.fillRect(self.boundingRect(), self._background)
+
+        width = self._label_size.width()
+        height = self._label_size.height()
+        painter.setFont(self.labels_font)
+        for axis in (self.axis_x, self.axis_y):
+            major, minor = axis.ticks()
+            for pen, values in ((axis.minor_grid_pen, minor), (axis.grid_pen, major)):
+                painter.setPen(pen)
+                if axis.vertical:
+                    positions = [transform.map(QtCore.QPointF(0, value)).y() for value in values]
+                    painter.drawLines([QtCore.QLineF(area.left(), y, area.right(), y) for y in positions])
+                else:
+                    positions = [transform.map(QtCore.QPointF(value, 0)).x() for value in values]
+                    painter.drawLines([QtCore.QLineF(x, area.top(), x, area.bottom()) for x in positions])
+            painter.setPen(axis.labels_pen)
+            for value in major:
+                text = "{0:g}".format(round(value, 1))
+                if axis.vertical:
+                    y = transform.map(QtCore.QPointF(0, value)).y()
+                    painter.drawText(QtCore.QRectF(area.left() - PADDING - width, y - height * 0.5, width, height),
+                                     QtCore.Qt.AlignRight | QtCore.Qt.AlignVCenter, text)
+                else:
+                    x = transform.map(QtCore.QPointF(value, 0)).x()
+                    painter.drawText(QtCore.QRectF(x - width, area.bottom() + PADDING * 0.5, width * 2, height),
+                                     QtCore.Qt.AlignHCenter | QtCore.Qt.AlignTop, text)
+
+        for index, axis in enumerate(self.axes):
+            left = area.right() + PADDING + index * self._axis_width
+            axis_transform = self.transform_to_position(axis)
+            painter.setPen(axis.labels_pen)
+            for value in axis.ticks()[0]:
+                y = axis_transform.map(QtCore.QPointF(0, value)).y()
+                painter.drawText(QtCore.QRectF(left, y - height * 0.5, width, height),
+                                 QtCore.Qt.AlignLeft | QtCore.Qt.AlignVCenter, "{0:g}".format(round(value, 1)))
+
+        painter.setRenderHint(QtGui.QPainter.Antialiasing)
+        painter.setFont(self.axis_title_font)
+        for index, axis in enumerate(self.axes):
+            painter.save()
+            painter.setPen(axis.title_pen)
+            painter.translate(area.right() + PADDING + width + index * self._axis_width, area.bottom())
+            painter.rotate(-90)
+            painter.drawText(QtCore.QRectF(0, 0, area.height(), self._axis_width - width - PADDING),
+                             QtCore.Qt.AlignHCenter | QtCore.Qt.AlignTop, axis.title)
+            painter.restore()
+        painter.setPen(self.axis_x.title_pen)
+        painter.drawText(QtCore.QRectF(area.left(), area.bottom(), area.width(),
+                                       self._size.height() - PADDING - area.bottom()),
+                         QtCore.Qt.AlignHCenter | QtCore.Qt.AlignBottom, self.axis_x.title)
+        painter.setPen(self.axis_y.title_pen)
+        painter.translate(PADDING, area.bottom())
+        painter.rotate(-90)
+        painter.drawText(QtCore.QRectF(0, 0, area.height(), self._margins[0]),
+                         QtCore.Qt.AlignHCenter | QtCore.Qt.AlignTop, self.axis_y.title)
+        painter.end()
+        self._layer = layer
+        return layer
+
+    def paint(self, painter, option, widget):
+        exposed = option.exposedRect
+        area = self._area
+        ratio = painter.device().devicePixelRatioF()
+        painter.drawPixmap(exposed, self.layer(ratio), QtCore.QRectF(exposed.x() * ratio, exposed.y() * ratio,
+                                                                     exposed.width() * ratio,
+                                                                     exposed.height() * ratio))
+        if exposed.top() < area.top():
+            painter.setFont(self.title_font)
+            painter.setPen(self.title_pen)
+            painter.drawText(QtCore.QRectF(0, PADDING, self._size.width(), area.top() - PADDING),
+                             QtCore.Qt.AlignCenter, self._title)
+        if exposed.intersects(area):
+            painter.save()
+            painter.setClipRect(area.intersected(exposed))
+            for series in self.series:
+                self.paint_series(painter, series, self.transform_to_position(series.axis_y))
+            painter.restore()
+
+    def paint_series(self, painter, series, transform):
+        """Paints a series from its points mapped to pixels in one call: a single polygon or polyline, or a copy of the
+        marker stamp on each point.
+        """
+        if not series.visible:
+            return
+        if series.upper is not None:
+            polygon = transform.map(series.upper.points)
+            if polygon.count() < 2 or series.brush.style() == QtCore.Qt.NoBrush:
+                return
+            baseline = transform.map(QtCore.QPointF(0, 0)).y()
+            polygon.append(QtCore.QPointF(polygon.last().x(), baseline))
+            polygon.append(QtCore.QPointF(polygon.first().x(), baseline))
+            # The upper edge is covered by the line of the upper series, so the fill goes without antialiasing.
+            painter.setRenderHint(QtGui.QPainter.Antialiasing, False)
+            painter.setPen(QtCore.Qt.NoPen)
+            painter.setBrush(series.brush)
+            painter.drawPolygon(polygon)
+            painter.setRenderHint(QtGui.QPainter.Antialiasing, True)
+            return
+        if series.points.isEmpty():
+            return
+        polygon = transform.map(series.points)
+        spacing = polygon.boundingRect().width() / (polygon.count() - 1) if polygon.count() > 1 else self._area.width()
+        if series.marker is None:
+            pen = series.pen
+            if spacing < pen.widthF():
+                # Points closer than the pen width already draw a solid band, which a one pixel pen draws several
+                # times faster.
+                pen = QtGui.QPen(pen)
+                pen.setWidth(0)
+            painter.setPen(pen)
+            painter.setBrush(QtCore.Qt.NoBrush)
+            painter.drawPolyline(polygon)
+        elif spacing >= series.marker_size * MARKER_SPACING:
+            stamp = series.stamp(painter.device().devicePixelRatioF())
+            offset = QtCore.QPointF(series.marker_size * 0.5 + 1, series.marker_size * 0.5 + 1)
+            draw = painter.drawPixmap
+            for point in polygon:
+                draw(point - offset, stamp)
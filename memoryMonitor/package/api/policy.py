@@ -0,0 +1,140 @@
+import collections
+import nuke
+from package.api.funcstore import MemorySnapshot
+
+
+# Number of policy actions remembered for the chart markers.
+ACTION_LOG_LENGTH = 256
+
+
+def clear_ram_cache():
+    """Clears the RAM cache of the viewer and nodes.
+    """
+    nuke.clearRAMCache()
+
+
+def free_buffers():
+    """Asks Nuke to release as many of its memory buffers as possible.
+    """
+    nuke.memory('free')
+
+
+def clear_disk_cache():
+    """Clears the disk cache, so that its buffers don't get paged back in.
+    """
+    nuke.clearDiskCache()
+
+
+class ThresholdRule:
+    def __init__(self, name, limit, actions, release=None, cooldown=60.0):
+        """A rule firing cache actions when memory usage crosses a share of max_usage. Once fired, the rule only re-arms
+        after usage went back below its release level (hysteresis) and never fires twice within its cooldown.
+        @param (str) name:
+        The rule name, displayed on the chart markers.
+        @param (float) limit:
+        The usage ratio of max_usage, between 0 and 1, at which the rule fires.
+        @param (list) actions:
+        The functions to call, in order, when the rule fires.
+        @param (float) release:
+        The usage ratio below which the rule re-arms. Defaults to ten points under the limit.
+        @param (float) cooldown:
+        The minimum time between two firings, in seconds.
+        @return (None):
+        No return value.
+        """
+        self.name = name
+        self.limit = limit
+        self.actions = actions
+        self.release = limit - 0.1 if release is None else release
+        self.cooldown = cooldown
+        self.armed = True
+        self.last_fired = None
+
+    def check(self, snapshot):
+        """Tells if the rule should fire for a snapshot, re-arming it first if usage went below the release level.
+        @param (MemorySnapshot) snapshot:
+        The sample to check.
+        @return (bool) fire:
+        True if the rule should fire.
+        """
+        ratio = snapshot.usage_ratio
+        if not self.armed:
+            if ratio > self.release:
+                return False
+            self.armed = True
+        if ratio < self.limit:
+            return False
+        return self.last_fired is None or snapshot.timestamp - self.last_fired >= self.cooldown
+
+
+class PolicyAction:
+    def __init__(self, rule, before, after):
+        """The record of a rule firing, kept to be displayed as a chart marker.
+        @param (str) rule:
+        The name of the rule that fired.
+        @param (MemorySnapshot) before:
+        The snapshot that made the rule fire.
+        @param (MemorySnapshot) after:
+        A snapshot captured right after the actions ran.
+        @return (None):
+        No return value.
+        """
+        self.rule = rule
+        self.timestamp = before.timestamp
+        self.before = before.usage
+        self.after = after.usage
+
+    @property
+    def reclaimed(self):
+        """The memory reclaimed by the actions, in MB.
+        """
+        return self.before - self.after
+
+
+def default_rules():
+    """Builds the default rules: a soft limit clearing the RAM cache at 80% of max_usage, and a hard limit at 92% also
+    freeing buffers and clearing the disk cache.
+    @return (list) rules:
+    The rules, from the softest to the hardest.
+    """
+    return [ThresholdRule("Soft limit", 0.8, [clear_ram_cache], release=0.7, cooldown=120.0),
+            ThresholdRule("Hard limit", 0.92, [clear_ram_cache, free_buffers, clear_disk_cache], release=0.8,
+                          cooldown=300.0)]
+
+
+class PolicyEngine:
+    def __init__(self, rules=None):
+        """Evaluates threshold rules on every sample and runs the cache actions of the ones that fire. Actions call into
+        Nuke, so evaluate() has to run on the main thread.
+        @param (list) rules:
+        The rules, from the softest to the hardest. Defaults to default_rules().
+        @return (None):
+        No return value.
+        """
+        self.rules = default_rules() if rules is None else rules
+        self.enabled = False
+        self.log = collections.deque(maxlen=ACTION_LOG_LENGTH)
+
+    def evaluate(self, snapshot):
+        """Runs the hardest rule firing for a snapshot, if any. Since a harder rule also covers the softer ones, these
+        are put on cooldown as well.
+        @param (MemorySnapshot) snapshot:
+        The sample to evaluate.
+        @return (PolicyAction) action:
+        The record of the rule which fired, or None.
+        """
+        if not self.enabled:
+            return None
+        fired = [rule for rule in self.rules if rule.check(snapshot)]
+        if not fired:
+            return None
+        rule = max(fired, key=lambda fired_rule: fired_rule.limit)
+        for action in rule.actions:
+            action()
+        action = PolicyAction(rule.name, snapshot, MemorySnapshot.capture())
+        for other in self.rules:
+            if other.limit <= rule.limit:
+                other.armed = False
+                other.last_fired = snapshot.timestamp
+        self.log.append(action)
+        return action
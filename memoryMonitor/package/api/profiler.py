@@ -0,0 +1,158 @@
+import bisect
+import datetime
+import json
+import platform
+import time
+
+
+# Upper bounds of the histogram buckets, in milliseconds. Durations past the last bound land in an overflow bucket.
+BUCKET_BOUNDS_MS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 25.0, 50.0, 100.0, 250.0, 1000.0)
+
+_BUCKET_BOUNDS = [bound * 0.001 for bound in BUCKET_BOUNDS_MS]
+
+
+class StageHistogram:
+    def __init__(self, name):
+        """Aggregates the durations of a stage of the monitor tick into fixed log-spaced buckets, so that recording a
+        duration costs a binary search and a few additions, whatever the number of calls.
+        @param (str) name:
+        The stage name.
+        @return (None):
+        No return value.
+        """
+        self.name = name
+        self.counts = [0] * (len(_BUCKET_BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.minimum = float("inf")
+        self.maximum = 0.0
+        self.last = 0.0
+
+    def add(self, seconds):
+        self.counts[bisect.bisect_left(_BUCKET_BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.last = seconds
+        if seconds < self.minimum:
+            self.minimum = seconds
+        if seconds > self.maximum:
+            self.maximum = seconds
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, p):
+        """Estimates a percentile from the buckets, interpolating linearly within the bucket it falls in.
+        @param (float) p:
+        The percentile, between 0 and 100.
+        @return (float) value:
+        The estimate, in seconds, clamped to the durations actually recorded.
+        """
+        if not self.count:
+            return 0.0
+        rank = self.count * p / 100.0
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                low = _BUCKET_BOUNDS[index - 1] if index else 0.0
+                high = _BUCKET_BOUNDS[index] if index < len(_BUCKET_BOUNDS) else self.maximum
+                value = low + (high - low) * (rank - seen) / count
+                return min(max(value, self.minimum), self.maximum)
+            seen += count
+        return self.maximum
+
+    def summary(self):
+        """Returns the figures of the stage, durations in milliseconds, as exported to JSON.
+        """
+        return {'count': self.count, 'total_ms': self.total * 1000.0, 'mean_ms': self.mean * 1000.0,
+                'min_ms': (self.minimum if self.count else 0.0) * 1000.0, 'max_ms': self.maximum * 1000.0,
+                'p50_ms': self.percentile(50) * 1000.0, 'p95_ms': self.percentile(95) * 1000.0,
+                'p99_ms': self.percentile(99) * 1000.0, 'buckets': list(self.counts)}
+
+
+class Profiler:
+    def __init__(self):
+        """Times the stages of the monitor tick with the monotonic performance counter. Stages are timed between
+        start() and stop() calls left in the code: while the profiler is disabled, start() returns None and stop()
+        returns right away, so the instrumentation costs two empty calls per stage.
+        Stages run on the sampling thread are recorded from it. Histograms are only ever added to, so the worst a
+        concurrent read can see is a tick missing from a total.
+        @return (None):
+        No return value.
+        """
+        self.enabled = False
+        self.stages = {}
+        self.since = None
+
+    def enable(self, enabled=True):
+        """Switches the timers on or off. Histograms are kept when switching off, until reset() is called.
+        """
+        if enabled and self.since is None:
+            self.since = time.time()
+        self.enabled = enabled
+
+    def reset(self):
+        self.stages = {}
+        self.since = time.time() if self.enabled else None
+
+    def start(self):
+        """Returns the start time of a stage, or None while the profiler is disabled.
+        """
+        if self.enabled:
+            return time.perf_counter()
+        return None
+
+    def stop(self, stage, start):
+        """Records the duration of a stage started with start().
+        @param (str) stage:
+        The stage name.
+        @param (float) start:
+        The value returned by start().
+        @return (None):
+        No return value.
+        """
+        if start is None:
+            return
+        self.record(stage, time.perf_counter() - start)
+
+    def record(self, stage, seconds):
+        """Records a duration measured by the caller, such as the capture latency every snapshot already holds.
+        @param (str) stage:
+        The stage name.
+        @param (float) seconds:
+        The duration.
+        @return (None):
+        No return value.
+        """
+        histogram = self.stages.get(stage)
+        if histogram is None:
+            histogram = self.stages.setdefault(stage, StageHistogram(stage))
+        histogram.add(seconds)
+
+    def histograms(self):
+        """Returns the stage histograms, sorted by decreasing total time.
+        """
+        return sorted(list(self.stages.values()), key=lambda histogram: histogram.total, reverse=True)
+
+    def report(self):
+        """Returns every stage summary with the bucket bounds, ready to be dumped as JSON.
+        """
+        return {'date': datetime.datetime.now().isoformat(),
+                'since': datetime.datetime.fromtimestamp(self.since).isoformat() if self.since else None,
+                'python': platform.python_version(), 'bucket_bounds_ms': list(BUCKET_BOUNDS_MS),
+                'stages': dict((histogram.name, histogram.summary()) for histogram in self.histograms())}
+
+    def export(self, path):
+        """Writes the report to a JSON file.
+        @param (str) path:
+        The file path.
+        @return (None):
+        No return value.
+        """
+        with open(path, "w") as output:
+            json.dump(self.report(), output, indent=2)
+
+
+# Profiler shared by the monitor modules. Disabled until the Diagnostics section or $MEMORY_MONITOR_PROFILE enables it.
+PROFILER = Profiler()
@@ -0,0 +1,224 @@
+import collections
+import threading
+
+
+# Time between two snapshots of the Python heap allocation sites, in seconds.
+SNAPSHOT_INTERVAL = 60.0
+# Number of heap snapshots kept. Older ones are dropped, so comparing points further apart uses the oldest one kept.
+SNAPSHOT_POOL = 60
+# Number of frames tracemalloc stores per allocation. One is enough to group the allocations by line.
+TRACE_FRAMES = 1
+# Number of growing allocation sites listed by a heap diff.
+TOP_SITES = 25
+# Files whose allocations are left out of the snapshots: the import machinery, tracemalloc and the snapshots themselves.
+IGNORED_FILES = ("<frozen importlib._bootstrap>", "<frozen importlib._bootstrap_external>", "<unknown>", __file__)
+
+
+class HeapSnapshot:
+    def __init__(self, timestamp, snapshot):
+        """The Python heap of a sample, reduced to the size and number of memory blocks of every allocation site. Only
+        these totals are kept, so a snapshot costs memory in proportion to the number of sites rather than the number
+        of live allocations.
+        @param (float) timestamp:
+        The sample time, in epoch seconds.
+        @param (Snapshot) snapshot:
+        The tracemalloc snapshot to reduce, already filtered.
+        @return (None):
+        No return value.
+        """
+        self.timestamp = timestamp
+        self.sites = {}
+        self.size = 0
+        for statistic in snapshot.statistics('lineno'):
+            frame = statistic.traceback[0]
+            self.sites[(frame.filename, frame.lineno)] = (statistic.size, statistic.count)
+            self.size += statistic.size
+
+
+class HeapDiff:
+    def __init__(self, start, end, limit=TOP_SITES):
+        """The allocation sites whose Python heap grew the most between two snapshots.
+        @param (HeapSnapshot) start:
+        The earlier snapshot.
+        @param (HeapSnapshot) end:
+        The later snapshot.
+        @param (int) limit:
+        The number of sites kept.
+        @return (None):
+        No return value.
+        """
+        self.start = start
+        self.end = end
+        growth = []
+        before = start.sites
+        for site, (size, count) in end.sites.items():
+            old_size, old_count = before.get(site, (0, 0))
+            if size > old_size:
+                growth.append((size - old_size, count - old_count, size, site))
+        growth.sort(reverse=True)
+        # (file:line, growth in MB, growth in blocks, size in MB) tuples, by decreasing growth.
+        self.sites = [("{0:s}:{1:d}".format(*site), grown * 0.000001, blocks, size * 0.000001)
+                      for grown, blocks, size, site in growth[:limit]]
+
+    @property
+    def growth(self):
+        """The growth of the whole traced heap between both snapshots, in MB.
+        """
+        return (self.end.size - self.start.size) * 0.000001
+
+
+class HeapTracker:
+    def __init__(self, interval=SNAPSHOT_INTERVAL, pool=SNAPSHOT_POOL):
+        """Samples the size of the Python heap with tracemalloc alongside the Nuke memory counters, and snapshots its
+        allocation sites periodically so that two points of the chart can be compared. Reading the heap size is cheap
+        enough for every sample, while snapshots are taken and diffed on threads of their own, and diffs are handed to
+        the GUI through a deque, the same way as samples, so neither ever stalls the GUI thread. A single snapshot and a
+        single diff run at once: a snapshot falling due while one is taken is skipped until it is done, and a diff
+        requested while one is computed is queued, only the latest request being kept.
+        Tracing slows every Python allocation down, so it stays off until enabled.
+        @param (float) interval:
+        The time between two snapshots, in seconds.
+        @param (int) pool:
+        The number of snapshots kept.
+        @return (None):
+        No return value.
+        """
+        self.interval = interval
+        self.snapshots = collections.deque(maxlen=pool)
+        self._results = collections.deque()
+        self._started = False
+        self._request = 0
+        self._last = None
+        self._tracemalloc = None
+        self._filters = ()
+        self._snapshotting = threading.Lock()
+        self._lock = threading.Lock()
+        self._pending = None
+        self._diffing = False
+
+    @property
+    def tracing(self):
+        return self._tracemalloc is not None and self._tracemalloc.is_tracing()
+
+    def start(self):
+        """Starts tracing Python allocations, unless another tool already does. tracemalloc is only imported here, as
+        it pulls in pickle and linecache, which would weigh on the panel startup.
+        """
+        if self._tracemalloc is None:
+            import tracemalloc
+            self._tracemalloc = tracemalloc
+            self._filters = [tracemalloc.Filter(False, name) for name in IGNORED_FILES + (tracemalloc.__file__,)]
+        if not self._tracemalloc.is_tracing():
+            self._tracemalloc.start(TRACE_FRAMES)
+            self._started = True
+
+    def stop(self):
+        """Stops tracing if it was started here, and drops the snapshots.
+        """
+        if self._started:
+            self._tracemalloc.stop()
+            self._started = False
+        self.snapshots.clear()
+        self._last = None
+
+    def sample(self, timestamp):
+        """Returns the size of the traced Python heap, and starts taking a snapshot in the background once the interval
+        has elapsed since the previous one, unless the previous one is still being taken.
+        @param (float) timestamp:
+        The sample time, in epoch seconds.
+        @return (float) size:
+        The size of the traced heap, in MB, or 0 when not tracing.
+        """
+        if not self.tracing:
+            return 0.0
+        size = self._tracemalloc.get_traced_memory()[0]
+        due = self._last is None or timestamp - self._last >= self.interval
+        # Samples are captured on both the sampling and GUI threads, hence the lock rather than a flag.
+        if due and self._snapshotting.acquire(False):
+            self._last = timestamp
+            thread = threading.Thread(target=self._snapshot, args=(timestamp,), name="memoryMonitor heap snapshot")
+            thread.daemon = True
+            thread.start()
+        return size * 0.000001
+
+    def snapshot(self, timestamp):
+        """Takes a snapshot now, whatever the interval. Grouping the allocations by site visits every live one, so this
+        is called from a background thread by sample().
+        @param (float) timestamp:
+        The time the snapshot is filed at, in epoch seconds.
+        @return (HeapSnapshot) snapshot:
+        The snapshot, or None when not tracing.
+        """
+        if not self.tracing:
+            return None
+        snapshot = HeapSnapshot(timestamp, self._tracemalloc.take_snapshot().filter_traces(self._filters))
+        self.snapshots.append(snapshot)
+        return snapshot
+
+    def nearest(self, timestamp):
+        """Returns the snapshot closest to a time, or None if there is none.
+        """
+        # Snapshots are appended from other threads, and copying a deque into a list is atomic.
+        return min(list(self.snapshots), key=lambda snapshot: abs(snapshot.timestamp - timestamp), default=None)
+
+    def compare(self, start, end):
+        """Diffs the snapshots closest to two times on a background thread. The result is collected with drain().
+        Only the result of the latest request is kept, and a request made while a diff is computed waits for it.
+        @param (float) start:
+        The first time, in epoch seconds.
+        @param (float) end:
+        The second time, in epoch seconds. Both times may come in any order.
+        @return (bool) requested:
+        False if both times fall on the same snapshot, in which case there is nothing to compare.
+        """
+        first = self.nearest(min(start, end))
+        last = self.nearest(max(start, end))
+        if first is None or first is last:
+            return False
+        with self._lock:
+            self._request += 1
+            self._pending = (self._request, first, last)
+            if self._diffing:
+                return True
+            self._diffing = True
+        thread = threading.Thread(target=self._diff, name="memoryMonitor heap diff")
+        thread.daemon = True
+        thread.start()
+        return True
+
+    def drain(self):
+        """Pops the diff computed since the last drain, if any. Meant to be called from the GUI thread.
+        @return (HeapDiff) diff:
+        The diff, or None.
+        """
+        diff = None
+        try:
+            while True:
+                diff = self._results.popleft()
+        except IndexError:
+            return diff
+
+    def _snapshot(self, timestamp):
+        try:
+            self.snapshot(timestamp)
+        finally:
+            self._snapshotting.release()
+
+    def _diff(self):
+        """Computes the pending diffs, the latest request only, until none is left.
+        """
+        while True:
+            with self._lock:
+                pending = self._pending
+                self._pending = None
+                if pending is None:
+                    self._diffing = False
+                    return
+            request, start, end = pending
+            diff = HeapDiff(start, end)
+            if request == self._request:
+                self._results.append(diff)
+
+
+# Heap tracker shared by the monitor modules. Idle until the Python tab or $MEMORY_MONITOR_PYHEAP enables it.
+HEAP = HeapTracker()
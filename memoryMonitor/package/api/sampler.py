@@ -0,0 +1,154 @@
+import collections
+import threading
+import time
+
+
+# Shortest interval a sampler accepts, in seconds, so that a zeroed timer can't turn the thread into a busy loop.
+MIN_INTERVAL = 0.05
+
+
+class AdaptiveScheduler:
+    def __init__(self, minimum, maximum, sensitivity=5.0, backoff=1.5):
+        """Picks the time until the next sample from how fast memory is changing: it drops to the minimum interval as
+        soon as memory moves faster than the sensitivity, and backs off geometrically to the maximum interval, a slow
+        heartbeat, while usage stays flat.
+        @param (float) minimum:
+        The shortest interval, in seconds.
+        @param (float) maximum:
+        The longest interval, in seconds.
+        @param (float) sensitivity:
+        The rate of change, in MB per second, above which sampling goes to the minimum interval.
+        @param (float) backoff:
+        The factor the interval grows by after every quiet sample.
+        @return (None):
+        No return value.
+        """
+        self.minimum = minimum
+        self.maximum = maximum
+        self.sensitivity = sensitivity
+        self.backoff = backoff
+        self._interval = minimum
+        self._last = None
+
+    def __call__(self, snapshot):
+        """Returns the time to wait before the next sample.
+        @param (MemorySnapshot) snapshot:
+        The sample just captured.
+        @return (float) interval:
+        The interval, in seconds.
+        """
+        last = self._last
+        self._last = snapshot
+        if last is None:
+            self._interval = self.minimum
+        else:
+            elapsed = max(snapshot.timestamp - last.timestamp, MIN_INTERVAL)
+            rate = abs(snapshot.usage - last.usage) / elapsed
+            if rate >= self.sensitivity:
+                self._interval = self.minimum
+            elif rate < self.sensitivity / 4:
+                self._interval *= self.backoff
+        self._interval = min(max(self._interval, self.minimum), self.maximum)
+        return self._interval
+
+
+class Sampler:
+    def __init__(self, function, interval, maxlen=4096, scheduler=None):
+        """Runs a capture function on a background thread at a fixed cadence and hands its results to the GUI through
+        a bounded queue. The queue is a deque, whose append and popleft are atomic, so neither side ever waits on a lock
+        and a busy GUI only makes the queue grow up to maxlen, dropping the oldest samples beyond that.
+        @param (func) function:
+        The capture function, called without arguments on the sampling thread.
+        @param (float) interval:
+        The time between two captures, in seconds.
+        @param (int) maxlen:
+        The maximum number of samples waiting to be drained.
+        @param (func) scheduler:
+        If given, called with every sample on the sampling thread and returning the interval until the next one, in
+        seconds, instead of the fixed interval. Only this thread's single wait is ever rescheduled.
+        @return (None):
+        No return value.
+        """
+        self._function = function
+        self._interval = max(interval, MIN_INTERVAL)
+        self.scheduler = scheduler
+        self._queue = collections.deque(maxlen=maxlen)
+        self._thread = None
+        self._stop_event = threading.Event()
+
+    @property
+    def interval(self):
+        """The interval set by the user, in seconds. The scheduler, if any, picks the actual delays on its own.
+        """
+        return self._interval
+
+    @interval.setter
+    def interval(self, new_interval):
+        """A running thread is restarted so that the new interval applies right away instead of after its current
+        wait.
+        """
+        self._interval = max(new_interval, MIN_INTERVAL)
+        if self.running:
+            self.stop()
+            self.start()
+
+    @property
+    def running(self):
+        """Warns if the sampling thread is running or not.
+        @return (bool) running:
+        True if the sampling thread is currently alive and hasn't been asked to stop.
+        """
+        return self._thread is not None and self._thread.is_alive() and not self._stop_event.is_set()
+
+    def start(self):
+        if self.running:
+            return
+        # A fresh event per thread, so that a thread still finishing its last capture can't be revived by a restart.
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(self._stop_event,), name="memoryMonitor sampler")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self, wait=False):
+        """Asks the sampling thread to stop.
+        @param (bool) wait:
+        True to also wait for the capture it may be running to finish, so that nothing is captured after this returns.
+        @return (None):
+        No return value.
+        """
+        self._stop_event.set()
+        thread = self._thread
+        if wait and thread is not None and thread is not threading.current_thread():
+            thread.join()
+
+    def drain(self):
+        """Pops every sample captured since the last drain, oldest first. Meant to be called from the GUI thread.
+        @return (list) samples:
+        The captured samples.
+        """
+        samples = []
+        pop = self._queue.popleft
+        try:
+            while True:
+                samples.append(pop())
+        except IndexError:
+            return samples
+
+    def _run(self, stop_event):
+        """Sampling loop. Deadlines are scheduled from the previous deadline rather than from the end of the capture,
+        so the cadence doesn't drift with the capture cost. Missed deadlines are skipped rather than caught up.
+        """
+        deadline = time.monotonic()
+        while not stop_event.is_set():
+            sample = self._function()
+            self._queue.append(sample)
+            scheduler = self.scheduler
+            if scheduler is None:
+                interval = self._interval
+            else:
+                interval = max(scheduler(sample), MIN_INTERVAL)
+            deadline += interval
+            now = time.monotonic()
+            if deadline < now:
+                deadline = now
+            stop_event.wait(deadline - now)
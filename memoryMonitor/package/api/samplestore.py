@@ -0,0 +1,345 @@
+from array import array
+
+
+# Number of samples kept at full rate by a Monitor. At the default 10 seconds interval this covers a week of session.
+DEFAULT_CAPACITY = 65536
+# Largest window a Monitor may display, in samples. Whatever is older than the full rate history is drawn from the
+# tiers.
+MAX_WINDOW = 1000000
+# Resolution, in seconds, and number of buckets of each rolled-up history tier: a day of minutes, a week of ten minutes
+# and a month of hours.
+TIERS = ((60, 1440), (600, 1008), (3600, 720))
+
+
+class RingBuffer:
+    def __init__(self, capacity, typecode='d'):
+        """A fixed-capacity circular buffer backed by a contiguous C array.
+        Every value is written twice, at its slot and at the slot mirrored one capacity further, so the most recent
+        values always form a single contiguous run of the array and can be handed out as a memoryview without copying.
+        @param (int) capacity:
+        The maximum number of values kept. Older values are overwritten once it is reached.
+        @param (str) typecode:
+        The array typecode of the stored values, 'd' (float64) by default.
+        @return (None):
+        No return value.
+        """
+        if capacity < 1:
+            raise ValueError("A ring buffer needs a capacity of at least one value.")
+        self._capacity = capacity
+        self._data = array(typecode, [0]) * (capacity * 2)
+        self._head = 0
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def capacity(self):
+        return self._capacity
+
+    def append(self, value):
+        """Appends a value in O(1), overwriting the oldest one if the buffer is full.
+        @param (float) value:
+        The value to store.
+        @return (None):
+        No return value.
+        """
+        head = self._head
+        self._data[head] = value
+        self._data[head + self._capacity] = value
+        self._head = (head + 1) % self._capacity
+        if self._count < self._capacity:
+            self._count += 1
+
+    def extend(self, values):
+        """Appends a sequence of values. Only the last capacity values of the sequence are kept.
+        @param (sequence) values:
+        Any sequence supporting len() and slicing, such as an array or a memoryview.
+        @return (None):
+        No return value.
+        """
+        values = values[-self._capacity:]
+        for value in values:
+            self.append(value)
+
+    def clear(self):
+        self._head = 0
+        self._count = 0
+
+    def align(self, other):
+        """Makes an empty buffer hold as many zeros as another buffer of the same capacity holds values, ending on the
+        same slot, so that their views cover the same samples from then on. Nothing is written, as a new buffer is
+        already zeroed.
+        @param (RingBuffer) other:
+        The buffer to align on.
+        @return (None):
+        No return value.
+        """
+        if self._count or other.capacity != self._capacity:
+            raise ValueError("Only an empty ring buffer of the same capacity can be aligned.")
+        self._head = other._head
+        self._count = len(other)
+
+    def last(self, default=0.0):
+        """Returns the most recent value, or default if the buffer is empty.
+        """
+        if not self._count:
+            return default
+        return self._data[self._head - 1 + self._capacity]
+
+    def view(self, count=None):
+        """Returns the most recent values, oldest first, as a zero-copy memoryview.
+        The view aliases the buffer memory: it stays valid but will reflect later appends, so consumers should not keep
+        it across samples.
+        @param (int) count:
+        The number of most recent values to expose. All the stored values if None.
+        @return (memoryview) view:
+        A view over the values.
+        """
+        if count is None or count > self._count:
+            count = self._count
+        start = self._head - count
+        if start < 0:
+            start += self._capacity
+        return memoryview(self._data)[start:start + count]
+
+
+class HistoryTier:
+    def __init__(self, resolution, capacity):
+        """A fixed-capacity roll-up of a metric into time buckets, keeping the minimum, maximum and mean of each one.
+        @param (float) resolution:
+        The bucket duration, in seconds.
+        @param (int) capacity:
+        The maximum number of closed buckets kept.
+        @return (None):
+        No return value.
+        """
+        self.resolution = resolution
+        self.starts = RingBuffer(capacity)
+        self.minimums = RingBuffer(capacity)
+        self.maximums = RingBuffer(capacity)
+        self.means = RingBuffer(capacity)
+        self._start = None
+        self._min = 0.0
+        self._max = 0.0
+        self._sum = 0.0
+        self._count = 0
+
+    def __len__(self):
+        return len(self.starts)
+
+    def add(self, timestamp, value):
+        """Accumulates a sample into the open bucket, closing it first if the sample belongs to a later one.
+        @param (float) timestamp:
+        The sample time, as epoch seconds.
+        @param (float) value:
+        The sample value.
+        @return (None):
+        No return value.
+        """
+        start = timestamp - timestamp % self.resolution
+        if start != self._start:
+            self.flush()
+            self._start = start
+            self._min = self._max = value
+            self._sum = 0.0
+        elif value < self._min:
+            self._min = value
+        elif value > self._max:
+            self._max = value
+        self._sum += value
+        self._count += 1
+
+    def clear(self):
+        for ring in (self.starts, self.minimums, self.maximums, self.means):
+            ring.clear()
+        self._start = None
+        self._count = 0
+
+    def flush(self):
+        """Closes the open bucket, if any.
+        """
+        if not self._count:
+            return
+        self.starts.append(self._start)
+        self.minimums.append(self._min)
+        self.maximums.append(self._max)
+        self.means.append(self._sum / self._count)
+        self._count = 0
+
+
+class TieredHistory:
+    def __init__(self, tiers=TIERS):
+        """Rolls a metric up into several history tiers of increasing resolution. Each sample costs one update per tier,
+        and the memory used is fixed whatever the session length.
+        @param (tuple) tiers:
+        (resolution, capacity) pairs, from the finest to the coarsest resolution.
+        @return (None):
+        No return value.
+        """
+        self.tiers = [HistoryTier(resolution, capacity) for resolution, capacity in tiers]
+
+    def add(self, timestamp, value):
+        for tier in self.tiers:
+            tier.add(timestamp, value)
+
+    def clear(self):
+        for tier in self.tiers:
+            tier.clear()
+
+    def select(self, span, buckets):
+        """Picks the finest tier whose buckets over a time span fit a given budget, or the coarsest one otherwise.
+        @param (float) span:
+        The time span to display, in seconds.
+        @param (int) buckets:
+        The maximum number of buckets to draw.
+        @return (HistoryTier) tier:
+        The selected tier.
+        """
+        for tier in self.tiers:
+            if span / tier.resolution <= buckets:
+                return tier
+        return self.tiers[-1]
+
+
+def minmax_decimate(values, buckets):
+    """Reduces a sequence of values to the minimum and maximum of each of a number of equal chunks, so that peaks
+    survive the decimation. Both extremes of a chunk are ordered along its overall direction to keep the drawn line
+    continuous.
+    @param (memoryview) values:
+    The values to decimate.
+    @param (int) buckets:
+    The number of chunks.
+    @return (list) points:
+    (position, value) tuples, where position is the fractional index of the point within values.
+    """
+    count = len(values)
+    if count <= buckets * 2:
+        return list(enumerate(values))
+    points = []
+    step = count / float(buckets)
+    for bucket in range(buckets):
+        start = int(bucket * step)
+        end = int((bucket + 1) * step)
+        chunk = values[start:end]
+        low = min(chunk)
+        high = max(chunk)
+        if chunk[-1] < chunk[0]:
+            low, high = high, low
+        points.append((start, low))
+        points.append((start + (end - start - 1) * 0.5, high))
+    return points
+
+
+class SampleStore:
+    def __init__(self, capacity=DEFAULT_CAPACITY, columns=('usage',)):
+        """Holds a Monitor sample history: one timestamp ring and one ring per named metric, all sharing the same
+        capacity so that a given position refers to the same sample in every column.
+        @param (int) capacity:
+        The maximum number of samples kept at full rate.
+        @param (tuple) columns:
+        The names of the metrics stored alongside each timestamp.
+        @return (None):
+        No return value.
+        """
+        self.timestamps = RingBuffer(capacity)
+        self._columns = dict((name, RingBuffer(capacity)) for name in columns)
+        self._histories = dict((name, TieredHistory()) for name in columns)
+        self._listeners = []
+        # Number of samples appended since the store was created or cleared, including the overwritten ones.
+        self.total = 0
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    @property
+    def capacity(self):
+        return self.timestamps.capacity
+
+    @property
+    def columns(self):
+        return tuple(self._columns)
+
+    def append(self, timestamp, **values):
+        """Appends one sample, a value to every column at once. Metrics which are not given are recorded as zero so
+        that every column stays aligned.
+        @param (float) timestamp:
+        The sample time, as epoch seconds.
+        @param (float) values:
+        The metric values of the sample, keyed by column name.
+        @return (None):
+        No return value.
+        """
+        for name, ring in self._columns.items():
+            value = values.get(name, 0.0)
+            ring.append(value)
+            self._histories[name].add(timestamp, value)
+        self.timestamps.append(timestamp)
+        self.total += 1
+        for listener in self._listeners:
+            listener()
+
+    def add_column(self, name):
+        """Adds a metric column, holding zero for the samples stored before it. A metric costs one ring and one
+        history, updated with every append.
+        @param (str) name:
+        The column name. Nothing is done if the column exists.
+        @return (None):
+        No return value.
+        """
+        if name in self._columns:
+            return
+        ring = RingBuffer(self.capacity)
+        ring.align(self.timestamps)
+        self._columns[name] = ring
+        self._histories[name] = TieredHistory()
+
+    def add_listener(self, listener):
+        """Registers a callable invoked without arguments after every append, such as streaming statistics.
+        @param (func) listener:
+        The callable to invoke.
+        @return (None):
+        No return value.
+        """
+        self._listeners.append(listener)
+
+    def clear(self):
+        self.timestamps.clear()
+        self.total = 0
+        for ring in self._columns.values():
+            ring.clear()
+        for history in self._histories.values():
+            history.clear()
+
+    def history(self, name):
+        """Returns the rolled-up history tiers of a metric.
+        """
+        return self._histories[name]
+
+    def interval(self):
+        """Returns the mean time between two of the stored samples, in seconds, or zero with less than two samples.
+        """
+        count = len(self.timestamps)
+        if count < 2:
+            return 0.0
+        timestamps = self.timestamps.view()
+        return (timestamps[-1] - timestamps[0]) / (count - 1)
+
+    def column(self, name):
+        return self._columns[name]
+
+    def truncated(self):
+        """Tells whether older samples may have been overwritten, in which case they are only left in history tiers.
+        """
+        return len(self.timestamps) == self.timestamps.capacity
+
+    def view(self, name, count=None):
+        """Returns the most recent values of a metric as a zero-copy memoryview, oldest first.
+        @param (str) name:
+        The column name.
+        @param (int) count:
+        The number of most recent samples to expose. All the stored samples if None.
+        @return (memoryview) view:
+        A view over the values.
+        """
+        return self._columns[name].view(count)
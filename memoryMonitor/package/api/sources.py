@@ -0,0 +1,170 @@
+import abc
+import bisect
+import os
+import time
+from package.api.trace import TraceReader, EXTENSION
+
+
+# Default acceleration of replayed and synthetic sources: seconds of memory curve played per real second.
+DEFAULT_SPEED = 100.0
+# Counters reported by synthetic sources, and by trace sources for the ones a trace doesn't hold, in MB.
+DEFAULT_MAX_USAGE = 16000.0
+DEFAULT_TOTAL_RAM = 64000.0
+
+
+def ramp(start=2000.0, rate=0.5):
+    """A steady growth, such as a slow leak.
+    @param (float) start:
+    The memory at the start, in MB.
+    @param (float) rate:
+    The growth, in MB per second.
+    @return (func) generator:
+    The curve, taking the elapsed time in seconds and returning the memory in MB.
+    """
+    return lambda elapsed: start + rate * elapsed
+
+
+def sawtooth(base=2000.0, amplitude=6000.0, period=1800.0):
+    """A leak which is flushed periodically, such as a cache growing until it is cleared.
+    @param (float) base:
+    The memory right after a flush, in MB.
+    @param (float) amplitude:
+    The growth over a period, in MB.
+    @param (float) period:
+    The time between two flushes, in seconds.
+    @return (func) generator:
+    The curve, taking the elapsed time in seconds and returning the memory in MB.
+    """
+    return lambda elapsed: base + amplitude * (elapsed % period) / period
+
+
+def bursts(base=3000.0, height=5000.0, period=600.0, duration=30.0):
+    """Short allocation bursts over a flat usage, such as renders or heavy viewer frames.
+    @param (float) base:
+    The memory between bursts, in MB.
+    @param (float) height:
+    The memory added during a burst, in MB.
+    @param (float) period:
+    The time between the starts of two bursts, in seconds.
+    @param (float) duration:
+    The duration of a burst, in seconds.
+    @return (func) generator:
+    The curve, taking the elapsed time in seconds and returning the memory in MB.
+    """
+    return lambda elapsed: base + (height if elapsed % period < duration else 0.0)
+
+
+# Synthetic curves available by name, with their default parameters.
+GENERATORS = {'ramp': ramp, 'sawtooth': sawtooth, 'bursts': bursts}
+
+
+class ReplaySource(abc.ABC):
+    def __init__(self, speed=DEFAULT_SPEED):
+        """Base class of the memory sources replacing Nuke. A source has its own clock, running speed times faster than
+        real time from the moment it is created, so that hours of memory curve are played in minutes.
+        @param (float) speed:
+        The acceleration, in seconds of curve per real second.
+        @return (None):
+        No return value.
+        """
+        self.speed = speed
+        self._origin = time.time()
+        self._start = time.monotonic()
+
+    def elapsed(self):
+        """Returns the time played since the source was created, in curve seconds.
+        """
+        return (time.monotonic() - self._start) * self.speed
+
+    def timestamp(self):
+        """Returns the current time of the source, as epoch seconds.
+        """
+        return self._origin + self.elapsed()
+
+    @abc.abstractmethod
+    def memory(self, element):
+        """Returns a memory counter, like nuke.memory(element) but in MB.
+        @param (str) element:
+        The counter name: usage, max_usage or total_ram.
+        @return (float) value:
+        The counter value, in MB.
+        """
+
+
+class SyntheticSource(ReplaySource):
+    def __init__(self, generator, speed=DEFAULT_SPEED, max_usage=DEFAULT_MAX_USAGE, total_ram=DEFAULT_TOTAL_RAM):
+        """Plays a synthetic memory curve.
+        @param (func) generator:
+        The curve, taking the elapsed time in seconds and returning the memory in MB, such as ramp() or sawtooth().
+        @param (float) speed:
+        The acceleration, in seconds of curve per real second.
+        @param (float) max_usage:
+        The maximum memory Nuke may allocate, in MB.
+        @param (float) total_ram:
+        The total RAM of the system, in MB.
+        @return (None):
+        No return value.
+        """
+        super(SyntheticSource, self).__init__(speed)
+        self.generator = generator
+        self.max_usage = max_usage
+        self.total_ram = total_ram
+
+    def memory(self, element):
+        if element == 'max_usage':
+            return self.max_usage
+        if element == 'total_ram':
+            return self.total_ram
+        return min(max(self.generator(self.elapsed()), 0.0), self.max_usage)
+
+
+class TraceSource(ReplaySource):
+    def __init__(self, path, speed=DEFAULT_SPEED, loop=True):
+        """Plays a recorded trace again, as if its memory was Nuke's, with a binary search of the trace samples.
+        @param (str) path:
+        The trace path.
+        @param (float) speed:
+        The acceleration, in seconds of trace per real second.
+        @param (bool) loop:
+        True to start over at the end of the trace, False to hold its last sample.
+        @return (None):
+        No return value.
+        """
+        super(TraceSource, self).__init__(speed)
+        self.reader = TraceReader(path)
+        if not len(self.reader):
+            self.reader.close()
+            raise ValueError("The trace {0:s} holds no sample.".format(path))
+        self.loop = loop
+        self._timestamps = self.reader.view('timestamp')
+        self._duration = self._timestamps[-1] - self._timestamps[0]
+
+    def close(self):
+        self._timestamps = None
+        self.reader.close()
+
+    def memory(self, element):
+        if element == 'total_ram':
+            return DEFAULT_TOTAL_RAM
+        elapsed = self.elapsed()
+        if self.loop and self._duration > 0:
+            elapsed %= self._duration
+        index = bisect.bisect_right(self._timestamps, self._timestamps[0] + elapsed) - 1
+        return self.reader.view(element)[max(index, 0)]
+
+
+def source_from_spec(spec, speed=DEFAULT_SPEED):
+    """Builds a source from a short description, such as the $MEMORY_MONITOR_SOURCE environment variable.
+    @param (str) spec:
+    The name of a synthetic curve of GENERATORS, or the path of a trace.
+    @param (float) speed:
+    The acceleration, in seconds of curve per real second.
+    @return (ReplaySource) source:
+    The source.
+    """
+    if spec in GENERATORS:
+        return SyntheticSource(GENERATORS[spec](), speed)
+    if spec.endswith(EXTENSION) and os.path.isfile(spec):
+        return TraceSource(spec, speed)
+    raise ValueError("Unknown memory source {0:s}: expected one of {1:s} or a trace path.".format(
+        spec, ", ".join(sorted(GENERATORS))))
@@ -0,0 +1,352 @@
+import collections
+import math
+
+
+class RollingExtremum:
+    def __init__(self, window, maximum=True):
+        """Tracks the maximum, or minimum, of the last window values with a monotonic deque. Each value is pushed and
+        popped at most once, so an update costs amortized O(1) whatever the window.
+        @param (int) window:
+        The number of most recent values considered.
+        @param (bool) maximum:
+        True to track the maximum, False to track the minimum.
+        @return (None):
+        No return value.
+        """
+        self.window = window
+        self._maximum = maximum
+        self._deque = collections.deque()
+        self._count = 0
+
+    @property
+    def value(self):
+        if not self._deque:
+            return 0.0
+        return self._deque[0][1]
+
+    def add(self, value):
+        deque = self._deque
+        if self._maximum:
+            while deque and deque[-1][1] <= value:
+                deque.pop()
+        else:
+            while deque and deque[-1][1] >= value:
+                deque.pop()
+        deque.append((self._count, value))
+        self._count += 1
+        if deque[0][0] <= self._count - 1 - self.window:
+            deque.popleft()
+
+    def clear(self):
+        self._deque.clear()
+        self._count = 0
+
+
+class RollingMoments:
+    def __init__(self):
+        """Running mean and variance with Welford's updates, which also allow removing the value leaving a window.
+        """
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+
+    @property
+    def variance(self):
+        if self.count < 2:
+            return 0.0
+        return max(self._m2 / (self.count - 1), 0.0)
+
+    @property
+    def std(self):
+        return math.sqrt(self.variance)
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+
+    def remove(self, value):
+        if self.count <= 1:
+            self.clear()
+            return
+        self.count -= 1
+        delta = value - self.mean
+        self.mean -= delta / self.count
+        self._m2 -= delta * (value - self.mean)
+
+    def clear(self):
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+
+
+class Ewma:
+    def __init__(self, alpha):
+        """Exponentially weighted moving average.
+        @param (float) alpha:
+        The weight of the newest value, between 0 and 1.
+        @return (None):
+        No return value.
+        """
+        self.alpha = alpha
+        self.value = None
+
+    def add(self, value):
+        if self.value is None:
+            self.value = value
+        else:
+            self.value += self.alpha * (value - self.value)
+
+
+class P2Quantile:
+    def __init__(self, p):
+        """Estimates a quantile of a stream in constant memory and O(1) per value with the P-square algorithm of Jain
+        and Chlamtac: five markers are kept and nudged towards their ideal positions with a parabolic interpolation.
+        @param (float) p:
+        The quantile to estimate, between 0 and 1.
+        @return (None):
+        No return value.
+        """
+        self.p = p
+        self._heights = []
+        self._positions = [0, 1, 2, 3, 4]
+        self._desired = [0.0, 2 * p, 4 * p, 2 + 2 * p, 4.0]
+        self._increments = [0.0, p / 2, p, (1 + p) / 2, 1.0]
+
+    @property
+    def value(self):
+        heights = self._heights
+        if len(heights) < 5:
+            if not heights:
+                return 0.0
+            ordered = sorted(heights)
+            return ordered[min(int(self.p * len(ordered)), len(ordered) - 1)]
+        return heights[2]
+
+    def add(self, value):
+        heights = self._heights
+        if len(heights) < 5:
+            heights.append(value)
+            if len(heights) == 5:
+                heights.sort()
+            return
+        positions = self._positions
+        if value < heights[0]:
+            heights[0] = value
+            cell = 0
+        elif value >= heights[4]:
+            heights[4] = value
+            cell = 3
+        else:
+            cell = 0
+            while value >= heights[cell + 1]:
+                cell += 1
+        for index in range(cell + 1, 5):
+            positions[index] += 1
+        for index in range(5):
+            self._desired[index] += self._increments[index]
+        for index in (1, 2, 3):
+            offset = self._desired[index] - positions[index]
+            if (offset >= 1 and positions[index + 1] - positions[index] > 1) or \
+                    (offset <= -1 and positions[index - 1] - positions[index] < -1):
+                step = 1 if offset > 0 else -1
+                height = self._parabolic(index, step)
+                if not heights[index - 1] < height < heights[index + 1]:
+                    height = heights[index] + step * (heights[index + step] - heights[index]) / \
+                        (positions[index + step] - positions[index])
+                heights[index] = height
+                positions[index] += step
+
+    def _parabolic(self, index, step):
+        heights = self._heights
+        positions = self._positions
+        return heights[index] + step / float(positions[index + 1] - positions[index - 1]) * (
+            (positions[index] - positions[index - 1] + step) * (heights[index + 1] - heights[index]) /
+            (positions[index + 1] - positions[index]) +
+            (positions[index + 1] - positions[index] - step) * (heights[index] - heights[index - 1]) /
+            (positions[index] - positions[index - 1]))
+
+
+class RollingStats:
+    def __init__(self, store, column='usage', window=21, alpha=0.2):
+        """Streaming statistics of a sample store column, updated in O(1) or amortized O(1) after every append: rolling
+        minimum, maximum, mean and standard deviation over the window, plus an EWMA and approximate p95 and p99 over the
+        whole session. The value leaving the window is read back from the store, so no copy of the window is kept.
+        @param (SampleStore) store:
+        The sample store to follow.
+        @param (str) column:
+        The column to compute statistics on.
+        @param (int) window:
+        The number of most recent samples the rolling statistics cover. Clamped below the store capacity.
+        @param (float) alpha:
+        The EWMA weight of the newest sample.
+        @return (None):
+        No return value.
+        """
+        self._store = store
+        self._column = column
+        self.window = min(window, store.capacity - 1)
+        self.maximum = RollingExtremum(self.window, maximum=True)
+        self.minimum = RollingExtremum(self.window, maximum=False)
+        self.moments = RollingMoments()
+        self.ewma = Ewma(alpha)
+        self.p95 = P2Quantile(0.95)
+        self.p99 = P2Quantile(0.99)
+        store.add_listener(self.update)
+
+    def update(self):
+        """Accounts for the sample just appended to the store.
+        """
+        ring = self._store.column(self._column)
+        value = ring.last()
+        if len(ring) > self.window:
+            self.moments.remove(ring.view(self.window + 1)[0])
+        self.moments.add(value)
+        self.maximum.add(value)
+        self.minimum.add(value)
+        self.ewma.add(value)
+        self.p95.add(value)
+        self.p99.add(value)
+
+    def resize(self, window):
+        """Changes the window of the rolling statistics and rebuilds them from the store. The session-wide EWMA and
+        percentiles are kept as they are.
+        @param (int) window:
+        The new number of samples covered.
+        @return (None):
+        No return value.
+        """
+        self.window = min(window, self._store.capacity - 1)
+        self.maximum.window = self.minimum.window = self.window
+        for tracker in (self.maximum, self.minimum, self.moments):
+            tracker.clear()
+        for value in self._store.view(self._column, self.window):
+            self.moments.add(value)
+            self.maximum.add(value)
+            self.minimum.add(value)
+
+    def summary(self):
+        """Returns the current statistics.
+        @return (dict) summary:
+        The statistics, keyed by name.
+        """
+        return {'min': self.minimum.value, 'max': self.maximum.value, 'mean': self.moments.mean,
+                'std': self.moments.std, 'ewma': self.ewma.value or 0.0, 'p95': self.p95.value, 'p99': self.p99.value}
+
+
+class LinearTrend:
+    def __init__(self):
+        """Least-squares line through a sliding set of (time, value) points. Points are added and removed with Welford
+        style updates of the means and co-moments, which stay accurate over long sessions, so each costs O(1).
+        """
+        self.count = 0
+        self._mean_t = 0.0
+        self._mean_v = 0.0
+        self._cov = 0.0
+        self._m2_t = 0.0
+
+    @property
+    def slope(self):
+        """The slope of the line, in value units per second.
+        """
+        if self.count < 2 or self._m2_t <= 0:
+            return 0.0
+        return self._cov / self._m2_t
+
+    def add(self, t, value):
+        self.count += 1
+        delta_t = t - self._mean_t
+        self._mean_t += delta_t / self.count
+        self._mean_v += (value - self._mean_v) / self.count
+        self._cov += delta_t * (value - self._mean_v)
+        self._m2_t += delta_t * (t - self._mean_t)
+
+    def remove(self, t, value):
+        if self.count <= 1:
+            self.clear()
+            return
+        self.count -= 1
+        delta_t = t - self._mean_t
+        self._mean_t -= delta_t / self.count
+        self._mean_v -= (value - self._mean_v) / self.count
+        self._cov -= delta_t * (value - self._mean_v)
+        self._m2_t -= delta_t * (t - self._mean_t)
+
+    def clear(self):
+        self.count = 0
+        self._mean_t = 0.0
+        self._mean_v = 0.0
+        self._cov = 0.0
+        self._m2_t = 0.0
+
+    def predict(self, t):
+        """Returns the value of the line at a given time.
+        """
+        return self._mean_v + self.slope * (t - self._mean_t)
+
+
+class LeakDetector:
+    def __init__(self, store, column='usage', windows=(30, 120, 480), threshold=1.0):
+        """Estimates the memory trend over several sliding windows of the sample store and flags a leak when every
+        window grows faster than a threshold. The estimate is updated in O(1) per window after every append, reading
+        the points leaving the windows back from the store.
+        @param (SampleStore) store:
+        The sample store to follow.
+        @param (str) column:
+        The column to follow.
+        @param (tuple) windows:
+        The number of samples of each window, from the shortest to the longest. Clamped below the store capacity.
+        @param (float) threshold:
+        The growth rate above which a window is considered growing, in MB per minute.
+        @return (None):
+        No return value.
+        """
+        self._store = store
+        self._column = column
+        self.windows = tuple(min(window, store.capacity - 1) for window in windows)
+        self.threshold = threshold
+        self.trends = [LinearTrend() for window in self.windows]
+        # Times are taken relative to the first sample to keep the co-moments small.
+        self._origin = None
+        store.add_listener(self.update)
+
+    def update(self):
+        """Accounts for the sample just appended to the store.
+        """
+        timestamps = self._store.timestamps
+        ring = self._store.column(self._column)
+        if self._origin is None:
+            self._origin = timestamps.last()
+        count = len(ring)
+        for window, trend in zip(self.windows, self.trends):
+            if count > window:
+                trend.remove(timestamps.view(window + 1)[0] - self._origin, ring.view(window + 1)[0])
+            trend.add(timestamps.last() - self._origin, ring.last())
+
+    @property
+    def leaking(self):
+        """True if every window is full and grows faster than the threshold.
+        """
+        for window, trend in zip(self.windows, self.trends):
+            if trend.count < window or trend.slope * 60 < self.threshold:
+                return False
+        return True
+
+    def forecast(self, limit):
+        """Projects the longest window trend until it reaches a limit.
+        @param (float) limit:
+        The memory limit, in MB, usually the latest max_usage.
+        @return (tuple) forecast:
+        The growth rate, in MB per second, the fitted memory value of the latest sample, in MB, and the number of
+        seconds left before the limit is reached, or None if memory isn't growing.
+        """
+        trend = self.trends[-1]
+        if self._origin is None:
+            return 0.0, 0.0, None
+        now = self._store.timestamps.last() - self._origin
+        current = trend.predict(now)
+        slope = trend.slope
+        if slope <= 0:
+            return slope, current, None
+        return slope, current, max(limit - current, 0.0) / slope
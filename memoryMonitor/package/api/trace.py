@@ -0,0 +1,220 @@
+import datetime
+import mmap
+import os
+import struct
+
+
+# File signature and format version written at the start of every trace.
+MAGIC = b"MMTRACE\0"
+VERSION = 1
+# Fields every trace record starts with. Optional extra metrics follow them.
+BASE_FIELDS = ('timestamp', 'usage', 'max_usage')
+# Size of a field name in the header, in bytes.
+FIELD_NAME_SIZE = 32
+# Extension of trace files, used by default paths and file dialogs.
+EXTENSION = ".mmtrace"
+
+_HEADER = struct.Struct("=8sII")
+
+
+def default_trace_path():
+    """Builds a new trace path for the current session, in $MEMORY_MONITOR_TRACE_DIR or ~/.nuke/memoryMonitor/traces.
+    @return (str) path:
+    The trace path, named after the current date, time and process id.
+    """
+    directory = os.environ.get("MEMORY_MONITOR_TRACE_DIR",
+                               os.path.join(os.path.expanduser("~"), ".nuke", "memoryMonitor", "traces"))
+    name = "{0:s}-{1:d}{2:s}".format(datetime.datetime.now().strftime("%Y%m%d-%H%M%S"), os.getpid(), EXTENSION)
+    return os.path.join(directory, name)
+
+
+def _header_size(field_count):
+    """Returns the header size for a number of fields, rounded up so records stay aligned on 8 bytes.
+    """
+    size = _HEADER.size + field_count * FIELD_NAME_SIZE
+    return (size + 7) // 8 * 8
+
+
+def _pack_header(fields):
+    names = b"".join(name.encode("ascii").ljust(FIELD_NAME_SIZE, b"\0") for name in fields)
+    header = _HEADER.pack(MAGIC, VERSION, len(fields)) + names
+    return header.ljust(_header_size(len(fields)), b"\0")
+
+
+def _unpack_header(data):
+    """Reads a trace header.
+    @param (bytes) data:
+    The beginning of the trace file.
+    @return (tuple) header:
+    The field names and the header size.
+    """
+    if len(data) < _HEADER.size:
+        raise ValueError("Not a memory trace: file too short.")
+    magic, version, field_count = _HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("Not a memory trace: bad signature.")
+    if version != VERSION:
+        raise ValueError("Unsupported memory trace version {0:d}.".format(version))
+    size = _header_size(field_count)
+    if len(data) < size:
+        raise ValueError("Not a memory trace: truncated header.")
+    fields = tuple(data[_HEADER.size + index * FIELD_NAME_SIZE:_HEADER.size + (index + 1) * FIELD_NAME_SIZE]
+                   .rstrip(b"\0").decode("ascii") for index in range(field_count))
+    return fields, size
+
+
+class TraceWriter:
+    def __init__(self, path, extra_fields=()):
+        """Appends fixed-size float64 records to a binary trace file. Each record is handed to the OS with a single
+        unbuffered write, so it survives a crash of Nuke as soon as write() returns. Appending to an existing trace is
+        allowed as long as its fields match.
+        @param (str) path:
+        The trace path. Missing directories are created.
+        @param (tuple) extra_fields:
+        Names of the optional metrics recorded after the base fields.
+        @return (None):
+        No return value.
+        """
+        self.path = path
+        self.fields = BASE_FIELDS + tuple(extra_fields)
+        self._record = struct.Struct("=" + "d" * len(self.fields))
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        self._fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        try:
+            size = os.fstat(self._fd).st_size
+            if size:
+                with open(path, "rb") as trace:
+                    # Sized like TraceReader, so that a trace of other fields is told apart from a truncated one.
+                    fields = _unpack_header(trace.read(_header_size(255)))[0]
+                if fields != self.fields:
+                    raise ValueError("The trace {0:s} records different fields.".format(path))
+            else:
+                os.write(self._fd, _pack_header(self.fields))
+        except (OSError, ValueError):
+            # A foreign or truncated file, or a failed header write: the file is left as is and the fd released.
+            self.close()
+            raise
+
+    @property
+    def closed(self):
+        return self._fd is None
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def write(self, *values):
+        """Appends one record. Safe to call from the sampling thread.
+        @param (float) values:
+        The record values, in the order of the trace fields.
+        @return (None):
+        No return value.
+        """
+        fd = self._fd
+        if fd is None:
+            return
+        try:
+            os.write(fd, self._record.pack(*values))
+        except OSError:
+            # A full disk or a trace closed by the GUI in the meantime must never stop the sampling itself.
+            pass
+
+
+class TraceColumn:
+    def __init__(self, values):
+        """A read-only column of a memory-mapped trace, exposing the same reading methods as a RingBuffer.
+        @param (memoryview) values:
+        A strided view over the column values in the mapped file.
+        @return (None):
+        No return value.
+        """
+        self._values = values
+
+    def __len__(self):
+        return len(self._values)
+
+    def last(self, default=0.0):
+        if not len(self._values):
+            return default
+        return self._values[-1]
+
+    def release(self):
+        self._values.release()
+
+    def view(self, count=None):
+        """Returns the most recent values, oldest first, as a zero-copy memoryview over the mapped file.
+        """
+        if count is None or count > len(self._values):
+            return self._values
+        return self._values[len(self._values) - count:]
+
+
+class TraceReader:
+    def __init__(self, path):
+        """Memory-maps a trace for replay. Nothing is parsed or copied: columns are strided views over the mapped file,
+        so opening a trace of millions of samples is immediate. A record left incomplete by a crash is ignored.
+        @param (str) path:
+        The trace path.
+        @return (None):
+        No return value.
+        """
+        self.path = path
+        with open(path, "rb") as trace:
+            self.fields, header_size = _unpack_header(trace.read(_header_size(255)))
+            record_size = len(self.fields) * 8
+            count = (os.fstat(trace.fileno()).st_size - header_size) // record_size
+            if count > 0:
+                self._map = mmap.mmap(trace.fileno(), 0, access=mmap.ACCESS_READ)
+                self._data = memoryview(self._map)[header_size:header_size + count * record_size].cast('d')
+            else:
+                self._map = None
+                self._data = memoryview(b"").cast('d')
+        width = len(self.fields)
+        self._columns = dict((name, TraceColumn(self._data[index::width])) for index, name in enumerate(self.fields))
+        self.timestamps = self._columns['timestamp']
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    @property
+    def columns(self):
+        return self.fields[1:]
+
+    def close(self):
+        """Releases the views and unmaps the file. The reader can't be used afterwards.
+        """
+        for column in self._columns.values():
+            column.release()
+        self._columns = {}
+        self.timestamps = None
+        self._data.release()
+        if self._map is not None:
+            try:
+                self._map.close()
+            except BufferError:
+                # A view handed out earlier is still referenced; the mapping goes away with it.
+                pass
+            self._map = None
+
+    def column(self, name):
+        return self._columns[name]
+
+    def interval(self):
+        """Returns the mean time between two of the traced samples, in seconds, or zero with less than two samples.
+        """
+        count = len(self)
+        if count < 2:
+            return 0.0
+        timestamps = self.timestamps.view()
+        return (timestamps[-1] - timestamps[0]) / (count - 1)
+
+    def truncated(self):
+        """A trace always holds every sample since it was started, so no part of it is to be found in history tiers.
+        """
+        return False
+
+    def view(self, name, count=None):
+        return self._columns[name].view(count)
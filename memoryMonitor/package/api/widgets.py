@@ -1,6 +1,51 @@
-from PySide2 import QtWidgets, QtCore, QtGui, QtCharts
+from PySide2 import QtWidgets, QtCore, QtGui
+from array import array
+import bisect
+import collections
 import nuke
-from package.api.funcstore import nk_value, ram_percentage, find_multiplier
+from package.api.funcstore import ram_percentage, find_multiplier, format_duration, format_timestamp, latest_snapshot, \
+    ListsModifier, METRICS
+from package.api.memoryinfo import COLUMN_PREFIX
+from package.api.profiler import PROFILER
+from package.api.samplestore import SampleStore, minmax_decimate
+from package.api.stats import LeakDetector, RollingStats
+
+
+# Maximum number of major ticks on the monitor X axis, whatever the number of samples displayed.
+MAX_TICKS = 20
+# Title of the monitor chart while it displays live samples.
+CHART_TITLE = "Hover the points to display individual values, click to pin them."
+# Maximum number of pinned callouts. Pinning past it recycles the least recently pinned one.
+CALLOUT_POOL_SIZE = 32
+# Distance from a point within which the cursor displays its tooltip, in pixels.
+HOVER_RADIUS = 8
+# Renderers of the monitor chart: QtCharts, or a lightweight item painting straight from the drawn points.
+QTCHARTS = "qtcharts"
+PAINTER = "painter"
+RENDERERS = (QTCHARTS, PAINTER)
+# Names and line colors of the metrics the monitor can plot next to the memory used by Nuke.
+METRIC_LABELS = {'max_usage': "Nuke max usage", 'python_heap': "Python heap", 'rss': "Process RSS",
+                 'pss': "Process PSS", 'anon': "Anonymous memory", 'swap': "Swap"}
+METRIC_COLORS = {'max_usage': (255, 80, 80), 'python_heap': (255, 220, 0), 'rss': (80, 255, 120),
+                 'pss': (0, 160, 255), 'anon': (255, 130, 255), 'swap': (255, 160, 60)}
+# Fill colors of the stacked areas of the memory breakdown, from the bottom one up.
+BAND_COLORS = ((0, 150, 200, 170), (230, 120, 40, 170), (120, 200, 60, 170), (200, 70, 160, 170),
+               (240, 210, 60, 170), (90, 110, 230, 170), (60, 200, 180, 170), (200, 60, 60, 170))
+
+
+def nearest_index(values, x):
+    """Finds the value closest to x in a sorted array with a binary search.
+    @param (array) values:
+    The values, in ascending order.
+    @param (float) x:
+    The value to look for.
+    @return (int) index:
+    The index of the closest value, or -1 if there are no values.
+    """
+    index = bisect.bisect_left(values, x)
+    if index == len(values) or (index and x - values[index - 1] < values[index] - x):
+        index -= 1
+    return index
 
 
 class Callout(QtWidgets.QGraphicsItem):
@@ -18,6 +63,7 @@ class Callout(QtWidgets.QGraphicsItem):
         self._anchor = QtCore.QPointF()
         self._font = QtGui.QFont()
         self._rect = QtCore.QRectF()
+        self.timestamp = None
 
     def boundingRect(self):
         anchor = self.mapFromParent(self._chart.mapToPosition(self._anchor))
@@ -57,6 +103,10 @@ class Callout(QtWidgets.QGraphicsItem):
         self.prepareGeometryChange()
         self._rect = self._text_rect.adjusted(-5, -5, 5, 5)
 
+    @property
+    def anchor(self):
+        return self._anchor
+
     def set_anchor(self, point):
         self._anchor = QtCore.QPointF(point)
 
@@ -78,30 +128,14 @@ class ColorSettings(QtWidgets.QHBoxLayout):
         @return (None):
         No return value.
         """
-        super(ColorSettings, self).__init__(label, signal, target)
-        color_label = self.create_sublabel(label)
+        super(ColorSettings, self).__init__()
+        color_label = SubLabel(label, QtGui.QFont("Calibri", 9))
         color_button = QtWidgets.QPushButton('Open color dialog')
         color_button.clicked.connect(lambda: signal(target))
         self.addWidget(color_label, 4, QtCore.Qt.AlignLeft)
         self.addWidget(color_button, 1, QtCore.Qt.AlignRight)
 
 
-class CustomAxis(QtCharts.QValueAxis):
-    def __init__(self, text):
-        """ A subclass of the QValueAxis to be featured in the Monitor chart.
-        @param (str) text:
-        The name of the axis title.
-        @return (None):
-        No return value.
-        """
-        super(CustomAxis, self).__init__(text)
-        self.setTitleText(text)
-        self.setTitleBrush(QtGui.QBrush(QtGui.QColor("lightGrey")))
-        self.setTitleFont(QtGui.QFont("Calibri", 14, QtGui.QFont.Bold))
-        self.setLabelsFont(QtGui.QFont("Calibri", 10, QtGui.QFont.Bold))
-        self.setLabelsColor(QtGui.QColor("grey"))
-
-
 class CustomPushButton(QtWidgets.QPushButton):
     def __init__(self, text, tooltip):
         """ A subclass of the QPushButton to be featured in the Monitor chart.
@@ -112,7 +146,7 @@ class CustomPushButton(QtWidgets.QPushButton):
         @return (None):
         No return value.
         """
-        super(CustomPushButton, self).__init__(text, tooltip)
+        super(CustomPushButton, self).__init__(text)
         self.setText(text)
         self.setToolTip(tooltip)
         self.setCheckable(False)
@@ -120,23 +154,97 @@ class CustomPushButton(QtWidgets.QPushButton):
 
 
 class Monitor(QtWidgets.QGraphicsView):
-    def __init__(self, parent=None):
-        """Main widget for the monitor and its chart.
+    # Emitted once the chart has been built, for the owner to draw the samples gathered in the meantime.
+    chartBuilt = QtCore.Signal()
+
+    def __init__(self, parent=None, renderer=QTCHARTS):
+        """Main widget for the monitor and its chart. Only the sample store and the statistics are created here, so
+        that sampling can run right away: the chart is built the first time the widget is shown.
+        @param (QWidget) parent:
+        The parent widget.
+        @param (str) renderer:
+        The renderer of the chart, one of RENDERERS.
+        @return (None):
+        No return value.
         """
         super(Monitor, self).__init__(parent)
+        self.renderer = renderer
         self._max_sample = 20
-        self.mem_list = [0 for x in list(range(self._max_sample + 1))]
-        self.dt_list = ["---" for y in list(range(self._max_sample + 1))]
+        self.samples = SampleStore(columns=METRICS)
+        self.source = self.samples
+        self.stats = RollingStats(self.samples, 'usage', self._max_sample + 1)
+        self.leaks = LeakDetector(self.samples, 'usage')
+        self.scale_to_highest = True
+        self.colors = {}
+        # Metrics plotted besides the usage, mapped to True for those plotted against a Y axis of their own.
+        self.metrics = {}
+        self._metric_series = {}
+        self._shared_highest = 0.0
+        # Whether the memory breakdown is drawn as stacked areas under the usage line, and its (column, upper, area)
+        # bands from the bottom one up.
+        self.breakdown = False
+        self._bands = []
+        self._drawn_x = array('d')
+        self._drawn_y = array('d')
+        self._drawn_t = array('d')
+        self._callouts = collections.deque()
+        self._action_markers = []
+        self._action_x = array('d')
+        self._event_markers = []
+        self._event_x = array('d')
+        self._chart = None
+        self._tooltip = None
 
         self.setScene(QtWidgets.QGraphicsScene(self))
 
-        self.setDragMode(QGraphicsView.NoDrag)
+        self.setDragMode(QtWidgets.QGraphicsView.NoDrag)
         self.setVerticalScrollBarPolicy(QtCore.Qt.ScrollBarAlwaysOff)
         self.setHorizontalScrollBarPolicy(QtCore.Qt.ScrollBarAlwaysOff)
+        self.setRenderHint(QtGui.QPainter.Antialiasing)
+        self.setMouseTracking(True)
+        self.viewport().setMouseTracking(True)
+
+    @property
+    def built(self):
+        return self._chart is not None
+
+    def build(self):
+        """Builds the chart with the current renderer, applies the settings made so far and emits chartBuilt.
+        """
+        if self._chart is not None:
+            return
+        if self.renderer == PAINTER:
+            self.build_plot()
+        else:
+            self.build_chart()
+
+        self.scene().addItem(self._chart)
+        self._chart.resize(QtCore.QSizeF(self.size()))
+
+        self._coordX = self.create_coord()
+        self._coordY = self.create_coord()
+        self._tooltip = Callout(self._chart)
+        self._tooltip.hide()
+
+        for target in self.colors:
+            self.apply_color(target)
+        for name in self.metrics:
+            self.build_metric(name)
+        self.areaSeries.setVisible(not self.breakdown)
+        self.set_scale(self.scale_to_highest)
+        self.define_tick_count()
+        self.chartBuilt.emit()
+
+    def build_chart(self):
+        """Builds the QtCharts chart, its axes and series. QtCharts is only imported here, which keeps it out of the
+        panel startup.
+        """
+        from PySide2 import QtCharts
+        from package.api.charts import CustomAxis
 
         self._chart = QtCharts.QChart()
         self._chart.setBackgroundBrush(QtGui.QBrush(QtGui.QColor("black")))
-        self._chart.setTitle("Hover the points to display individual values.")
+        self._chart.setTitle(CHART_TITLE)
         self._chart.legend().hide()
 
         self.upperSeries = QtCharts.QLineSeries()
@@ -166,37 +274,374 @@ class Monitor(QtWidgets.QGraphicsView):
 
         self.attach_axis(self.upperSeries)
         self.attach_axis(self.pointsSeries)
-        self.append_series()
 
         self.areaSeries = QtCharts.QAreaSeries(self.upperSeries)
-        self.areaPen = QtGui.QPen(Qt.cyan)
+        self.areaPen = QtGui.QPen(QtGui.QColor("cyan"))
         self.areaPen.setWidth(3)
         self.areaSeries.setPen(self.areaPen)
 
         self._chart.addSeries(self.areaSeries)
         self.attach_axis(self.areaSeries)
 
-        self.set_hlcb_area_gradient()
+        self.forecastSeries = QtCharts.QLineSeries()
+        forecast_pen = QtGui.QPen(QtGui.QColor(255, 80, 80))
+        forecast_pen.setWidth(2)
+        forecast_pen.setStyle(QtCore.Qt.DashLine)
+        self.forecastSeries.setPen(forecast_pen)
+        self._chart.addSeries(self.forecastSeries)
+        self.attach_axis(self.forecastSeries)
 
-        self.setRenderHint(QtGui.QPainter.Antialiasing)
-        self.scene().addItem(self._chart)
+        self.actionsSeries = QtCharts.QScatterSeries()
+        self.actionsSeries.setMarkerShape(QtCharts.QScatterSeries.MarkerShapeRectangle)
+        self.actionsSeries.setMarkerSize(12)
+        self.actionsSeries.setColor(QtGui.QColor(255, 140, 0))
+        self.actionsSeries.setBorderColor(QtGui.QColor("white"))
+        self._chart.addSeries(self.actionsSeries)
+        self.attach_axis(self.actionsSeries)
 
-        self._coordX = self.create_coord()
-        self._coordY = self.create_coord()
-        self._callouts = []
-        self._tooltip = Callout(self._chart)
-        self.pointsSeries.hovered.connect(self.tooltip)
+        self.eventsSeries = QtCharts.QScatterSeries()
+        self.eventsSeries.setMarkerSize(8)
+        self.eventsSeries.setColor(QtGui.QColor(190, 90, 255))
+        self.eventsSeries.setBorderColor(QtGui.QColor("transparent"))
+        self._chart.addSeries(self.eventsSeries)
+        self.attach_axis(self.eventsSeries)
 
-        self.setMouseTracking(True)
+    def build_plot(self):
+        """Builds the lightweight chart, which paints the series straight from the drawn points with QPainter. It takes
+        the same calls as the QtCharts chart, so the rest of the monitor drives both alike.
+        """
+        from package.api.plot import PlotItem, PlotSeries
+
+        self._chart = PlotItem()
+        self._chart.setTitle(CHART_TITLE)
+
+        area_pen = QtGui.QPen(QtGui.QColor("cyan"))
+        area_pen.setWidth(3)
+        self.upperSeries = PlotSeries(self._chart, area_pen)
+        self.areaSeries = self._chart.add_series(PlotSeries(self._chart, upper=self.upperSeries))
+        self._chart.add_series(self.upperSeries)
+        self.pointsSeries = self._chart.add_series(PlotSeries(self._chart, marker="circle", marker_size=10))
+        self.pointsSeries.setColor(QtGui.QColor("cyan"))
+
+        forecast_pen = QtGui.QPen(QtGui.QColor(255, 80, 80))
+        forecast_pen.setWidth(2)
+        forecast_pen.setStyle(QtCore.Qt.DashLine)
+        self.forecastSeries = self._chart.add_series(PlotSeries(self._chart, forecast_pen))
+
+        self.actionsSeries = self._chart.add_series(PlotSeries(self._chart, QtGui.QPen(QtGui.QColor("white")),
+                                                               marker="square", marker_size=12))
+        self.actionsSeries.setColor(QtGui.QColor(255, 140, 0))
+        self.eventsSeries = self._chart.add_series(PlotSeries(self._chart, marker="circle", marker_size=8))
+        self.eventsSeries.setColor(QtGui.QColor(190, 90, 255))
+
+        self.axis_x = self._chart.axis_x
+        self.axis_x.setTitleText("Number of samples")
+        self.axis_y = self._chart.axis_y
+        self.axis_y.setTitleText("Memory (in MB)")
+        self.axis_x.setRange(0, 20)
+        self.axis_y.setRange(0, 50)
+        self.axis_x.setMinorTickCount(4)
+
+    def build_metric(self, name):
+        """Adds the line of a metric to the chart, against the memory axis or against a Y axis of its own on the right.
+        @param (str) name:
+        The metric column.
+        @return (None):
+        No return value.
+        """
+        pen = QtGui.QPen(QtGui.QColor(*METRIC_COLORS.get(name, (255, 255, 255))))
+        pen.setWidth(2)
+        axis = None
+        if self.renderer == PAINTER:
+            from package.api.plot import PlotSeries
+            if self.metrics[name]:
+                axis = self._chart.add_axis(METRIC_LABELS.get(name, name))
+            series = self._chart.add_series(PlotSeries(self._chart, pen, axis_y=axis))
+        else:
+            from PySide2 import QtCharts
+            from package.api.charts import CustomAxis
+            series = QtCharts.QLineSeries()
+            series.setPen(pen)
+            self._chart.addSeries(series)
+            series.attachAxis(self.axis_x)
+            if self.metrics[name]:
+                axis = CustomAxis(METRIC_LABELS.get(name, name))
+                axis.setGridLineVisible(False)
+                self._chart.addAxis(axis, QtCore.Qt.AlignRight)
+                series.attachAxis(axis)
+            else:
+                series.attachAxis(self.axis_y)
+        if axis is not None:
+            axis.setLabelsColor(pen.color())
+            axis.setTitleBrush(QtGui.QBrush(pen.color()))
+            axis.setRange(0, 50)
+        self._metric_series[name] = (series, axis)
+
+    def remove_metric(self, name):
+        """Removes the line of a metric and its Y axis, if it has one, from the chart.
+        """
+        series, axis = self._metric_series.pop(name)
+        if self.renderer == PAINTER:
+            self._chart.remove_series(series)
+            if axis is not None:
+                self._chart.remove_axis(axis)
+        else:
+            self._chart.removeSeries(series)
+            if axis is not None:
+                self._chart.removeAxis(axis)
+
+    def set_metrics(self, metrics):
+        """Sets the metrics plotted besides the memory used by Nuke. Each one costs a line series, and an axis if it is
+        given its own scale.
+        @param (dict) metrics:
+        The metric columns to plot, mapped to True for a Y axis of their own, False to share the memory axis.
+        @return (None):
+        No return value.
+        """
+        previous = self.metrics
+        self.metrics = dict(metrics)
+        if self._chart is None:
+            return
+        for name in previous:
+            if previous[name] != self.metrics.get(name):
+                self.remove_metric(name)
+        for name in self.metrics:
+            if name not in self._metric_series:
+                self.build_metric(name)
+        self.append_series()
+
+    def set_breakdown(self, shown):
+        """Shows or hides the memory breakdown, drawn as stacked areas in place of the area under the usage line.
+        @param (bool) shown:
+        True to draw the breakdown.
+        @return (None):
+        No return value.
+        """
+        self.breakdown = shown
+        if self._chart is None:
+            return
+        self.areaSeries.setVisible(not shown)
+        if shown:
+            self.append_breakdown()
+        else:
+            self.remove_bands()
+
+    def build_bands(self, columns):
+        """Builds an area per category of the breakdown, reaching from the bottom of the chart up to the sum of the
+        category and the ones under it. Areas are drawn from the top one down, each covering the share of the one
+        above it which belongs to the categories under it, so they stack without needing a lower boundary.
+        @param (list) columns:
+        The sample store columns of the categories, from the bottom one up.
+        @return (None):
+        No return value.
+        """
+        self.remove_bands()
+        for index, column in enumerate(columns):
+            color = QtGui.QColor(*BAND_COLORS[index % len(BAND_COLORS)])
+            if self.renderer == PAINTER:
+                from package.api.plot import PlotSeries
+                upper = PlotSeries(self._chart)
+                area = PlotSeries(self._chart, upper=upper)
+                area.setBrush(color)
+                self._chart.add_series(area, 0)
+            else:
+                from PySide2 import QtCharts
+                upper = QtCharts.QLineSeries()
+                area = QtCharts.QAreaSeries(upper)
+                area.setColor(color)
+                area.setBorderColor(color)
+            self._bands.append((column, upper, area))
+        if self.renderer != PAINTER:
+            for column, upper, area in reversed(self._bands):
+                self._chart.addSeries(area)
+                self.attach_axis(area)
+            self.raise_series()
+
+    def remove_bands(self):
+        for column, upper, area in self._bands:
+            if self.renderer == PAINTER:
+                self._chart.remove_series(area)
+            else:
+                self._chart.removeSeries(area)
+        self._bands = []
+
+    def raise_series(self):
+        """Adds the QtCharts series drawn over the breakdown again, as QtCharts draws series in the order they were
+        added.
+        """
+        for series in (self.upperSeries, self.pointsSeries, self.forecastSeries, self.actionsSeries,
+                       self.eventsSeries):
+            self._chart.removeSeries(series)
+            self._chart.addSeries(series)
+            self.attach_axis(series)
+        for series, axis in self._metric_series.values():
+            self._chart.removeSeries(series)
+            self._chart.addSeries(series)
+            series.attachAxis(self.axis_x)
+            series.attachAxis(axis or self.axis_y)
+
+    def append_breakdown(self):
+        """Stacks the categories of the breakdown recorded over the window. The bands are built again whenever a
+        category shows up.
+        """
+        columns = [name for name in self.source.columns if name.startswith(COLUMN_PREFIX)]
+        if columns != [band[0] for band in self._bands]:
+            self.build_bands(columns)
+        positions = None
+        totals = None
+        for column, upper, area in self._bands:
+            points = self.visible_points(column)
+            if totals is None:
+                positions = [x for x, y in points]
+                totals = [y for x, y in points]
+            else:
+                # A category which showed up later may have fewer history buckets; the stack ends on the latest point.
+                count = min(len(points), len(totals))
+                positions = positions[len(positions) - count:]
+                totals = [total + y for total, (x, y) in zip(totals[len(totals) - count:],
+                                                             points[len(points) - count:])]
+            upper.replace([QtCore.QPointF(x, y) for x, y in zip(positions, totals)])
+
+    def set_renderer(self, renderer):
+        """Switches the chart to another renderer. A chart already built is rebuilt, without its pinned callouts.
+        @param (str) renderer:
+        The renderer, one of RENDERERS.
+        @return (None):
+        No return value.
+        """
+        if renderer == self.renderer:
+            return
+        self.renderer = renderer
+        if self._chart is None:
+            return
+        self.scene().removeItem(self._chart)
+        self._chart = None
+        self._tooltip = None
+        self._metric_series = {}
+        self._bands = []
+        self._callouts.clear()
+        self._action_markers = []
+        self._action_x = array('d')
+        self._event_markers = []
+        self._event_x = array('d')
+        self.build()
+
+    def showEvent(self, event):
+        self.build()
+        QtWidgets.QGraphicsView.showEvent(self, event)
+
+    def apply_color(self, target):
+        """Applies the color set for a part of the chart.
+        @param (str) target:
+        The part of the chart: BG, Grid, Line, Points, AxisLabels or AxisTitles.
+        @return (None):
+        No return value.
+        """
+        color = self.colors[target]
+        if target == "BG":
+            self._chart.setBackgroundBrush(QtGui.QBrush(color))
+        elif target == "Grid":
+            for axis in (self.axis_x, self.axis_y):
+                axis.setGridLineColor(color)
+                axis.setMinorGridLineColor(color)
+        elif target == "Line":
+            self.upperSeries.setColor(color)
+        elif target == "Points":
+            self.pointsSeries.setColor(color)
+        elif target == "AxisLabels":
+            self.axis_x.setLabelsColor(color)
+            self.axis_y.setLabelsColor(color)
+        elif target == "AxisTitles":
+            self.axis_x.setTitleBrush(QtGui.QBrush(color))
+            self.axis_y.setTitleBrush(QtGui.QBrush(color))
+
+    def set_color(self, target, color):
+        """Sets the color of a part of the chart. Colors set before the chart is built are applied when it is.
+        @param (str) target:
+        The part of the chart: BG, Grid, Line, Points, AxisLabels or AxisTitles.
+        @param (QColor) color:
+        The new color.
+        @return (None):
+        No return value.
+        """
+        self.colors[target] = QtGui.QColor(color)
+        if self._chart is not None:
+            self.apply_color(target)
+
+    def set_scale(self, to_highest):
+        """Fits the Y axis either to the highest memory value of the window or to the maximum Nuke can allocate, with
+        the matching area gradient.
+        @param (bool) to_highest:
+        True to fit the highest memory value, False to fit max_usage.
+        @return (None):
+        No return value.
+        """
+        self.scale_to_highest = to_highest
+        if self._chart is None:
+            return
+        if to_highest:
+            self.axis_y.setRange(0, round(self.highest(), -1) + 50)
+            self.set_hlcb_area_gradient()
+        else:
+            self.axis_y.setRange(0, latest_snapshot().max_usage)
+            self.set_mccb_area_gradient()
+
+    def rescale(self):
+        """Follows the highest memory value of the window with the Y axis, if the axis is fit to it.
+        """
+        if self._chart is not None and self.scale_to_highest:
+            self.axis_y.setRange(0, round(self.highest(), -1) + 50)
 
     def attach_axis(self, series):
         series.attachAxis(self.axis_x)
         series.attachAxis(self.axis_y)
 
     def append_series(self):
-        for index, value in enumerate(self.mem_list):
-            self.upperSeries.append(index, value)
-            self.pointsSeries.append(index, value)
+        """Submits the whole window to the line and points series in a single bulk replace. Each series then emits one
+        change signal per tick, and the area series built on the line is recomputed once, instead of once per point.
+        The lines of the other metrics plotted are replaced the same way, from the same window.
+        """
+        if self._chart is None:
+            return
+        start = PROFILER.start()
+        points = [QtCore.QPointF(x, y) for x, y in self.visible_points()]
+        PROFILER.stop("decimate", start)
+        start = PROFILER.start()
+        self.upperSeries.replace(points)
+        self.pointsSeries.replace(points)
+        self.update_callouts()
+        PROFILER.stop("series", start)
+        if self._metric_series:
+            start = PROFILER.start()
+            self.append_metrics()
+            PROFILER.stop("metrics", start)
+        if self.breakdown:
+            start = PROFILER.start()
+            self.append_breakdown()
+            PROFILER.stop("breakdown", start)
+
+    def append_metrics(self):
+        """Replaces the lines of the metrics plotted besides the usage. Axes of their own fit the highest value drawn,
+        and the highest value of the lines sharing the memory axis is kept for rescale(), so that none goes off the
+        chart.
+        """
+        columns = self.source.columns
+        highest = 0.0
+        for name, (series, axis) in self._metric_series.items():
+            if name not in columns:
+                # A trace recorded before the metric existed.
+                series.clear()
+                continue
+            points = self.visible_points(name)
+            series.replace([QtCore.QPointF(x, y) for x, y in points])
+            maximum = max([y for x, y in points], default=0.0)
+            if axis is not None:
+                axis.setRange(0, maximum * 1.1 or 1.0)
+            elif maximum > highest:
+                highest = maximum
+        self._shared_highest = highest
+        if self.scale_to_highest and highest > self.axis_y.max():
+            self.rescale()
 
     @property
     def chart(self):
@@ -212,16 +657,79 @@ class Monitor(QtWidgets.QGraphicsView):
     def define_tick_count(self):
         """Set new count for ticks and minor ticks on the monitor chart.
         """
-        tick_count_num = find_multiplier(self.max_sample) + 1
+        if self._chart is None:
+            return
+        tick_count_num = find_multiplier(self.max_sample, MAX_TICKS) + 1
         self.axis_x.setTickCount(tick_count_num)
-        minor_tick_count_num = (self.max_sample / tick_count_num)
+        minor_tick_count_num = min(self.max_sample // tick_count_num, 4)
         self.axis_x.setMinorTickCount(minor_tick_count_num)
 
+    def show_forecast(self):
+        """Draws the leak forecast overlay when the leak detector flags a sustained growth: the longest window trend is
+        drawn over its samples and projected past the latest one, and the chart title tells when max_usage should be
+        reached. The overlay is cleared otherwise.
+        """
+        if self._chart is None:
+            return
+        interval = self.samples.interval()
+        if self.source is not self.samples or not self.leaks.leaking or not interval:
+            self.forecastSeries.clear()
+            self.axis_x.setRange(0, self.max_sample)
+            if self.source is self.samples:
+                self._chart.setTitle(CHART_TITLE)
+            return
+        slope, current, remaining = self.leaks.forecast(latest_snapshot().max_usage)
+        horizon = max(self.max_sample // 4, 1)
+        start = max(self.max_sample + 1 - self.leaks.trends[-1].count, 0)
+        per_sample = slope * interval
+        self.axis_x.setRange(0, self.max_sample + horizon)
+        self.forecastSeries.replace([QtCore.QPointF(start, current - per_sample * (self.max_sample - start)),
+                                     QtCore.QPointF(self.max_sample + horizon, current + per_sample * horizon)])
+        self._chart.setTitle("Memory growing by {0:.2f} MB/min: max_usage reached in about {1:s}"
+                             .format(slope * 60, format_duration(remaining)))
+
     def keepCallout(self):
-        """ Creates a graphical tooltip for the points series.
+        """Pins the tooltip currently displayed. Pinned callouts form a bounded pool kept in least recently pinned
+        order: pinning a point already pinned only moves its callout to the back, and once the pool is full the oldest
+        callout is recycled as the next hover tooltip, so no graphics item is created past CALLOUT_POOL_SIZE.
         """
-        self._callouts.append(self._tooltip)
-        self._tooltip = Callout(self._chart)
+        tooltip = self._tooltip
+        if tooltip is None or not tooltip.isVisible():
+            return
+        for callout in self._callouts:
+            if callout.timestamp == tooltip.timestamp:
+                self._callouts.remove(callout)
+                self._callouts.append(callout)
+                tooltip.hide()
+                return
+        self._callouts.append(tooltip)
+        if len(self._callouts) > CALLOUT_POOL_SIZE:
+            self._tooltip = self._callouts.popleft()
+            self._tooltip.hide()
+        else:
+            self._tooltip = Callout(self._chart)
+
+    def pinned_times(self):
+        """Returns the timestamps of the pinned callouts, from the least to the most recently pinned.
+        """
+        return [callout.timestamp for callout in self._callouts]
+
+    def sample_value(self, name, timestamp):
+        """Returns a metric recorded with a live sample, such as the Python heap or the process RSS.
+        @param (str) name:
+        The column of the metric.
+        @param (float) timestamp:
+        The timestamp of the sample, as epoch seconds.
+        @return (float) value:
+        The value, in MB, or 0 if it wasn't recorded or the timestamp isn't one of a stored sample.
+        """
+        if self.source is not self.samples:
+            return 0.0
+        timestamps = self.samples.timestamps.view()
+        index = bisect.bisect_left(timestamps, timestamp)
+        if index == len(timestamps) or timestamps[index] != timestamp:
+            return 0.0
+        return self.samples.view(name)[index]
 
     @property
     def max_sample(self):
@@ -233,9 +741,249 @@ class Monitor(QtWidgets.QGraphicsView):
             nuke.message("You need to enter a value higher than one.")
         else:
             self._max_sample = new_sample
+            self.stats.resize(new_sample + 1)
+
+    def replay(self, reader):
+        """Displays a recorded trace instead of the live samples. Live sampling carries on in the background.
+        @param (TraceReader) reader:
+        The memory-mapped trace to display.
+        @return (None):
+        No return value.
+        """
+        self.stop_replay()
+        self.source = reader
+        if self._chart is not None:
+            self._chart.setTitle("Replaying {0:s}".format(reader.path))
+
+    def stop_replay(self):
+        """Closes the trace being replayed, if any, and goes back to the live samples.
+        """
+        if self.source is not self.samples:
+            reader = self.source
+            self.source = self.samples
+            self._drawn_x = array('d')
+            self._drawn_y = array('d')
+            self._drawn_t = array('d')
+            reader.close()
+        if self._chart is not None:
+            self._chart.setTitle(CHART_TITLE)
+
+    def window(self):
+        """Returns zero-copy views over the timestamps and memory values of the samples currently displayed.
+        """
+        return ListsModifier(self.source, self.max_sample).window()
+
+    def window_maximum(self):
+        """Returns the highest memory value of the window, from the rolling statistics when they cover it.
+        """
+        if self.source is self.samples and self.max_sample + 1 <= self.stats.window:
+            return self.stats.maximum.value
+        return max(self.window()[1], default=0)
+
+    def highest(self):
+        """Returns the highest value the memory axis fits: the highest memory value of the window, or the highest value
+        drawn by a line sharing the axis if higher.
+        """
+        if not self._metric_series:
+            return self.window_maximum()
+        return max(self.window_maximum(), self._shared_highest)
+
+    def window_offset(self):
+        """Returns the x position of the oldest displayed sample, so that the latest one is always drawn on the right
+        edge of the chart even when the store holds fewer samples than the window.
+        """
+        return max(self.max_sample + 1 - len(self.source), 0)
+
+    def visible_points(self, name='usage'):
+        """Returns the points to draw for the current window, with at most about one point per pixel of the plot area.
+        Samples still held at full rate are min/max decimated when they outnumber the pixels. The part of the window
+        older than the full rate history is drawn from the finest history tier that fits the pixels left for it, so the
+        draw cost only depends on the chart width.
+        @param (str) name:
+        The metric column to draw. The points of the usage are kept for hovering and markers.
+        @return (list) points:
+        (x, value) tuples, ordered by x.
+        """
+        timestamps, values = ListsModifier(self.source, self.max_sample).window(name)
+        window = self.max_sample + 1
+        offset = self.window_offset()
+        buckets = max(int(self._chart.plotArea().width()) // 2, 1)
+        points = []
+        drawn_x = array('d')
+        drawn_y = array('d')
+        drawn_t = array('d')
+
+        interval = self.source.interval()
+        if offset and self.source.truncated() and interval:
+            last = timestamps[-1]
+            first = last - self.max_sample * interval
+            tier = self.source.history(name).select(offset * interval, max(buckets * offset // window, 1))
+            starts = tier.starts.view()
+            minimums = tier.minimums.view()
+            maximums = tier.maximums.view()
+            for index in range(bisect.bisect_left(starts, first), len(starts)):
+                middle = starts[index] + tier.resolution * 0.5
+                if middle >= timestamps[0]:
+                    break
+                x = self.max_sample - (last - middle) / interval
+                for value in (minimums[index], maximums[index]):
+                    points.append((x, value))
+                    drawn_x.append(x)
+                    drawn_y.append(value)
+                    drawn_t.append(middle)
+
+        for position, value in minmax_decimate(values, max(buckets * len(values) // window, 1)):
+            points.append((offset + position, value))
+            drawn_x.append(offset + position)
+            drawn_y.append(value)
+            drawn_t.append(timestamps[int(position)])
+        if name == 'usage':
+            self._drawn_x = drawn_x
+            self._drawn_y = drawn_y
+            self._drawn_t = drawn_t
+        return points
+
+    def time_position(self, timestamp):
+        """Returns the chart x position of a timestamp, interpolated between the drawn points around it.
+        @param (float) timestamp:
+        The timestamp, as epoch seconds.
+        @return (float) x:
+        The x position, in chart value, or None if the timestamp is outside the drawn window.
+        """
+        index = bisect.bisect_left(self._drawn_t, timestamp)
+        if index == len(self._drawn_t) or (index == 0 and timestamp < self._drawn_t[0]):
+            return None
+        if self._drawn_t[index] == timestamp or index == 0:
+            return self._drawn_x[index]
+        t0, t1 = self._drawn_t[index - 1], self._drawn_t[index]
+        x0, x1 = self._drawn_x[index - 1], self._drawn_x[index]
+        return x0 + (x1 - x0) * (timestamp - t0) / (t1 - t0)
+
+    def show_policy_actions(self, actions):
+        """Draws a marker for every policy action within the drawn window, at the memory used before the action.
+        @param (iterable) actions:
+        The PolicyAction records.
+        @return (None):
+        No return value.
+        """
+        if self._chart is None:
+            return
+        self._action_markers = []
+        self._action_x = array('d')
+        points = []
+        for action in actions:
+            x = self.time_position(action.timestamp)
+            if x is not None:
+                self._action_markers.append((x, action))
+                self._action_x.append(x)
+                points.append(QtCore.QPointF(x, action.before))
+        self.actionsSeries.replace(points)
+
+    def show_events(self, log):
+        """Draws a marker at the bottom of the chart for every Nuke event within the drawn window. The events are found
+        with a binary search on the log timestamps, and events closer than a pixel are merged into one marker, so that
+        a slider drag firing hundreds of knob changes only costs a single marker.
+        @param (EventLog) log:
+        The event log.
+        @return (None):
+        No return value.
+        """
+        if self._chart is None:
+            return
+        self._event_markers = []
+        self._event_x = array('d')
+        points = []
+        if self.source is self.samples and len(log) and len(self._drawn_t):
+            timestamps = log.timestamps.view()
+            step = self.max_sample / max(self._chart.plotArea().width(), 1.0)
+            for index in range(bisect.bisect_left(timestamps, self._drawn_t[0]),
+                               bisect.bisect_right(timestamps, self._drawn_t[-1])):
+                x = self.time_position(timestamps[index])
+                if x is None:
+                    continue
+                if self._event_x and x - self._event_x[-1] < step:
+                    self._event_markers[-1][1] += 1
+                    continue
+                self._event_markers.append([log.event(index), 1])
+                self._event_x.append(x)
+                points.append(QtCore.QPointF(x, 0))
+        self.eventsSeries.replace(points)
+
+    def sample_time(self, x):
+        """Returns the timestamp of the drawn point closest to a chart x position.
+        @param (float) x:
+        The x position, in chart value.
+        @return (float) timestamp:
+        The timestamp of the closest point, as epoch seconds.
+        """
+        return self._drawn_t[nearest_index(self._drawn_x, x)]
+
+    def hit_test(self, position):
+        """Finds the drawn point, policy action or event marker under a position, with a binary search on the drawn x
+        values followed by a pixel distance check on the few points around the closest x.
+        @param (QPointF) position:
+        The position, in chart item coordinates.
+        @return (tuple) hit:
+        The anchor of the point, in chart value, its timestamp and its tooltip text, or None if nothing is hovered.
+        """
+        x = self._chart.mapToValue(position).x()
+        index = nearest_index(self._action_x, x)
+        if index >= 0:
+            action = self._action_markers[index][1]
+            anchor = QtCore.QPointF(self._action_x[index], action.before)
+            if self.hovers(position, anchor):
+                return anchor, action.timestamp, self.action_tooltip(action)
+        index = nearest_index(self._event_x, x)
+        if index >= 0:
+            event, count = self._event_markers[index]
+            anchor = QtCore.QPointF(self._event_x[index], 0)
+            if self.hovers(position, anchor):
+                return anchor, event[0], self.event_tooltip(event, count)
+        index = nearest_index(self._drawn_x, x)
+        if index < 0:
+            return None
+        # Decimated points come in min/max pairs sharing the same x, so the neighbours are checked as well.
+        best = None
+        best_distance = HOVER_RADIUS
+        for candidate in range(max(index - 2, 0), min(index + 3, len(self._drawn_x))):
+            anchor = QtCore.QPointF(self._drawn_x[candidate], self._drawn_y[candidate])
+            distance = (self._chart.mapToPosition(anchor) - position).manhattanLength()
+            if distance <= best_distance:
+                best = candidate
+                best_distance = distance
+        if best is None:
+            return None
+        anchor = QtCore.QPointF(self._drawn_x[best], self._drawn_y[best])
+        return anchor, self._drawn_t[best], self.tooltip(anchor, self._drawn_t[best])
+
+    def hovers(self, position, anchor):
+        """Tells if a position is within HOVER_RADIUS pixels of a point given in chart value.
+        """
+        return (self._chart.mapToPosition(anchor) - position).manhattanLength() <= HOVER_RADIUS
+
+    def mouseMoveEvent(self, event):
+        if self._chart is None:
+            QtWidgets.QGraphicsView.mouseMoveEvent(self, event)
+            return
+        hit = self.hit_test(self._chart.mapFromScene(self.mapToScene(event.pos())))
+        if hit is None:
+            self._tooltip.hide()
+        else:
+            self.show_tooltip(*hit)
+        QtWidgets.QGraphicsView.mouseMoveEvent(self, event)
+
+    def paintEvent(self, event):
+        start = PROFILER.start()
+        QtWidgets.QGraphicsView.paintEvent(self, event)
+        PROFILER.stop("paint", start)
+
+    def mousePressEvent(self, event):
+        if event.button() == QtCore.Qt.LeftButton:
+            self.keepCallout()
+        QtWidgets.QGraphicsView.mousePressEvent(self, event)
 
     def resizeEvent(self, event):
-        if self.scene():
+        if self._chart is not None:
             self.scene().setSceneRect(QtCore.QRectF(QtCore.QPointF(0, 0), event.size()))
             self._chart.resize(event.size())
             self._coordX.setPos(
@@ -245,57 +993,116 @@ class Monitor(QtWidgets.QGraphicsView):
                 self._chart.size().width() / 2 + 50,
                 self._chart.size().height() - 20)
             for callout in self._callouts:
-                callout.update_geometry()
+                if callout.isVisible():
+                    callout.update_geometry()
         QtWidgets.QGraphicsView.resizeEvent(self, event)
-        
+
     def set_hlcb_area_gradient(self):
         """Method to be invoked if user chooses to tick the "Highest Value" check box on the main panel settings.
         Attributes an area gradient going from green (when the ram being used at the lowest) to red (when the ram used
         is at its highest).
          """
+        start = PROFILER.start()
         area_gradient = QtGui.QLinearGradient(QtCore.QPointF(0, 0), QtCore.QPointF(0, 1))
-        total_by_usage = nuke.memory('usage') / nuke.memory('max_usage')
+        total_by_usage = latest_snapshot().usage_ratio
         area_gradient.setColorAt(0.0, QtGui.QColor(255, 0, 0, 180))
         area_gradient.setColorAt((total_by_usage * 0.5), QtGui.QColor(255, 255, 0, 120))
         area_gradient.setColorAt(total_by_usage, QtGui.QColor(0, 255, 0, 60))
         area_gradient.setCoordinateMode(QtGui.QGradient.ObjectBoundingMode)
         self.areaSeries.setBrush(area_gradient)
+        PROFILER.stop("gradient", start)
         
     def set_mccb_area_gradient(self):
         """Method to be invoked if user chooses to tick the "Maximum Cache" check box on the main panel settings.
         Attributes an area gradient going from green (when the ram being used at the lowest) to red (when the ram used
         is at its highest).
          """
+        start = PROFILER.start()
         area_gradient = QtGui.QLinearGradient(QtCore.QPointF(0, 0), QtCore.QPointF(0, 1))
         area_gradient.setColorAt(0.0, QtGui.QColor(255, 0, 0, 180))
         area_gradient.setColorAt(0.5, QtGui.QColor(255, 255, 0, 120))
         area_gradient.setColorAt(1, QtGui.QColor(0, 255, 0, 60))
         area_gradient.setCoordinateMode(QtGui.QGradient.ObjectBoundingMode)
         self.areaSeries.setBrush(area_gradient)
+        PROFILER.stop("gradient", start)
+
+    def tooltip(self, point, timestamp):
+        """Builds the tooltip text of a drawn point.
+        @param (QPointF) point:
+        The point, in chart value.
+        @param (float) timestamp:
+        The timestamp of the point, as epoch seconds.
+        @return (str) text:
+        The tooltip text.
+        """
+        text = "{0:s}\nAt sample: {1:.2f} \nMemory used: {2:.2f}MB \nTotal RAM usage: {3:.2f}% ".format(
+            format_timestamp(timestamp), point.x(), point.y(), ram_percentage(point.y()))
+        rss = self.sample_value('rss', timestamp)
+        if rss:
+            text += "\nProcess RSS: {0:.2f}MB \nPSS: {1:.2f}MB, anonymous: {2:.2f}MB, swap: {3:.2f}MB ".format(
+                rss, self.sample_value('pss', timestamp), self.sample_value('anon', timestamp),
+                self.sample_value('swap', timestamp))
+        python_heap = self.sample_value('python_heap', timestamp)
+        if python_heap:
+            text += "\nPython heap: {0:.2f}MB ".format(python_heap)
+        for column, upper, area in reversed(self._bands):
+            text += "\n{0:s}: {1:.2f}MB ".format(column[len(COLUMN_PREFIX):], self.sample_value(column, timestamp))
+        return text
 
-    def tooltip(self, point, state):
-        """ Method invoked when the cursor hovers one of the members of the points series. Instantiate the Callout
-        class.
-        @param (QPoint) point:
-        Receives the point hovered by the cursor.
-        @param (QSignal) state:
-        Connection signal.
+    def action_tooltip(self, action):
+        """Builds the tooltip text of a policy action marker.
+        @param (PolicyAction) action:
+        The action the marker stands for.
+        @return (str) text:
+        The tooltip text.
+        """
+        return "{0:s}\n{1:s} fired \nMemory before: {2:.2f}MB \nReclaimed: {3:.2f}MB ".format(
+            format_timestamp(action.timestamp), action.rule, action.before, action.reclaimed)
+
+    def event_tooltip(self, event, count):
+        """Builds the tooltip text of a Nuke event marker.
+        @param (tuple) event:
+        The timestamp, kind label and name of the first event of the marker.
+        @param (int) count:
+        The number of events merged into the marker.
+        @return (str) text:
+        The tooltip text.
+        """
+        text = "{0:s}\n{1:s}: {2:s} ".format(format_timestamp(event[0]), event[1], event[2])
+        if count > 1:
+            text += "\n(+{0:d} more events) ".format(count - 1)
+        return text
+
+    def show_tooltip(self, point, timestamp, text):
+        """Displays the graphical tooltip anchored on a chart point.
+        @param (QPointF) point:
+        The anchor, in chart value.
+        @param (float) timestamp:
+        The timestamp of the anchor, used to follow it when the chart scrolls once pinned.
+        @param (str) text:
+        The tooltip text.
         @return (None):
         No return value.
         """
-        if self._tooltip == 0:
-            self._tooltip = Callout(self._chart)
+        self._tooltip.timestamp = timestamp
+        self._tooltip.set_text(text)
+        self._tooltip.set_anchor(point)
+        self._tooltip.setZValue(11)
+        self._tooltip.update_geometry()
+        self._tooltip.show()
 
-        if state:
-            self._tooltip.set_text("{0:s}\nAt sample: {1:.2f} \nMemory used: {2:.2f}MB \nTotal RAM usage: {3:.2f}% "
-                                   .format(self.dt_list[int(point.x())], point.x(), point.y(),
-                                           ram_percentage(point.y())))
-            self._tooltip.set_anchor(point)
-            self._tooltip.setZValue(11)
-            self._tooltip.update_geometry()
-            self._tooltip.show()
-        else:
-            self._tooltip.hide()
+    def update_callouts(self):
+        """Moves the pinned callouts along with their samples as the chart scrolls, hiding the ones which left the drawn
+        window. Only the bounded pool is visited.
+        """
+        for callout in self._callouts:
+            x = self.time_position(callout.timestamp)
+            if x is None:
+                callout.hide()
+                continue
+            callout.set_anchor(QtCore.QPointF(x, callout.anchor.y()))
+            callout.update_geometry()
+            callout.show()
 
 
 class Separator(QtWidgets.QFrame):
@@ -307,6 +1114,69 @@ class Separator(QtWidgets.QFrame):
         self.setFrameShadow(QtWidgets.QFrame.Sunken)
 
 
+class Sparkline(QtWidgets.QWidget):
+    def __init__(self, color="cyan", parent=None):
+        """A minimal line chart drawing a short series of values, scaled to its own minimum and maximum.
+        @param (str) color:
+        The line color.
+        @param (QWidget) parent:
+        The parent widget.
+        @return (None):
+        No return value.
+        """
+        super(Sparkline, self).__init__(parent)
+        self._values = []
+        self._pen = QtGui.QPen(QtGui.QColor(color))
+        self._pen.setWidth(1)
+        self.setMinimumSize(80, 18)
+
+    def set_values(self, values):
+        """Copies the values to draw and schedules a repaint.
+        @param (sequence) values:
+        The values, oldest first.
+        @return (None):
+        No return value.
+        """
+        self._values = list(values)
+        self.update()
+
+    def paintEvent(self, event):
+        if len(self._values) < 2:
+            return
+        low = min(self._values)
+        spread = (max(self._values) - low) or 1.0
+        width = self.width() - 1
+        height = self.height() - 1
+        step = width / float(len(self._values) - 1)
+        polyline = QtGui.QPolygonF([QtCore.QPointF(index * step, height - (value - low) / spread * height)
+                                    for index, value in enumerate(self._values)])
+        painter = QtGui.QPainter(self)
+        painter.setRenderHint(QtGui.QPainter.Antialiasing)
+        painter.setPen(self._pen)
+        painter.drawPolyline(polyline)
+
+
+class StatsStrip(QtWidgets.QLabel):
+    def __init__(self, parent=None):
+        """A one line label summarising the rolling statistics of the monitor, to be featured under the chart.
+        """
+        super(StatsStrip, self).__init__(parent)
+        self.setAlignment(QtCore.Qt.AlignCenter)
+        self.setFont(QtGui.QFont("Calibri", 9))
+        self.setToolTip("Min, max, mean and standard deviation cover the displayed samples. EWMA, p95 and p99 \n "
+                        "cover the whole session.")
+
+    def set_summary(self, summary):
+        """Displays a statistics summary.
+        @param (dict) summary:
+        The statistics, keyed by name, as returned by RollingStats.summary().
+        @return (None):
+        No return value.
+        """
+        self.setText("Min {min:.2f} | Max {max:.2f} | Mean {mean:.2f} \u00b1 {std:.2f} | EWMA {ewma:.2f} | "
+                     "p95 {p95:.2f} | p99 {p99:.2f} (MB)".format(**summary))
+
+
 class SubLabel(QtWidgets.QLabel):
     def __init__(self, text, font):
         """A QLabel subclassed for more convenience.
@@ -317,6 +1187,7 @@ class SubLabel(QtWidgets.QLabel):
         @return (None):
         No return value.
         """
+        super(SubLabel, self).__init__()
         self.setText(text)
         self.setFont(font)
 
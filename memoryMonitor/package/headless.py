@@ -0,0 +1,176 @@
+"""
+ ----------------------------------------------------------------------------------------------------------------------
+ memoryMonitor - headless mode
+ ----------------------------------------------------------------------------------------------------------------------
+
+ ----------------------------------------------------------------------------------------------------------------------
+ USAGE:
+ Profiles memory per rendered frame without any GUI, for farm renders run with nuke -t. A background sampler captures
+ memory while each frame renders, and the peak and mean of every frame are appended to one trace per Write node.
+ Nothing is sampled between frames.
+ ----------------------------------------------------------------------------------------------------------------------
+
+ ----------------------------------------------------------------------------------------------------------------------
+ INSTRUCTIONS:
+
+ -Make sure the memoryMonitor folder is in NUKE_PATH, then either add the following lines to the init.py script used on
+ the farm:
+
+ import nuke
+ if not nuke.env['gui']:
+     from package.headless import FrameProfiler
+     FrameProfiler().install()
+
+ -or render through this script directly:
+
+ nuke -t /path/to/memoryMonitor/package/headless.py script.nk Write1 1001 1100
+
+ Traces are written to $MEMORY_MONITOR_TRACE_DIR, or ~/.nuke/memoryMonitor/traces by default.
+ ----------------------------------------------------------------------------------------------------------------------
+"""
+
+import argparse
+import os
+
+import nuke
+
+from package.api.funcstore import MemorySnapshot, timestamp
+from package.api.sampler import Sampler
+from package.api.trace import TraceWriter, default_trace_path, EXTENSION
+
+
+# Interval of the background sampler while rendering, in seconds.
+FRAME_SAMPLING_INTERVAL = 0.05
+# Metrics recorded after the base fields in every per-frame record.
+FRAME_FIELDS = ('frame', 'peak_usage', 'mean_usage', 'sample_count')
+
+
+class FrameMemory:
+    def __init__(self):
+        """The running peak and mean memory of a frame, updated with every sample so that no sample has to be kept
+        until the frame ends, however long it renders.
+        @return (None):
+        No return value.
+        """
+        self.peak = 0.0
+        self.total = 0.0
+        self.count = 0
+        self.latest = None
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def capture(self):
+        """Captures a sample and adds it to the figures of the frame. Called on the sampling thread.
+        @return (MemorySnapshot) snapshot:
+        The sample.
+        """
+        snapshot = MemorySnapshot.capture()
+        self.total += snapshot.usage
+        self.count += 1
+        if snapshot.usage > self.peak:
+            self.peak = snapshot.usage
+        self.latest = snapshot
+        return snapshot
+
+
+class FrameProfiler:
+    def __init__(self, trace_dir=None, interval=FRAME_SAMPLING_INTERVAL):
+        """Records the peak and mean memory of every rendered frame, per Write node. A sampling thread only runs while
+        a frame renders, and all the work done in the render callbacks is starting it, stopping it and writing one trace
+        record.
+        @param (str) trace_dir:
+        The folder traces are written to. Defaults to the folder of default_trace_path().
+        @param (float) interval:
+        The time between two samples while rendering, in seconds.
+        @return (None):
+        No return value.
+        """
+        self.trace_dir = trace_dir or os.path.dirname(default_trace_path())
+        self.interval = interval
+        self.sampler = None
+        self.frame = None
+        self._writers = {}
+
+    def install(self):
+        """Registers the render callbacks.
+        """
+        nuke.addBeforeFrameRender(self.before_frame, nodeClass='Write')
+        nuke.addAfterFrameRender(self.after_frame, nodeClass='Write')
+
+    def uninstall(self):
+        """Stops sampling, unregisters the render callbacks and closes every trace.
+        """
+        if self.sampler is not None:
+            self.sampler.stop()
+            self.sampler = None
+        nuke.removeBeforeFrameRender(self.before_frame, nodeClass='Write')
+        nuke.removeAfterFrameRender(self.after_frame, nodeClass='Write')
+        for writer in self._writers.values():
+            writer.close()
+        self._writers = {}
+
+    def before_frame(self):
+        """Starts sampling the frame. Every frame gets a sampler of its own, writing to figures of its own, so that a
+        capture of the previous frame still finishing can't land in this one.
+        """
+        if self.sampler is not None:
+            self.sampler.stop()
+        self.frame = FrameMemory()
+        # The figures are kept by the frame, so the queue only ever holds the latest sample.
+        self.sampler = Sampler(self.frame.capture, self.interval, maxlen=1)
+        self.sampler.start()
+
+    def after_frame(self):
+        """Stops sampling and appends the figures of the frame to the trace of the Write node. The sampling thread is
+        waited for, so that its last capture can't update the figures while they are read.
+        """
+        if self.sampler is not None:
+            self.sampler.stop(wait=True)
+            self.sampler = None
+        frame = self.frame or FrameMemory()
+        self.frame = None
+        frame.capture()
+        record = frame.latest.record() + (nuke.frame(), frame.peak, frame.mean, frame.count)
+        self.writer(nuke.thisNode().fullName()).write(*record)
+
+    def writer(self, node_name):
+        """Returns the trace of a Write node, opening it on the node's first frame.
+        @param (str) node_name:
+        The full name of the Write node.
+        @return (TraceWriter) writer:
+        The trace of the node.
+        """
+        writer = self._writers.get(node_name)
+        if writer is None:
+            script = os.path.splitext(os.path.basename(nuke.root().name()))[0] or "untitled"
+            name = "{0:s}-{1:s}-{2:d}-{3:d}{4:s}".format(script, node_name.replace(".", "_"), int(timestamp()),
+                                                         os.getpid(), EXTENSION)
+            writer = TraceWriter(os.path.join(self.trace_dir, name), FRAME_FIELDS)
+            self._writers[node_name] = writer
+        return writer
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render a Write node while profiling memory per frame.")
+    parser.add_argument("script", help="The Nuke script to render.")
+    parser.add_argument("write", help="The name of the Write node to render.")
+    parser.add_argument("first", type=int, help="The first frame to render.")
+    parser.add_argument("last", type=int, help="The last frame to render.")
+    parser.add_argument("--trace-dir", help="The folder traces are written to.")
+    parser.add_argument("--interval", type=float, default=FRAME_SAMPLING_INTERVAL,
+                        help="The time between two samples while rendering, in seconds.")
+    args = parser.parse_args(argv)
+
+    nuke.scriptOpen(args.script)
+    profiler = FrameProfiler(args.trace_dir, args.interval)
+    profiler.install()
+    try:
+        nuke.execute(args.write, args.first, args.last)
+    finally:
+        profiler.uninstall()
+
+
+if __name__ == "__main__":
+    main()
@@ -39,14 +39,39 @@
  ----------------------------------------------------------------------------------------------------------------------
 """
 
-from PySide2 import QtWidgets, QtCore, QtGui, QtCharts
-import datetime
+from PySide2 import QtWidgets, QtCore, QtGui
+import os
 
 import nuke
 from nukescripts import panels
 
-from package.api.funcstore import *
-from package.api.widgets import *
+from package.api.funcstore import ListsModifier, MemorySnapshot, format_timestamp, latest_snapshot, \
+    set_memory_source, METRICS
+from package.api.widgets import ColorSettings, CustomPushButton, Monitor, Separator, Sparkline, StatsStrip, SubLabel, \
+    Worker, METRIC_LABELS, PAINTER, QTCHARTS, RENDERERS
+from package.api.sampler import AdaptiveScheduler, Sampler
+from package.api.samplestore import MAX_WINDOW
+from package.api.sources import DEFAULT_SPEED, source_from_spec
+from package.api.memoryinfo import MEMORY_INFO
+from package.api.events import EventLog, EventWriter, EVENTS_EXTENSION
+from package.api.nodememory import NodeMemoryCollector
+from package.api.policy import PolicyEngine
+from package.api.procmem import PROC_FIELDS
+from package.api.profiler import PROFILER
+from package.api.pyheap import HEAP
+from package.api.trace import TraceReader, TraceWriter, default_trace_path, EXTENSION
+
+
+# Interval of the GUI timer draining the sampler queue, in milliseconds. Roughly one frame at 30 fps.
+DRAIN_INTERVAL = 33
+# Interval between two per-node collection steps while the Nodes tab is shown, in milliseconds.
+NODES_INTERVAL = 100
+# Default shortest sampling interval of the adaptive scheduler, in seconds, used while memory changes quickly.
+FAST_INTERVAL = 0.5
+# Interval between two refreshes of the Diagnostics table while the Properties tab is shown, in milliseconds.
+DIAGNOSTICS_INTERVAL = 1000
+# Interval between two checks for a finished Python heap diff, in milliseconds.
+HEAP_DIFF_INTERVAL = 100
 
 
 class MainPanel(QtWidgets.QWidget):
@@ -56,22 +81,49 @@ class MainPanel(QtWidgets.QWidget):
     def __init__(self):
         QtWidgets.QWidget.__init__(self)
         self.loop_time = 10
+        self.use_memory_source(os.environ.get("MEMORY_MONITOR_SOURCE"),
+                               float(os.environ.get("MEMORY_MONITOR_SPEED", DEFAULT_SPEED)))
         self.layout = QtWidgets.QVBoxLayout()
         self.tabBar = QtWidgets.QTabWidget()
         self.layout.addWidget(self.tabBar)
         self.setLayout(self.layout)
         self.monitorTab = QtWidgets.QWidget()
+        self.nodesTab = QtWidgets.QWidget()
+        self.pythonTab = QtWidgets.QWidget()
         self.propertiesTab = QtWidgets.QWidget()
         self.tabBar.addTab(self.monitorTab, "Monitor")
+        self.tabBar.addTab(self.nodesTab, "Nodes")
+        self.tabBar.addTab(self.pythonTab, "Python")
         self.tabBar.addTab(self.propertiesTab, "Properties")
+        self.tabBar.currentChanged.connect(self.tab_changed)
         self.monitorTabLayout = QtWidgets.QVBoxLayout()
         self.monitorTab.setLayout(self.monitorTabLayout)
         self.propertiesTabLayout = QtWidgets.QVBoxLayout()
         self.propertiesTab.setLayout(self.propertiesTabLayout)
+        self.propertiesBuilt = False
 
-        self.monitor = Monitor(self)
+        renderer = os.environ.get("MEMORY_MONITOR_RENDERER", QTCHARTS)
+        self.monitor = Monitor(self, renderer if renderer in RENDERERS else QTCHARTS)
+        self.monitor.chartBuilt.connect(self.refresh_chart)
         self.monitorTabLayout.addWidget(self.monitor)
-        self.worker = Worker(self.update_chart, (self.loop_time * 1000))
+        self.statsStrip = StatsStrip()
+        self.monitorTabLayout.addWidget(self.statsStrip)
+        self.trace = None
+        self.events = EventLog()
+        # The Nuke callbacks are global, so they are only registered once asked for.
+        if os.environ.get("MEMORY_MONITOR_EVENTS"):
+            self.events.install()
+        self.policy = PolicyEngine()
+        self.exporter = None
+        self.scheduler = AdaptiveScheduler(FAST_INTERVAL, self.loop_time)
+        self.sampler = Sampler(self.capture_sample, self.loop_time, scheduler=self.scheduler)
+        self.worker = Worker(self.drain_samples, DRAIN_INTERVAL)
+        # Recording is opt-in, as a trace file is written for every session it is on in.
+        if os.environ.get("MEMORY_MONITOR_RECORD"):
+            self.cb_record_trace(QtCore.Qt.Checked)
+        if os.environ.get("MEMORY_MONITOR_PROFILE"):
+            PROFILER.enable()
+        self.diagnosticsWorker = Worker(self.refresh_diagnostics, DIAGNOSTICS_INTERVAL)
 
         self.autoUpdateLayout = QtWidgets.QHBoxLayout()
         self.autoUpdateStart = CustomPushButton("Start Auto-Update", "Start Auto-Update: Starts a loop that \n "
@@ -79,10 +131,10 @@ class MainPanel(QtWidgets.QWidget):
                                                                      "for every time interval "
                                                                      "\n you'll have set in the Properties "
                                                                      "panel (Default is 30 seconds)")
-        self.autoUpdateStart.clicked.connect(self.worker.start)
+        self.autoUpdateStart.clicked.connect(self.start_auto_update)
         self.autoUpdateStop = CustomPushButton("Stop Auto-Update", "Stop Auto-Update: Stops the \n currently "
                                                                    "running Auto-Update.")
-        self.autoUpdateStop.clicked.connect(self.worker.stop)
+        self.autoUpdateStop.clicked.connect(self.stop_auto_update)
 
         self.autoUpdateLayout.addWidget(self.autoUpdateStart)
         self.autoUpdateLayout.addWidget(self.autoUpdateStop)
@@ -99,12 +151,88 @@ class MainPanel(QtWidgets.QWidget):
         self.minilabel_font = QtGui.QFont()
         self.minilabel_font.setItalic(True)
 
+        self.nodesTabLayout = QtWidgets.QVBoxLayout()
+        self.nodesTab.setLayout(self.nodesTabLayout)
+        self.nodeCollector = NodeMemoryCollector()
+        self.nodeWorker = Worker(self.collect_node_memory, NODES_INTERVAL)
+
+        self.topNodesLabel = SubLabel("Number of nodes listed:", self.subtitleFont)
+        self.topNodesLabel.setToolTip("Nodes: Lists the nodes holding the most memory. The script is scanned a few \n "
+                                      "nodes at a time while this tab is shown, so large scripts take several \n "
+                                      "ticks to be fully covered.")
+        self.topNodesSpinBox = QtWidgets.QSpinBox()
+        self.topNodesSpinBox.setRange(1, 200)
+        self.topNodesSpinBox.setValue(self.nodeCollector.top_n)
+        self.topNodesSpinBox.valueChanged.connect(self.define_top_nodes)
+        self.topNodesLayout = QtWidgets.QHBoxLayout()
+        self.topNodesLayout.addWidget(self.topNodesLabel, 2, QtCore.Qt.AlignLeft)
+        self.topNodesLayout.addWidget(self.topNodesSpinBox, 1, QtCore.Qt.AlignRight)
+        self.nodesTabLayout.addLayout(self.topNodesLayout)
+
+        self.nodesTable = QtWidgets.QTableWidget(0, 3)
+        self.nodesTable.setHorizontalHeaderLabels(["Node", "Memory (MB)", "Trend"])
+        self.nodesTable.horizontalHeader().setSectionResizeMode(0, QtWidgets.QHeaderView.Stretch)
+        self.nodesTable.verticalHeader().hide()
+        self.nodesTable.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+        self.nodesTabLayout.addWidget(self.nodesTable)
+
+        self.pythonTabLayout = QtWidgets.QVBoxLayout()
+        self.pythonTab.setLayout(self.pythonTabLayout)
+        self.heapWorker = Worker(self.collect_heap_diff, HEAP_DIFF_INTERVAL)
+        if os.environ.get("MEMORY_MONITOR_PYHEAP"):
+            HEAP.start()
+
+        self.heapCB = QtWidgets.QCheckBox("Track the Python heap")
+        self.heapCB.setToolTip("Python heap: Records the memory held by Python objects with every sample, shown in \n "
+                               "the chart tooltips, and snapshots where it was allocated. Tracing slows \n "
+                               "every Python allocation down, so only turn it on to hunt a leak.")
+        self.heapCB.setChecked(HEAP.tracing)
+        self.heapCB.stateChanged.connect(self.cb_track_heap)
+        self.pythonTabLayout.addWidget(self.heapCB)
+
+        self.heapIntervalLabel = SubLabel("Snapshot interval (s):", self.subtitleFont)
+        self.heapIntervalSpinBox = QtWidgets.QSpinBox()
+        self.heapIntervalSpinBox.setRange(5, 3600)
+        self.heapIntervalSpinBox.setValue(HEAP.interval)
+        self.heapIntervalSpinBox.valueChanged.connect(self.define_heap_interval)
+        self.heapIntervalLayout = QtWidgets.QHBoxLayout()
+        self.heapIntervalLayout.addWidget(self.heapIntervalLabel, 2, QtCore.Qt.AlignLeft)
+        self.heapIntervalLayout.addWidget(self.heapIntervalSpinBox, 1, QtCore.Qt.AlignRight)
+        self.pythonTabLayout.addLayout(self.heapIntervalLayout)
+
+        self.heapCompareButton = QtWidgets.QPushButton("Compare the last two pinned points")
+        self.heapCompareButton.setToolTip("Compare: Lists the lines of Python code whose allocations grew the most \n "
+                                          "between the snapshots closest to the last two points pinned on the \n "
+                                          "chart.")
+        self.heapCompareButton.clicked.connect(self.compare_heap)
+        self.pythonTabLayout.addWidget(self.heapCompareButton)
+        self.heapDiffLabel = SubLabel("Pin two points of the chart to compare the Python heap between them.",
+                                      self.minilabel_font)
+        self.pythonTabLayout.addWidget(self.heapDiffLabel)
+
+        self.heapTable = QtWidgets.QTableWidget(0, 4)
+        self.heapTable.setHorizontalHeaderLabels(["Allocation site", "Growth (MB)", "Blocks", "Size (MB)"])
+        self.heapTable.horizontalHeader().setSectionResizeMode(0, QtWidgets.QHeaderView.Stretch)
+        self.heapTable.verticalHeader().hide()
+        self.heapTable.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+        self.pythonTabLayout.addWidget(self.heapTable)
+
+    def build_properties(self):
+        """Builds the Properties tab the first time it is opened. The settings it displays live in the panel and its
+        helpers, so they are already in effect before that.
+        """
+        if self.propertiesBuilt:
+            return
+        self.propertiesBuilt = True
+        # Importing the exporter pulls in http.server, so it waits until the Properties tab is opened.
+        from package.api.exporter import DEFAULT_PORT
+
         self.monitorMenuLabel = SubLabel("Monitor settings:", self.panel_title_font)
         self.propertiesTabLayout.addWidget(self.monitorMenuLabel)
 
         self.samplesNumLabel = SubLabel("Number of samples:", self.subtitleFont)
         self.samplesNumSpinBox = QtWidgets.QSpinBox()
-        self.samplesNumSpinBox.setRange(2, 50)
+        self.samplesNumSpinBox.setRange(2, MAX_WINDOW - 1)
         self.samplesNumSpinBox.setValue(self.monitor.max_sample)
         self.samplesNumLayout = QtWidgets.QHBoxLayout()
         self.samplesNumSpinBox.valueChanged.connect(self.define_max_sample)
@@ -115,8 +243,8 @@ class MainPanel(QtWidgets.QWidget):
         self.propertiesTabLayout.addLayout(self.samplesNumLayout)
 
         self.samplesNumSlider = QtWidgets.QSlider(QtCore.Qt.Horizontal, self)
-        self.samplesNumSlider.setRange(2, 51)
-        self.samplesNumSlider.setTickInterval(1)
+        self.samplesNumSlider.setRange(2, MAX_WINDOW - 1)
+        self.samplesNumSlider.setTickInterval(MAX_WINDOW // 20)
         self.samplesNumSlider.setSliderPosition(self.monitor.max_sample)
         self.samplesNumSliderLayout = QtWidgets.QGridLayout()
         self.samplesNumSlider.setTickPosition(QtWidgets.QSlider.TicksBothSides)
@@ -134,10 +262,11 @@ class MainPanel(QtWidgets.QWidget):
             "Auto-Update Timer: Set a new timer (in seconds) \n If the value changes, it will automatically \n stops "
             "any auto-update running")
         self.auTimeEdit.setDisplayFormat("hh:mm:ss")
+        self.auTimeEdit.setMinimumTime(QtCore.QTime(0, 0, 1))
         self.timeDisplayed = QtCore.QTime(0, 0, self.loop_time)
         self.auTimeEdit.setTime(self.timeDisplayed)
 
-        self.auTimeEdit.timeChanged.connect(lambda: self.worker.stop())
+        self.auTimeEdit.timeChanged.connect(self.stop_auto_update)
         self.auTimeEdit.timeChanged.connect(self.change_loop_time)
 
         self.auTimerLayout = QtWidgets.QHBoxLayout()
@@ -146,16 +275,110 @@ class MainPanel(QtWidgets.QWidget):
         self.auTimerLayout.addWidget(self.auTimeEdit, 1, QtCore.Qt.AlignRight)
         self.propertiesTabLayout.addLayout(self.auTimerLayout)
 
-        self.propertiesTabLayout.addWidget(QHLine())
+        self.adaptiveCB = QtWidgets.QCheckBox("Adaptive sampling, fastest interval (s):")
+        self.adaptiveCB.setToolTip("Adaptive sampling: Samples down to the fastest interval while memory is changing "
+                                   "\n quickly, and backs off to the Auto-Update Timer, used as a slow heartbeat, "
+                                   "\n while usage is flat.")
+        self.adaptiveCB.setChecked(self.sampler.scheduler is not None)
+        self.adaptiveCB.stateChanged.connect(self.cb_adaptive_sampling)
+        self.fastIntervalSpinBox = QtWidgets.QDoubleSpinBox()
+        self.fastIntervalSpinBox.setRange(0.05, 3600)
+        self.fastIntervalSpinBox.setSingleStep(0.1)
+        self.fastIntervalSpinBox.setValue(self.scheduler.minimum)
+        self.fastIntervalSpinBox.setEnabled(self.sampler.scheduler is not None)
+        self.fastIntervalSpinBox.valueChanged.connect(self.define_fast_interval)
+        self.adaptiveLayout = QtWidgets.QHBoxLayout()
+        self.adaptiveLayout.addWidget(self.adaptiveCB, 2, QtCore.Qt.AlignLeft)
+        self.adaptiveLayout.addWidget(self.fastIntervalSpinBox, 1, QtCore.Qt.AlignRight)
+        self.propertiesTabLayout.addLayout(self.adaptiveLayout)
+
+        self.traceCB = QtWidgets.QCheckBox("Record a trace of every sample")
+        self.traceCB.setToolTip("Record trace: Appends every sample to a binary trace file, so the memory history \n "
+                                "survives the panel being closed or Nuke crashing. Off by default, unless \n "
+                                "$MEMORY_MONITOR_RECORD is set.")
+        self.traceCB.setChecked(self.trace is not None)
+        self.traceCB.stateChanged.connect(self.cb_record_trace)
+        self.replayTraceButton = CustomPushButton("Replay a trace", "Replay a trace: Displays a recorded trace \n "
+                                                                    "in the monitor instead of the live samples.")
+        self.replayTraceButton.clicked.connect(self.replay_trace)
+        self.liveButton = CustomPushButton("Back to live", "Back to live: Closes the trace being replayed.")
+        self.liveButton.clicked.connect(self.stop_replay)
+        self.traceLayout = QtWidgets.QHBoxLayout()
+        self.traceLayout.addWidget(self.traceCB, 4, QtCore.Qt.AlignLeft)
+        self.traceLayout.addWidget(self.replayTraceButton, 1, QtCore.Qt.AlignRight)
+        self.traceLayout.addWidget(self.liveButton, 1, QtCore.Qt.AlignRight)
+        self.propertiesTabLayout.addLayout(self.traceLayout)
+
+        self.eventsCB = QtWidgets.QCheckBox("Mark Nuke events on the chart")
+        self.eventsCB.setToolTip("Nuke events: Records script loads, node creations, knob changes on heavy nodes, "
+                                 "\n renders and viewer frame changes, to tell which operation caused a memory "
+                                 "jump. \n Off by default, unless $MEMORY_MONITOR_EVENTS is set.")
+        self.eventsCB.setChecked(self.events.installed)
+        self.eventsCB.stateChanged.connect(self.cb_record_events)
+        self.propertiesTabLayout.addWidget(self.eventsCB)
+
+        self.exporterCB = QtWidgets.QCheckBox("Serve OpenMetrics on local port:")
+        self.exporterCB.setToolTip("OpenMetrics: Serves the memory usage, max_usage, rolling statistics and sample "
+                                   "\n latency on http://127.0.0.1:<port>/metrics, for Prometheus to scrape.")
+        self.exporterCB.setChecked(self.exporter is not None and self.exporter.running)
+        self.exporterCB.stateChanged.connect(self.cb_export_metrics)
+        self.exporterPortSpinBox = QtWidgets.QSpinBox()
+        self.exporterPortSpinBox.setRange(1024, 65535)
+        self.exporterPortSpinBox.setValue(DEFAULT_PORT if self.exporter is None else self.exporter.requested_port)
+        self.exporterPortSpinBox.setEnabled(not self.exporterCB.isChecked())
+        self.exporterLayout = QtWidgets.QHBoxLayout()
+        self.exporterLayout.addWidget(self.exporterCB, 2, QtCore.Qt.AlignLeft)
+        self.exporterLayout.addWidget(self.exporterPortSpinBox, 1, QtCore.Qt.AlignRight)
+        self.propertiesTabLayout.addLayout(self.exporterLayout)
+
+        self.leakThresholdLabel = SubLabel("Leak detection threshold (MB/min):", self.subtitleFont)
+        self.leakThresholdLabel.setToolTip("Leak detection: The monitor flags a leak and forecasts when max_usage \n "
+                                           "will be reached once memory has grown faster than this rate over \n "
+                                           "every trend window.")
+        self.leakThresholdSpinBox = QtWidgets.QDoubleSpinBox()
+        self.leakThresholdSpinBox.setRange(0.01, 10000)
+        self.leakThresholdSpinBox.setValue(self.monitor.leaks.threshold)
+        self.leakThresholdSpinBox.valueChanged.connect(self.define_leak_threshold)
+        self.leakThresholdLayout = QtWidgets.QHBoxLayout()
+        self.leakThresholdLayout.addWidget(self.leakThresholdLabel, 2, QtCore.Qt.AlignLeft)
+        self.leakThresholdLayout.addWidget(self.leakThresholdSpinBox, 1, QtCore.Qt.AlignRight)
+        self.propertiesTabLayout.addLayout(self.leakThresholdLayout)
+
+        self.propertiesTabLayout.addWidget(Separator())
+        self.policyMenuLabel = SubLabel("Cache settings:", self.panel_title_font)
+        self.propertiesTabLayout.addWidget(self.policyMenuLabel)
+
+        self.policyCB = QtWidgets.QCheckBox("Clear caches automatically")
+        self.policyCB.setToolTip("Clear caches automatically: Clears the RAM cache when usage crosses the soft \n "
+                                 "limit, and also frees buffers and the disk cache at the hard limit. Every \n "
+                                 "action is marked on the monitor with the memory it reclaimed.")
+        self.policyCB.setChecked(self.policy.enabled)
+        self.policyCB.stateChanged.connect(self.cb_cache_policy)
+        self.propertiesTabLayout.addWidget(self.policyCB)
+
+        self.policyLimitSpinBoxes = []
+        for rule in self.policy.rules:
+            limit_label = SubLabel("{0:s} (% of total RAM allocated):".format(rule.name), self.subtitleFont)
+            limit_spin_box = QtWidgets.QSpinBox()
+            limit_spin_box.setRange(1, 100)
+            limit_spin_box.setValue(int(round(rule.limit * 100)))
+            limit_spin_box.valueChanged.connect(self.define_policy_limits)
+            limit_layout = QtWidgets.QHBoxLayout()
+            limit_layout.addWidget(limit_label, 2, QtCore.Qt.AlignLeft)
+            limit_layout.addWidget(limit_spin_box, 1, QtCore.Qt.AlignRight)
+            self.propertiesTabLayout.addLayout(limit_layout)
+            self.policyLimitSpinBoxes.append(limit_spin_box)
+
+        self.propertiesTabLayout.addWidget(Separator())
         self.displayMenuLabel = SubLabel("Display settings:", self.panel_title_font)
         self.propertiesTabLayout.addWidget(self.displayMenuLabel)
 
         self.scaleAxisYLabel = SubLabel("Scale the Y-Axis to:", self.subtitleFont)
         self.highestListValueCB = QtWidgets.QCheckBox("Current highest memory value")
-        self.highestListValueCB.setChecked(True)
+        self.highestListValueCB.setChecked(self.monitor.scale_to_highest)
         self.highestListValueCB.stateChanged.connect(self.cb_highest_value)
         self.maximumCacheCB = QtWidgets.QCheckBox("Total RAM allocated")
-        self.maximumCacheCB.setChecked(False)
+        self.maximumCacheCB.setChecked(not self.monitor.scale_to_highest)
         self.maximumCacheCB.stateChanged.connect(self.cb_max_nuke_ram)
         self.scaleAxisYLayout = QtWidgets.QHBoxLayout()
         self.scaleAxisYLayout.addWidget(self.scaleAxisYLabel, 4, QtCore.Qt.AlignLeft)
@@ -163,6 +386,48 @@ class MainPanel(QtWidgets.QWidget):
         self.scaleAxisYLayout.addWidget(self.maximumCacheCB, 1, QtCore.Qt.AlignRight)
         self.propertiesTabLayout.addLayout(self.scaleAxisYLayout)
 
+        self.rendererLabel = SubLabel("Lightweight renderer:", self.subtitleFont)
+        self.rendererLabel.setToolTip("Paints the chart with a few QPainter calls instead of QtCharts. \n Much cheaper "
+                                      "to redraw on large windows.")
+        self.rendererCB = QtWidgets.QCheckBox()
+        self.rendererCB.setChecked(self.monitor.renderer == PAINTER)
+        self.rendererCB.stateChanged.connect(self.cb_lightweight_renderer)
+        self.rendererLayout = QtWidgets.QHBoxLayout()
+        self.rendererLayout.addWidget(self.rendererLabel, 2, QtCore.Qt.AlignLeft)
+        self.rendererLayout.addWidget(self.rendererCB, 1, QtCore.Qt.AlignRight)
+        self.propertiesTabLayout.addLayout(self.rendererLayout)
+
+        self.metricsLabel = SubLabel("Also plot:", self.subtitleFont)
+        self.metricsLabel.setToolTip("Also plot: Draws other metrics recorded with every sample as lines, against \n "
+                                     "the memory axis or against a Y axis of their own on the right.")
+        self.propertiesTabLayout.addWidget(self.metricsLabel)
+        self.metricCheckBoxes = []
+        for name in METRICS:
+            if name not in METRIC_LABELS:
+                continue
+            plot_check_box = QtWidgets.QCheckBox(METRIC_LABELS[name])
+            plot_check_box.setChecked(name in self.monitor.metrics)
+            plot_check_box.stateChanged.connect(self.define_metrics)
+            axis_check_box = QtWidgets.QCheckBox("Own Y axis")
+            axis_check_box.setChecked(self.monitor.metrics.get(name, False))
+            axis_check_box.stateChanged.connect(self.define_metrics)
+            metric_layout = QtWidgets.QHBoxLayout()
+            metric_layout.addWidget(plot_check_box, 2, QtCore.Qt.AlignLeft)
+            metric_layout.addWidget(axis_check_box, 1, QtCore.Qt.AlignRight)
+            self.propertiesTabLayout.addLayout(metric_layout)
+            self.metricCheckBoxes.append((name, plot_check_box, axis_check_box))
+
+        self.breakdownLabel = SubLabel("Memory breakdown:", self.subtitleFont)
+        self.breakdownLabel.setToolTip("Memory breakdown: Parses the nuke.memory('info') report with every sample, \n "
+                                       "and stacks the memory of its categories under the usage line.")
+        self.breakdownCB = QtWidgets.QCheckBox("Stacked areas")
+        self.breakdownCB.setChecked(self.monitor.breakdown)
+        self.breakdownCB.stateChanged.connect(self.cb_memory_breakdown)
+        self.breakdownLayout = QtWidgets.QHBoxLayout()
+        self.breakdownLayout.addWidget(self.breakdownLabel, 2, QtCore.Qt.AlignLeft)
+        self.breakdownLayout.addWidget(self.breakdownCB, 1, QtCore.Qt.AlignRight)
+        self.propertiesTabLayout.addLayout(self.breakdownLayout)
+
         self.bgColorLayout = ColorSettings("Background color:", self.define_color, "BG")
         self.propertiesTabLayout.addLayout(self.bgColorLayout)
 
@@ -181,6 +446,36 @@ class MainPanel(QtWidgets.QWidget):
         self.axisTitlesColorLayout = ColorSettings("Axis titles color:", self.define_color, "AxisTitles")
         self.propertiesTabLayout.addLayout(self.axisTitlesColorLayout)
 
+        self.propertiesTabLayout.addWidget(Separator())
+        self.diagnosticsMenuLabel = SubLabel("Diagnostics:", self.panel_title_font)
+        self.propertiesTabLayout.addWidget(self.diagnosticsMenuLabel)
+
+        self.profileCB = QtWidgets.QCheckBox("Profile the monitor ticks")
+        self.profileCB.setToolTip("Profile the monitor ticks: Times every stage of a tick, from reading Nuke \n "
+                                  "memory to painting the chart, and lists them by total time below. \n "
+                                  "Costs close to nothing while unchecked.")
+        self.profileCB.setChecked(PROFILER.enabled)
+        self.profileCB.stateChanged.connect(self.cb_profile)
+        self.profileResetButton = QtWidgets.QPushButton("Reset")
+        self.profileResetButton.clicked.connect(self.reset_diagnostics)
+        self.profileExportButton = QtWidgets.QPushButton("Export JSON")
+        self.profileExportButton.clicked.connect(self.export_diagnostics)
+        self.profileLayout = QtWidgets.QHBoxLayout()
+        self.profileLayout.addWidget(self.profileCB, 2, QtCore.Qt.AlignLeft)
+        self.profileLayout.addWidget(self.profileResetButton, 1, QtCore.Qt.AlignRight)
+        self.profileLayout.addWidget(self.profileExportButton, 1, QtCore.Qt.AlignRight)
+        self.propertiesTabLayout.addLayout(self.profileLayout)
+
+        self.diagnosticsTable = QtWidgets.QTableWidget(0, 6)
+        self.diagnosticsTable.setHorizontalHeaderLabels(["Stage", "Calls", "Mean (ms)", "p95 (ms)", "Max (ms)",
+                                                         "Histogram"])
+        self.diagnosticsTable.horizontalHeader().setSectionResizeMode(0, QtWidgets.QHeaderView.Stretch)
+        self.diagnosticsTable.verticalHeader().hide()
+        self.diagnosticsTable.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+        self.diagnosticsTable.setMinimumHeight(160)
+        self.propertiesTabLayout.addWidget(self.diagnosticsTable)
+        self.refresh_diagnostics()
+
     def cb_highest_value(self, state):
         """Fit the chart axis Y to the memory list highest value.
         @param (Qt.Checked) state:
@@ -189,14 +484,137 @@ class MainPanel(QtWidgets.QWidget):
         No return value.
         """
         if state == QtCore.Qt.Checked:
-            self.monitor.axis_y.setRange(0, round(max(self.monitor.mem_list), -1) + 50)
-            self.monitor.set_hlcb_area_gradient()
+            self.monitor.set_scale(True)
             self.maximumCacheCB.setChecked(False)
         else:
-            self.monitor.axis_y.setRange(0, nk_value('max_usage'))
-            self.monitor.set_mccb_area_gradient()
+            self.monitor.set_scale(False)
             self.highestListValueCB.setChecked(False)
 
+    def cb_lightweight_renderer(self, state):
+        """Switch the chart between the lightweight QPainter renderer and QtCharts. Colors and scale are kept.
+        @param (Qt.Checked) state:
+        State of the checkbox.
+        @return (None):
+        No return value.
+        """
+        self.monitor.set_renderer(PAINTER if state == QtCore.Qt.Checked else QTCHARTS)
+
+    def cb_memory_breakdown(self, state):
+        """Starts or stops parsing the nuke.memory('info') reports, and stacks their categories on the chart.
+        @param (Qt.Checked) state:
+        State of the checkbox.
+        @return (None):
+        No return value.
+        """
+        MEMORY_INFO.enabled = state == QtCore.Qt.Checked
+        self.monitor.set_breakdown(MEMORY_INFO.enabled)
+
+    def cb_profile(self, state):
+        """Switch the profiler timers on or off. The Diagnostics table is refreshed while they are on.
+        @param (Qt.Checked) state:
+        State of the checkbox.
+        @return (None):
+        No return value.
+        """
+        PROFILER.enable(state == QtCore.Qt.Checked)
+        if PROFILER.enabled and self.tabBar.currentWidget() is self.propertiesTab:
+            self.diagnosticsWorker.start()
+        else:
+            self.diagnosticsWorker.stop()
+        self.refresh_diagnostics()
+
+    def cb_track_heap(self, state):
+        """Starts or stops tracing the Python allocations.
+        @param (Qt.Checked) state:
+        State of the checkbox.
+        @return (None):
+        No return value.
+        """
+        if state == QtCore.Qt.Checked:
+            HEAP.start()
+        else:
+            HEAP.stop()
+
+    def cb_adaptive_sampling(self, state):
+        """Switch the sampler between the adaptive scheduler and the fixed Auto-Update Timer interval.
+        @param (int) state:
+        State of the checkbox
+        @return (None):
+        No return value.
+        """
+        self.sampler.scheduler = self.scheduler if state else None
+        self.fastIntervalSpinBox.setEnabled(bool(state))
+        self.sampler.interval = self.loop_time
+
+    def cb_record_trace(self, state):
+        """Opens a new trace for the session or closes the current one.
+        @param (Qt.Checked) state:
+        State of the checkbox.
+        @return (None):
+        No return value.
+        """
+        if state == QtCore.Qt.Checked:
+            if self.trace is None:
+                try:
+                    self.trace = TraceWriter(default_trace_path(), PROC_FIELDS)
+                    self.events.writer = EventWriter(os.path.splitext(self.trace.path)[0] + EVENTS_EXTENSION)
+                except (OSError, ValueError) as error:
+                    nuke.message("Unable to record a trace: {0:s}".format(str(error)))
+                    if self.propertiesBuilt:
+                        self.traceCB.setChecked(False)
+        elif self.trace is not None:
+            trace = self.trace
+            self.trace = None
+            trace.close()
+            writer = self.events.writer
+            self.events.writer = None
+            if writer is not None:
+                writer.close()
+
+    def cb_record_events(self, state):
+        """Registers or unregisters the Nuke callbacks feeding the event markers.
+        @param (Qt.Checked) state:
+        State of the checkbox.
+        @return (None):
+        No return value.
+        """
+        if state == QtCore.Qt.Checked:
+            self.events.install()
+        else:
+            self.events.uninstall()
+
+    def cb_export_metrics(self, state):
+        """Starts or stops serving the samples in the OpenMetrics format.
+        @param (Qt.Checked) state:
+        State of the checkbox.
+        @return (None):
+        No return value.
+        """
+        if state == QtCore.Qt.Checked:
+            if self.exporter is None:
+                from package.api.exporter import MetricsExporter
+                self.exporter = MetricsExporter()
+            self.exporter.requested_port = self.exporterPortSpinBox.value()
+            try:
+                self.exporter.start()
+            except OSError as error:
+                nuke.message("Unable to serve metrics: {0:s}".format(str(error)))
+                self.exporterCB.setChecked(False)
+                return
+            self.refresh_chart()
+        elif self.exporter is not None:
+            self.exporter.stop()
+        self.exporterPortSpinBox.setEnabled(self.exporter is None or not self.exporter.running)
+
+    def cb_cache_policy(self, state):
+        """Enables or disables the automatic cache clearing.
+        @param (Qt.Checked) state:
+        State of the checkbox.
+        @return (None):
+        No return value.
+        """
+        self.policy.enabled = state == QtCore.Qt.Checked
+
     def cb_max_nuke_ram(self, state):
         """Fit the chart axis Y to the maximum Nuke can allocate on RAM.
         @param (Qt.Checked) state:
@@ -205,17 +623,28 @@ class MainPanel(QtWidgets.QWidget):
         No return value.
         """
         if state == QtCore.Qt.Checked:
-            self.monitor.axis_y.setRange(0, nk_value('max_usage'))
-            self.monitor.set_mccb_area_gradient()
+            self.monitor.set_scale(False)
             self.highestListValueCB.setChecked(False)
 
         else:
-            self.monitor.axis_y.setRange(0, round(max(self.monitor.mem_list), -1) + 50)
-            self.monitor.set_hlcb_area_gradient()
+            self.monitor.set_scale(True)
             self.maximumCacheCB.setChecked(False)
 
+    def capture_sample(self):
+        """Captures a sample and appends it to the trace being recorded, if any. Runs on the sampling thread.
+        @return (MemorySnapshot) snapshot:
+        The captured sample.
+        """
+        snapshot = MemorySnapshot.capture()
+        trace = self.trace
+        if trace is not None:
+            start = PROFILER.start()
+            trace.write(*(snapshot.record() + snapshot.proc_record()))
+            PROFILER.stop("trace", start)
+        return snapshot
+
     def change_loop_time(self, new_time):
-        """Change the time desired for auto updates, and creates a new time worker in line with it.
+        """Change the time desired for auto updates and hand it over to the sampler.
         @param (int) new_time:
         Time entered by the user.
         @return (None):
@@ -223,9 +652,20 @@ class MainPanel(QtWidgets.QWidget):
         """
         num = QtCore.QTime(0, 0, 0).secsTo(new_time)
         self.loop_time = num
-        self.worker = Worker(self.update_chart, (self.loop_time * 1000))
-        self.autoUpdateStart.clicked.connect(self.worker.start)
-        self.autoUpdateStop.clicked.connect(self.worker.stop)
+        # The scheduler pins its interval to the maximum, which must never fall below the minimum.
+        self.scheduler.maximum = max(self.loop_time, self.scheduler.minimum)
+        self.sampler.interval = self.loop_time
+
+    def define_fast_interval(self, value):
+        """Set the shortest interval the adaptive scheduler samples at. The sampler thread reads it on its next sample,
+        so nothing is restarted.
+        @param (float) value:
+        The new interval, in seconds.
+        @return (None):
+        No return value.
+        """
+        self.scheduler.minimum = value
+        self.scheduler.maximum = max(self.loop_time, value)
 
     def define_color(self, target):
         """Opens up a ColorDialog and set the color chosen by the user to a specific target.
@@ -236,25 +676,131 @@ class MainPanel(QtWidgets.QWidget):
         """
         color_name = QtWidgets.QColorDialog.getColor()
         if color_name.isValid():
-            if target == "BG":
-                self.monitor.chart.setBackgroundBrush(QtGui.QBrush(QtGui.QColor(color_name)))
-            elif target == "Grid":
-                self.monitor.axis_x.setGridLineColor(QtGui.QColor(color_name))
-                self.monitor.axis_y.setGridLineColor(QtGui.QColor(color_name))
-                self.monitor.axis_x.setMinorGridLineColor(QtGui.QColor(color_name))
-                self.monitor.axis_y.setMinorGridLineColor(QtGui.QColor(color_name))
-            elif target == "Line":
-                self.monitor.upperSeries.setColor(QtGui.QColor(color_name))
-            elif target == "Points":
-                self.monitor.pointseries.setColor(QtGui.QColor(color_name))
-            elif target == "AxisLabels":
-                self.monitor.axis_x.setLabelsColor(QtGui.QColor(color_name))
-                self.monitor.axis_y.setLabelsColor(QtGui.QColor(color_name))
-            elif target == "AxisTitles":
-                self.monitor.axis_x.setTitleBrush(QtGui.QBrush(QtGui.QColor(color_name)))
-                self.monitor.axis_y.setTitleBrush(QtGui.QBrush(QtGui.QColor(color_name)))
-            else:
-                return None
+            self.monitor.set_color(target, color_name)
+
+    def define_policy_limits(self):
+        """Set the limits of the cache rules from their spin boxes. Release levels keep their distance to the limits.
+        """
+        for rule, spin_box in zip(self.policy.rules, self.policyLimitSpinBoxes):
+            limit = spin_box.value() / 100.0
+            rule.release += limit - rule.limit
+            rule.limit = limit
+
+    def define_metrics(self):
+        """Set the metrics plotted besides the memory used by Nuke, and their axes, from their checkboxes.
+        """
+        self.monitor.set_metrics(dict((name, axis_check_box.isChecked())
+                                      for name, plot_check_box, axis_check_box in self.metricCheckBoxes
+                                      if plot_check_box.isChecked()))
+
+    def define_top_nodes(self, value):
+        """Set the number of top consumers listed in the Nodes tab. Applies from the next sweep.
+        @param (int) value:
+        The new number of nodes.
+        @return (None):
+        No return value.
+        """
+        self.nodeCollector.top_n = value
+
+    def collect_node_memory(self):
+        """Invoked by the node worker. Runs one collection step and refreshes the table when a sweep completes.
+        """
+        if not self.nodeCollector.step():
+            return
+        top = self.nodeCollector.top
+        self.nodesTable.setRowCount(len(top))
+        for row, (value, name) in enumerate(top):
+            self.nodesTable.setItem(row, 0, QtWidgets.QTableWidgetItem(name))
+            self.nodesTable.setItem(row, 1, QtWidgets.QTableWidgetItem("{0:.2f}".format(value)))
+            sparkline = self.nodesTable.cellWidget(row, 2)
+            if sparkline is None:
+                sparkline = Sparkline()
+                self.nodesTable.setCellWidget(row, 2, sparkline)
+            sparkline.set_values(self.nodeCollector.sparklines[name].view())
+
+    def refresh_diagnostics(self):
+        """Lists the profiled stages in the Diagnostics table, by decreasing total time, with the histogram of their
+        durations.
+        """
+        if not self.propertiesBuilt:
+            return
+        histograms = PROFILER.histograms()
+        self.diagnosticsTable.setRowCount(len(histograms))
+        for row, histogram in enumerate(histograms):
+            self.diagnosticsTable.setItem(row, 0, QtWidgets.QTableWidgetItem(histogram.name))
+            self.diagnosticsTable.setItem(row, 1, QtWidgets.QTableWidgetItem(str(histogram.count)))
+            for column, value in ((2, histogram.mean), (3, histogram.percentile(95)), (4, histogram.maximum)):
+                self.diagnosticsTable.setItem(row, column, QtWidgets.QTableWidgetItem("{0:.3f}".format(value * 1000)))
+            sparkline = self.diagnosticsTable.cellWidget(row, 5)
+            if sparkline is None:
+                sparkline = Sparkline()
+                self.diagnosticsTable.setCellWidget(row, 5, sparkline)
+            sparkline.set_values(histogram.counts)
+
+    def reset_diagnostics(self):
+        PROFILER.reset()
+        self.refresh_diagnostics()
+
+    def export_diagnostics(self):
+        """Lets the user pick a file and writes the profiled stages to it as JSON.
+        """
+        path = QtWidgets.QFileDialog.getSaveFileName(self, "Export diagnostics", os.path.dirname(default_trace_path()),
+                                                     "JSON files (*.json)")[0]
+        if not path:
+            return
+        try:
+            PROFILER.export(path)
+        except OSError as error:
+            nuke.message("Unable to export the diagnostics to {0:s}: {1:s}".format(path, str(error)))
+
+    def define_heap_interval(self, value):
+        """Set the time between two Python heap snapshots. Applies from the next snapshot.
+        @param (int) value:
+        The new interval, in seconds.
+        @return (None):
+        No return value.
+        """
+        HEAP.interval = value
+
+    def compare_heap(self):
+        """Starts diffing the Python heap between the last two pinned points. The diff runs in the background and is
+        picked up by the heap worker.
+        """
+        times = self.monitor.pinned_times()
+        if len(times) < 2:
+            self.heapDiffLabel.setText("Pin two points of the chart to compare the Python heap between them.")
+        elif not HEAP.compare(times[-2], times[-1]):
+            self.heapDiffLabel.setText("No heap snapshots apart between these points. Track the Python heap and let "
+                                       "a snapshot interval elapse.")
+        else:
+            self.heapDiffLabel.setText("Comparing...")
+            self.heapWorker.start()
+
+    def collect_heap_diff(self):
+        """Invoked by the heap worker. Lists the growing allocation sites once the diff is over.
+        """
+        diff = HEAP.drain()
+        if diff is None:
+            return
+        self.heapWorker.stop()
+        self.heapDiffLabel.setText("From {0:s} to {1:s}: {2:+.2f}MB".format(
+            format_timestamp(diff.start.timestamp), format_timestamp(diff.end.timestamp), diff.growth))
+        self.heapTable.setRowCount(len(diff.sites))
+        for row, site in enumerate(diff.sites):
+            self.heapTable.setItem(row, 0, QtWidgets.QTableWidgetItem(site[0]))
+            self.heapTable.setItem(row, 1, QtWidgets.QTableWidgetItem("{0:+.3f}".format(site[1])))
+            self.heapTable.setItem(row, 2, QtWidgets.QTableWidgetItem("{0:+d}".format(site[2])))
+            self.heapTable.setItem(row, 3, QtWidgets.QTableWidgetItem("{0:.3f}".format(site[3])))
+
+    def define_leak_threshold(self, value):
+        """Set the growth rate above which the monitor flags a leak.
+        @param (float) value:
+        The new threshold, in MB per minute.
+        @return (None):
+        No return value.
+        """
+        self.monitor.leaks.threshold = value
+        self.refresh_chart()
 
     def define_max_sample(self, value):
         """Set a new max sample for the monitor and readapt the lists and widgets in consequence.
@@ -263,23 +809,151 @@ class MainPanel(QtWidgets.QWidget):
         @return (None):
         No return value.
         """
-        self.monitor.max_sample(value)
-        lmod = ListsModifier(self.monitor.mem_list, self.monitor.dt_list, self.monitor.max_sample)
+        self.monitor.max_sample = value
+        lmod = ListsModifier(self.monitor.samples, self.monitor.max_sample)
         lmod.resize()
-        self.monitor.axis_x.setRange(0, self.monitor.max_sample)
+        self.monitor.max_sample = lmod.max_int
         self.samplesNumSpinBox.setValue(self.monitor.max_sample)
-        self.samplesNumSlider.setSliderPosition(self.monitor.max_samplee)
+        self.samplesNumSlider.setSliderPosition(self.monitor.max_sample)
+
+    def drain_samples(self):
+        """Invoked by the worker on the GUI thread. Moves the samples captured by the sampler thread into the monitor
+        store and redraws the chart once, however many samples arrived since the previous frame.
+        """
+        events = self.events.drain()
+        samples = self.sampler.drain()
+        if not samples:
+            if events:
+                self.monitor.show_events(self.events)
+            return
+        tick = PROFILER.start()
+        lmod = ListsModifier(self.monitor.samples, self.monitor.max_sample)
+        lmod.extend(samples)
+        start = PROFILER.start()
+        for snapshot in samples:
+            self.policy.evaluate(snapshot)
+        PROFILER.stop("policy", start)
+        self.refresh_chart()
+        PROFILER.stop("tick", tick)
+
+    def replay_trace(self):
+        """Lets the user pick a recorded trace and displays it in the monitor.
+        """
+        path = QtWidgets.QFileDialog.getOpenFileName(self, "Replay a trace", os.path.dirname(default_trace_path()),
+                                                     "Memory traces (*{0:s})".format(EXTENSION))[0]
+        if not path:
+            return
+        try:
+            reader = TraceReader(path)
+        except (OSError, ValueError) as error:
+            nuke.message("Unable to replay {0:s}: {1:s}".format(path, str(error)))
+            return
+        self.monitor.replay(reader)
+        self.refresh_chart()
+
+    def stop_replay(self):
+        self.monitor.stop_replay()
+        self.refresh_chart()
+
+    def closeEvent(self, event):
+        """Tears the panel down: unregisters its Nuke callbacks, stops its threads and timers, and closes its trace and
+        events files, so that closing and opening the panel again leaves nothing of the closed one running.
+        @param (QCloseEvent) event:
+        The close event.
+        @return (None):
+        No return value.
+        """
+        self.events.uninstall()
+        self.sampler.stop()
+        for worker in (self.worker, self.nodeWorker, self.heapWorker, self.diagnosticsWorker):
+            worker.stop()
+        if self.exporter is not None:
+            self.exporter.stop()
+        self.cb_record_trace(QtCore.Qt.Unchecked)
+        QtWidgets.QWidget.closeEvent(self, event)
+
+    def start_auto_update(self):
+        self.sampler.start()
+        self.worker.start()
+
+    def stop_auto_update(self):
+        self.sampler.stop()
+        self.worker.stop()
+        self.drain_samples()
+
+    def tab_changed(self, index):
+        """Builds the Properties tab when first opened, and only collects per-node memory or refreshes the diagnostics
+        while their tab is shown.
+        @param (int) index:
+        The index of the tab now shown.
+        @return (None):
+        No return value.
+        """
+        if self.tabBar.widget(index) is self.propertiesTab:
+            self.build_properties()
+            if PROFILER.enabled:
+                self.refresh_diagnostics()
+                self.diagnosticsWorker.start()
+        else:
+            self.diagnosticsWorker.stop()
+        if self.tabBar.widget(index) is self.nodesTab:
+            self.nodeWorker.start()
+        else:
+            self.nodeWorker.stop()
+
+    def use_memory_source(self, spec, speed):
+        """Drives the monitor from a recorded trace or a synthetic curve instead of Nuke, to stress test it with hours
+        of memory history played in minutes.
+        @param (str) spec:
+        The name of a synthetic curve (ramp, sawtooth or bursts) or the path of a trace. Nothing is changed if empty.
+        @param (float) speed:
+        The acceleration, in seconds of curve per real second.
+        @return (None):
+        No return value.
+        """
+        if not spec:
+            return
+        try:
+            set_memory_source(source_from_spec(spec, speed))
+        except (OSError, ValueError) as error:
+            nuke.message("Unable to use the memory source {0:s}: {1:s}".format(spec, str(error)))
 
     def update_chart(self):
-        """Updates monitor lists and the chart series.
-        """
-        lmod = ListsModifier(self.monitor.mem_list, self.monitor.dt_list, self.monitor.max_sample)
-        lmod.update()
-        if self.highestListValueCB.isChecked():
-            self.monitor.axis_y.setRange(0, round(max(self.monitor.mem_list), -1) + 50)
-        self.monitor.upperSeries.clear()
-        self.monitor.pointseries.clear()
+        """Samples memory right away and updates the chart series.
+        """
+        tick = PROFILER.start()
+        lmod = ListsModifier(self.monitor.samples, self.monitor.max_sample)
+        snapshot = self.capture_sample()
+        lmod.extend([snapshot])
+        start = PROFILER.start()
+        self.policy.evaluate(snapshot)
+        PROFILER.stop("policy", start)
+        self.refresh_chart()
+        PROFILER.stop("tick", tick)
+
+    def refresh_chart(self):
+        """Updates the chart series from the monitor store, or from the trace being replayed. Until the chart is built,
+        only the statistics are updated.
+        """
+        start = PROFILER.start()
+        summary = self.monitor.stats.summary()
+        self.statsStrip.set_summary(summary)
+        if self.exporter is not None:
+            self.exporter.publish(latest_snapshot(), summary, self.monitor.samples.total)
+        PROFILER.stop("stats", start)
+        if not self.monitor.built:
+            return
+        start = PROFILER.start()
+        self.monitor.rescale()
+        PROFILER.stop("rescale", start)
         self.monitor.append_series()
+        start = PROFILER.start()
+        self.monitor.show_policy_actions(self.policy.log)
+        self.monitor.show_events(self.events)
+        PROFILER.stop("markers", start)
+        start = PROFILER.start()
+        self.monitor.show_forecast()
+        PROFILER.stop("forecast", start)
         self.monitor.update()
 
 